@@ -0,0 +1,433 @@
+import hashlib
+import html
+import random
+import re
+from array import array
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from .records import SEVERITY_RANK, ExceptionRecord, normalize_severity, to_epoch
+
+# 依序套用的遮罩規則：先處理時間與長識別碼，最後才是一般數字
+_MASK_RULES = [
+    (
+        re.compile(
+            r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?"
+        ),
+        "<TIME>",
+    ),
+    (re.compile(r"\d{4}-\d{2}-\d{2}|\d{2}:\d{2}:\d{2}(?:\.\d+)?"), "<TIME>"),
+    (
+        re.compile(
+            r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"
+        ),
+        "<UUID>",
+    ),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b"), "<HEX>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<N>"),
+    (re.compile(r"\s+"), " "),
+]
+
+# 每個指紋保留的樣本訊息與追蹤的不重複使用者/群組上限
+MAX_SAMPLES = 3
+MAX_TRACKED_IDS = 100
+
+OVERFLOW_POLICIES = ("aggregate", "drop_oldest", "sample")
+OVERFLOW_FINGERPRINT = "overflow"
+OVERFLOW_KEYWORD = "其他（緩衝區已滿）"
+
+
+def normalize_message(message: str) -> str:
+    """遮罩訊息中的 ID、數字與時間戳，使同類錯誤得到相同的文字"""
+    normalized = message or ""
+    for pattern, replacement in _MASK_RULES:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized.strip()
+
+
+def aggregate_key(fingerprint: str, route: Tuple[str, ...] = ()) -> Hashable:
+    """批次緩衝區中匯總的鍵：預設路由只用指紋，其他路由的同一指紋各自匯總"""
+    return (route, fingerprint) if route else fingerprint
+
+
+def compute_fingerprint(keyword: str, message: str) -> str:
+    """以關鍵字與正規化後的訊息計算錯誤指紋"""
+    digest = hashlib.sha1(
+        f"{keyword}\0{normalize_message(message)}".encode("utf-8", "replace")
+    )
+    return digest.hexdigest()[:16]
+
+
+class SeqRanges:
+    """持久化日誌序號的集合，以 [起, 迄] 區間保存在 array 中。
+
+    同一指紋的連續報告序號多半相鄰，只需延長最後一個區間；最壞情況每筆報告佔 16 位元組。
+    """
+
+    __slots__ = ("_runs", "count")
+
+    def __init__(self):
+        self._runs = array("q")  # 起, 迄, 起, 迄, ...
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, seq: int):
+        if self._runs and self._runs[-1] + 1 == seq:
+            self._runs[-1] = seq
+        else:
+            self._runs.extend((seq, seq))
+        self.count += 1
+
+    def update(self, other: "SeqRanges"):
+        self._runs.extend(other._runs)
+        self.count += other.count
+
+    def ranges(self) -> List[Tuple[int, int]]:
+        """排序並合併相鄰的區間"""
+        merged: List[List[int]] = []
+        for first, last in sorted(zip(self._runs[0::2], self._runs[1::2])):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        return [(first, last) for first, last in merged]
+
+
+class ErrorAggregate:
+    """同一指紋下所有異常的匯總資訊"""
+
+    __slots__ = (
+        "fingerprint",
+        "keyword",
+        "keyword_html",
+        "platforms",
+        "count",
+        "first_seen",
+        "last_seen",
+        "severity",
+        "senders",
+        "groups",
+        "samples",
+        "route",
+        "seqs",
+    )
+
+    def __init__(self, fingerprint: str, keyword: str, route: Tuple[str, ...] = ()):
+        self.fingerprint = fingerprint
+        self.keyword = keyword
+        self.route = route  # 收件人路由，見 routing.RoutingTable
+        self.keyword_html = html.escape(str(keyword))
+        self.platforms: Set[str] = set()
+        self.count = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.severity = "debug"  # 出現過的最高嚴重程度
+        self.senders: Set[str] = set()
+        self.groups: Set[str] = set()
+        self.samples: List[ExceptionRecord] = []
+        # 併入的報告在本實例持久化日誌中的序號，送出後據此確認
+        self.seqs = SeqRanges()
+
+    @property
+    def key(self) -> Hashable:
+        return aggregate_key(self.fingerprint, self.route)
+
+    def add(self, record: ExceptionRecord):
+        """將一筆異常併入匯總"""
+        self.count += 1
+        if record.spool_seq is not None:
+            self.seqs.add(record.spool_seq)
+        if self.first_seen is None or record.timestamp < self.first_seen:
+            self.first_seen = record.timestamp
+        if self.last_seen is None or record.timestamp > self.last_seen:
+            self.last_seen = record.timestamp
+        if SEVERITY_RANK[record.severity] > SEVERITY_RANK[self.severity]:
+            self.severity = record.severity
+
+        self.platforms.add(str(record.platform))
+        if len(self.senders) < MAX_TRACKED_IDS:
+            self.senders.add(str(record.sender_id))
+        if record.is_group and len(self.groups) < MAX_TRACKED_IDS:
+            self.groups.add(str(record.group_id))
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(record)
+        elif record.payload is not None:
+            # 優先呈現保留了完整訊息的樣本（見 capture.CapturePolicy）
+            for i, sample in enumerate(self.samples):
+                if sample.payload is None:
+                    self.samples[i] = record
+                    break
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "keyword": self.keyword,
+            "count": self.count,
+            "platforms": sorted(self.platforms),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "severity": self.severity,
+            "senders": len(self.senders),
+            "groups": len(self.groups),
+            "samples": [sample.to_dict() for sample in self.samples],
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        """完整序列化（含使用者/群組集合），供轉交給其他實例合併"""
+        return {
+            **self.to_dict(),
+            "senders": sorted(self.senders),
+            "groups": sorted(self.groups),
+            "route": list(self.route),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "ErrorAggregate":
+        aggregate = cls(
+            state["fingerprint"], state["keyword"], tuple(state.get("route") or ())
+        )
+        aggregate.count = state.get("count", 0)
+        aggregate.first_seen = to_epoch(state.get("first_seen"))
+        aggregate.last_seen = to_epoch(state.get("last_seen"))
+        aggregate.severity = normalize_severity(state.get("severity"))
+        aggregate.platforms = set(state.get("platforms", ()))
+        aggregate.senders = set(state.get("senders", ()))
+        aggregate.groups = set(state.get("groups", ()))
+        for data in state.get("samples", ()):
+            sample = ExceptionRecord.from_dict(data)
+            sample.escape()
+            aggregate.samples.append(sample)
+        return aggregate
+
+    def merge(self, other: "ErrorAggregate"):
+        """合併另一個同指紋的匯總（例如延後發送的批次）"""
+        self.count += other.count
+        self.seqs.update(other.seqs)
+        if self.first_seen is None or (
+            other.first_seen is not None and other.first_seen < self.first_seen
+        ):
+            self.first_seen = other.first_seen
+        if self.last_seen is None or (
+            other.last_seen is not None and other.last_seen > self.last_seen
+        ):
+            self.last_seen = other.last_seen
+        if SEVERITY_RANK[other.severity] > SEVERITY_RANK[self.severity]:
+            self.severity = other.severity
+        self.platforms |= other.platforms
+        self.senders |= set(list(other.senders)[: MAX_TRACKED_IDS - len(self.senders)])
+        self.groups |= set(list(other.groups)[: MAX_TRACKED_IDS - len(self.groups)])
+        self.samples.extend(other.samples[: MAX_SAMPLES - len(self.samples)])
+
+
+class BatchBuffer:
+    """以指紋索引的批次緩衝區，限制不重複錯誤的數量並記錄對應的日誌序號。
+
+    緩衝區已滿且出現新的指紋時，依 ``overflow_policy`` 處理：
+
+    - ``aggregate``：併入一個「其他」匯總，保留計數但不再區分指紋
+    - ``drop_oldest``：捨棄最早出現的指紋
+    - ``sample``：對指紋做水塘抽樣，以 容量/已見指紋數 的機率取代隨機一個既有指紋
+
+    ``by_route`` 啟用時，同一指紋在不同收件人路由下各自匯總，發送時以 partition() 分開；
+    「其他」匯總不區分路由，寄給預設收件人。
+
+    每個匯總各自記錄併入報告的日誌序號，分區或拆分後仍能只確認實際送出的報告；
+    被溢出策略捨棄的報告序號保存在 ``dropped_seqs``，隨捨棄數一起在批次送出時確認。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 0,
+        overflow_policy: str = "aggregate",
+        rng: Callable[[], float] = random.random,
+        by_route: bool = False,
+    ):
+        self.max_entries = max(0, int(max_entries))  # 0 表示不限制
+        if overflow_policy not in OVERFLOW_POLICIES:
+            overflow_policy = "aggregate"
+        self.overflow_policy = overflow_policy
+        self._rng = rng
+        self.by_route = by_route
+        self.aggregates: Dict[Hashable, ErrorAggregate] = {}
+        self.dropped = 0
+        self._fingerprints_seen = 0
+        # sample 策略的抽樣位置（與 aggregates 的鍵一一對應），緩衝區滿時才建立
+        self._slots: Optional[List[Hashable]] = None
+        self.dropped_seqs = SeqRanges()
+
+    def __len__(self) -> int:
+        return len(self.aggregates)
+
+    def __bool__(self) -> bool:
+        return bool(self.aggregates) or bool(self.dropped_seqs)
+
+    def reconfigure(self, max_entries: int, overflow_policy: str):
+        """調整容量與溢出策略；縮小時既有的匯總保留，之後新的指紋依新策略處理"""
+        self.max_entries = max(0, int(max_entries))
+        if overflow_policy not in OVERFLOW_POLICIES:
+            overflow_policy = "aggregate"
+        self.overflow_policy = overflow_policy
+        self._slots = None
+
+    @property
+    def total(self) -> int:
+        return sum(aggregate.count for aggregate in self.aggregates.values())
+
+    def values(self) -> List[ErrorAggregate]:
+        return list(self.aggregates.values())
+
+    @property
+    def keywords(self) -> Set[str]:
+        return {aggregate.keyword for aggregate in self.aggregates.values()}
+
+    def seqs(self) -> SeqRanges:
+        """緩衝區中所有報告（含被捨棄的）的日誌序號"""
+        seqs = SeqRanges()
+        for aggregate in self.aggregates.values():
+            seqs.update(aggregate.seqs)
+        seqs.update(self.dropped_seqs)
+        return seqs
+
+    def add(self, record: ExceptionRecord):
+        """將一筆異常依指紋併入緩衝區"""
+        fingerprint = record.fingerprint or compute_fingerprint(
+            record.keyword, record.message
+        )
+        route = record.route if self.by_route else ()
+        aggregate = self.aggregates.get(aggregate_key(fingerprint, route))
+        if aggregate is None:
+            aggregate = self._admit(ErrorAggregate(fingerprint, record.keyword, route))
+            if aggregate is None:
+                self.dropped += 1
+                if record.spool_seq is not None:
+                    self.dropped_seqs.add(record.spool_seq)
+                return
+        aggregate.add(record)
+
+    def merge(self, other: "BatchBuffer"):
+        """合併另一個緩衝區（例如延後發送的批次）"""
+        for incoming in other.aggregates.values():
+            aggregate = self.aggregates.get(incoming.key)
+            if aggregate is not None:
+                aggregate.merge(incoming)
+            elif self._admit(incoming) is None:
+                self._discard(incoming)
+        self.dropped += other.dropped
+        self.dropped_seqs.update(other.dropped_seqs)
+
+    def to_state(self) -> Dict[str, Any]:
+        """序列化匯總與捨棄數（不含日誌序號，序號只對本實例的持久化日誌有意義）"""
+        return {
+            "aggregates": [
+                aggregate.to_state() for aggregate in self.aggregates.values()
+            ],
+            "dropped": self.dropped,
+        }
+
+    def merge_state(
+        self, state: Dict[str, Any], next_seq: Callable[[], int] = None
+    ) -> int:
+        """合併由 to_state 序列化的緩衝區。
+
+        提供 next_seq 時，為每個轉交來的匯總（以及捨棄數）各分配一個序號；
+        這些序號與日誌序號一樣隨匯總分區、延後與捨棄，送出時據此確認。返回分配的序號數。
+        """
+        incoming = BatchBuffer()
+        assigned = 0
+        for data in state.get("aggregates", ()):
+            aggregate = ErrorAggregate.from_state(data)
+            if next_seq:
+                aggregate.seqs.add(next_seq())
+                assigned += 1
+            existing = incoming.aggregates.get(aggregate.key)
+            if existing is not None:
+                existing.merge(aggregate)
+            else:
+                incoming.aggregates[aggregate.key] = aggregate
+        incoming.dropped = state.get("dropped", 0)
+        if next_seq and incoming.dropped:
+            incoming.dropped_seqs.add(next_seq())
+            assigned += 1
+        self.merge(incoming)
+        return assigned
+
+    def split(self, keywords: Set[str]) -> "BatchBuffer":
+        """移出關鍵字不在 keywords 中的匯總，並以新的緩衝區返回。
+
+        被移出的匯總帶著各自的日誌序號，在它們送出之前不會被確認。
+        """
+        held = self._empty()
+        for key, aggregate in list(self.aggregates.items()):
+            if aggregate.keyword not in keywords:
+                held.aggregates[key] = self.aggregates.pop(key)
+        if held.aggregates:
+            # 抽樣位置只在 _admit 中維護，其他地方移除匯總後必須重建
+            self._slots = None
+        return held
+
+    def partition(self) -> Dict[Tuple[str, ...], "BatchBuffer"]:
+        """依收件人路由把匯總分成多個緩衝區（每個路由一封郵件）。
+
+        每個分區只帶有自己匯總的日誌序號，可以在該分區送出後單獨確認；
+        捨棄數與其序號計入預設路由的分區（不存在時計入第一個分區）。
+        """
+        partitions: Dict[Tuple[str, ...], BatchBuffer] = {}
+        for key, aggregate in self.aggregates.items():
+            partition = partitions.get(aggregate.route)
+            if partition is None:
+                partition = partitions[aggregate.route] = self._empty()
+            partition.aggregates[key] = aggregate
+        if (self.dropped or self.dropped_seqs) and partitions:
+            target = partitions.get((), next(iter(partitions.values())))
+            target.dropped += self.dropped
+            target.dropped_seqs.update(self.dropped_seqs)
+        return partitions
+
+    def _empty(self) -> "BatchBuffer":
+        return BatchBuffer(
+            self.max_entries, self.overflow_policy, self._rng, self.by_route
+        )
+
+    def _admit(self, aggregate: ErrorAggregate) -> Optional[ErrorAggregate]:
+        """為新的指紋騰出空間；返回實際用於累計的匯總，若被捨棄則返回 None"""
+        self._fingerprints_seen += 1
+        if not self.max_entries or len(self.aggregates) < self.max_entries:
+            self.aggregates[aggregate.key] = aggregate
+            return aggregate
+
+        if self.overflow_policy == "drop_oldest":
+            oldest = next(iter(self.aggregates))
+            self._discard(self.aggregates.pop(oldest))
+        elif self.overflow_policy == "sample":
+            if self._rng() >= self.max_entries / self._fingerprints_seen:
+                return None
+            slots = self._sample_slots()
+            i = int(self._rng() * len(slots))
+            self._discard(self.aggregates.pop(slots[i]))
+            # 新的指紋直接取代被擠出的位置，每次抽樣都是 O(1)
+            slots[i] = aggregate.key
+        else:
+            overflow = self.aggregates.get(OVERFLOW_FINGERPRINT)
+            if overflow is None:
+                # 騰出一個位置給「其他」匯總，並把被擠出的指紋一併併入
+                oldest = next(iter(self.aggregates))
+                overflow = ErrorAggregate(OVERFLOW_FINGERPRINT, OVERFLOW_KEYWORD)
+                overflow.merge(self.aggregates.pop(oldest))
+                self.aggregates[OVERFLOW_FINGERPRINT] = overflow
+            if aggregate.count:
+                overflow.merge(aggregate)
+            return overflow
+
+        self.aggregates[aggregate.key] = aggregate
+        return aggregate
+
+    def _sample_slots(self) -> List[Hashable]:
+        slots = self._slots
+        if slots is None or len(slots) != len(self.aggregates):
+            slots = self._slots = list(self.aggregates)
+        return slots
+
+    def _discard(self, aggregate: ErrorAggregate):
+        self.dropped += aggregate.count
+        self.dropped_seqs.update(aggregate.seqs)
@@ -0,0 +1,226 @@
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .records import ExceptionRecord
+from .scheduler import Clock
+
+
+class SpaceSaving:
+    """Space-Saving 演算法的 Top-K 計數器，最多追蹤 ``capacity`` 個鍵。
+
+    未追蹤的新鍵會取代目前計數最小的鍵並繼承其計數（記為誤差上限），
+    因此任何出現次數超過 總數 / capacity 的鍵都保證在表中，且記憶體佔用固定。
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "total")
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = max(1, int(capacity))
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def add(self, key: str, n: int = 1):
+        self.total += n
+        if key in self.counts:
+            self.counts[key] += n
+            return
+        floor = 0
+        if len(self.counts) >= self.capacity:
+            # 取代計數最小的鍵；capacity 很小，線性掃描比維護堆積更簡單且足夠快
+            victim = min(self.counts, key=self.counts.__getitem__)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+        self.counts[key] = floor + n
+        self.errors[key] = floor
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """返回計數最高的 n 個鍵：(鍵, 估計次數, 誤差上限)"""
+        keys = sorted(self.counts, key=self.counts.__getitem__, reverse=True)[:n]
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+
+class RecentTopK:
+    """只統計最近一段時間的 Top-K：以兩個輪替的 SpaceSaving 涵蓋最近 1～2 個 ``period``"""
+
+    def __init__(self, capacity: int = 64, period: float = 600, clock: Clock = None):
+        self.capacity = capacity
+        self.period = max(1.0, float(period))
+        self.clock = clock or time.monotonic
+        self._current = SpaceSaving(capacity)
+        self._previous = SpaceSaving(capacity)
+        self._started = self.clock()
+
+    def _rotate(self):
+        elapsed = self.clock() - self._started
+        if elapsed < self.period:
+            return
+        # 超過兩個週期沒有資料時，上一週期的統計也已過期
+        self._previous = (
+            self._current if elapsed < 2 * self.period else SpaceSaving(self.capacity)
+        )
+        self._current = SpaceSaving(self.capacity)
+        self._started = self.clock()
+
+    def add(self, key: str):
+        self._rotate()
+        self._current.add(key)
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        self._rotate()
+        counts: Dict[str, int] = dict(self._previous.counts)
+        errors: Dict[str, int] = dict(self._previous.errors)
+        for key, count in self._current.counts.items():
+            counts[key] = counts.get(key, 0) + count
+            errors[key] = errors.get(key, 0) + self._current.errors[key]
+        keys = sorted(counts, key=counts.__getitem__, reverse=True)[:n]
+        return [(key, counts[key], errors[key]) for key in keys]
+
+
+class SpikeDetector:
+    """以每分鐘錯誤數的 EWMA 平均值與變異數偵測突增。
+
+    目前這一分鐘的計數超過 平均值 + z_threshold × 標準差，且不少於 ``min_count`` 時視為突增，
+    每分鐘最多觸發一次。標準差下限取 sqrt(平均值)（泊松雜訊）與 1，
+    避免在基線平穩或尚無基線時對少量錯誤過度敏感。
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        z_threshold: float = 4.0,
+        min_count: int = 20,
+        history_minutes: int = 60,
+        clock: Clock = None,
+    ):
+        self.alpha = min(1.0, max(1e-3, float(alpha)))
+        self.z_threshold = max(0.0, float(z_threshold))
+        self.min_count = max(1, int(min_count))
+        self.clock = clock or time.monotonic
+        self.mean = 0.0
+        self.variance = 0.0
+        self.current = 0
+        # 最近完成的每分鐘計數（由舊到新）
+        self.series: Deque[int] = deque(maxlen=max(1, int(history_minutes)))
+        self._minute = self._now_minute()
+        self._alerted_minute: Optional[int] = None
+
+    def _now_minute(self) -> int:
+        return int(self.clock() // 60)
+
+    def _roll(self):
+        minute = self._now_minute()
+        if minute <= self._minute:
+            return
+        # 以本分鐘的計數更新基線，空白的分鐘以 0 計入；長時間空白只需有限次數即收斂
+        gap = min(minute - self._minute, self.series.maxlen)
+        for i in range(gap):
+            self._update(self.current if i == 0 else 0)
+        self.current = 0
+        self._minute = minute
+
+    def _update(self, count: int):
+        diff = count - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.series.append(count)
+
+    @property
+    def stddev(self) -> float:
+        return max(math.sqrt(self.variance), math.sqrt(self.mean), 1.0)
+
+    def z_score(self) -> float:
+        self._roll()
+        return (self.current - self.mean) / self.stddev
+
+    def observe(self, n: int = 1) -> Optional[float]:
+        """記錄 n 個事件；本分鐘首次判定為突增時返回 z 分數，否則返回 None"""
+        self._roll()
+        self.current += n
+        if self.current < self.min_count or self._alerted_minute == self._minute:
+            return None
+        z = (self.current - self.mean) / self.stddev
+        if z < self.z_threshold:
+            return None
+        self._alerted_minute = self._minute
+        return z
+
+
+class ErrorAnalytics:
+    """錯誤流的串流統計：使用者、群組與關鍵字的 Top-K，以及每分鐘速率的突增偵測。
+
+    所有結構的大小都是固定的，不受不重複使用者/群組數量影響。
+    偵測到突增且距離上次風暴警報已超過 ``storm_cooldown`` 秒時，``observe`` 返回一份快照。
+    """
+
+    def __init__(
+        self,
+        capacity: int = 64,
+        period: float = 600,
+        z_threshold: float = 4.0,
+        min_per_minute: int = 20,
+        storm_cooldown: float = 1800,
+        clock: Clock = None,
+    ):
+        self.clock = clock or time.monotonic
+        self.senders = RecentTopK(capacity, period, self.clock)
+        self.groups = RecentTopK(capacity, period, self.clock)
+        self.keywords = RecentTopK(capacity, period, self.clock)
+        self.spikes = SpikeDetector(
+            z_threshold=z_threshold, min_count=min_per_minute, clock=self.clock
+        )
+        self.storm_cooldown = max(0.0, float(storm_cooldown))
+        self.period = self.senders.period
+        self._last_storm: Optional[float] = None
+
+        # 統計資訊
+        self.storms = 0
+        self.suppressed_storms = 0
+
+    def observe(self, record: ExceptionRecord) -> Optional[Dict[str, Any]]:
+        self.senders.add(f"{record.sender} ({record.sender_id})")
+        if record.is_group:
+            self.groups.add(str(record.group_id))
+        self.keywords.add(str(record.keyword))
+
+        z = self.spikes.observe()
+        if z is None:
+            return None
+        now = self.clock()
+        if (
+            self._last_storm is not None
+            and now - self._last_storm < self.storm_cooldown
+        ):
+            self.suppressed_storms += 1
+            return None
+        self._last_storm = now
+        self.storms += 1
+        return self.snapshot(z=z)
+
+    @property
+    def in_storm(self) -> bool:
+        return (
+            self._last_storm is not None
+            and self.clock() - self._last_storm < self.storm_cooldown
+        )
+
+    def snapshot(self, n: int = 5, z: float = None) -> Dict[str, Any]:
+        """目前統計的快照；在事件迴圈上取得後即可安全地交給執行緒池渲染"""
+        spikes = self.spikes
+        return {
+            "current_per_minute": spikes.current,
+            "baseline_per_minute": spikes.mean,
+            "stddev": spikes.stddev,
+            "z_score": spikes.z_score() if z is None else z,
+            "recent_minutes": list(spikes.series)[-10:],
+            "period_minutes": self.period / 60,
+            "senders": self.senders.top(n),
+            "groups": self.groups.top(n),
+            "keywords": self.keywords.top(n),
+        }
@@ -0,0 +1,15 @@
+"""讓基準測試腳本能以套件方式匯入插件模組（插件內部使用相對匯入）"""
+
+import importlib
+import sys
+from pathlib import Path
+
+PLUGIN_ROOT = Path(__file__).resolve().parents[1]
+
+if str(PLUGIN_ROOT.parent) not in sys.path:
+    sys.path.insert(0, str(PLUGIN_ROOT.parent))
+
+
+def load(module: str):
+    """匯入插件中的子模組，例如 load("templates")"""
+    return importlib.import_module(f"{PLUGIN_ROOT.name}.{module}")
@@ -0,0 +1,99 @@
+"""異常歷史資料庫的查詢基準測試。
+
+寫入 N 筆（預設 100 萬筆）分佈於 30 天內的異常記錄，然後測量
+exception_search 常見查詢的耗時，驗證在大量資料下仍能在毫秒級返回。
+
+    python benchmarks/bench_history.py [rows]
+"""
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _plugin import load
+
+history = load("history")
+
+PLATFORMS = ("aiocqhttp", "telegram", "discord", "wechat")
+KEYWORDS = [f"Keyword{i}" for i in range(200)]
+DAY = 86400
+BATCH = 50_000
+
+
+def populate(store, rows: int, now: float):
+    rng = random.Random(42)
+    for start in range(0, rows, BATCH):
+        batch = []
+        for i in range(start, min(rows, start + BATCH)):
+            ts = now - rng.random() * 30 * DAY
+            batch.append(
+                (
+                    ts,
+                    rng.choice(PLATFORMS),
+                    f"user{i % 5000}",
+                    str(100000 + i % 5000),
+                    str(i % 300) if i % 3 else "",
+                    rng.choice(KEYWORDS),
+                    f"{rng.randrange(2000):016x}",
+                    f"Error {i}: something failed",
+                )
+            )
+        store._insert(batch)
+    store._conn.execute("PRAGMA optimize")
+
+
+async def main() -> int:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    now = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = history.HistoryStore(Path(tmp) / "history.db")
+        await store.open()
+
+        start = time.perf_counter()
+        await store._run(populate, store, rows, now)
+        print(f"寫入 {rows} 筆：{time.perf_counter() - start:.1f} 秒")
+
+        queries = {
+            "最新一頁": {},
+            "platform + since=1h": {
+                "filters": {"platform": "telegram"},
+                "since": now - 3600,
+            },
+            "keyword": {"filters": {"keyword": "Keyword7"}},
+            "sender + since=7d": {
+                "filters": {"sender": "100042"},
+                "since": now - 7 * DAY,
+            },
+            "fingerprint": {"filters": {"fingerprint": f"{123:016x}"}},
+            "platform + keyword": {
+                "filters": {"platform": "discord", "keyword": "Keyword3"}
+            },
+        }
+        # 以游標翻到第 50 頁，量測深層翻頁的耗時
+        before = None
+        for _ in range(49):
+            found, _ = await store.search(
+                filters={"keyword": "Keyword7"}, before=before
+            )
+            before = (found[-1]["ts"], found[-1]["id"])
+        queries["keyword 第 50 頁"] = {
+            "filters": {"keyword": "Keyword7"},
+            "before": before,
+        }
+        print(f"{'查詢':<24} {'ms':>8} {'筆數':>6}")
+        for name, query in queries.items():
+            best = float("inf")
+            for _ in range(5):
+                started = time.perf_counter()
+                found, _ = await store.search(**query)
+                best = min(best, time.perf_counter() - started)
+            print(f"{name:<24} {best * 1000:>8.2f} {len(found):>6}")
+        await store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
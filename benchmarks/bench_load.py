@@ -0,0 +1,224 @@
+"""端到端負載測試：consume_reported_error → ExceptionProcessor → EmailService。
+
+以模擬的 AstrMessageEvent 按指定速率（預設 1k、10k、100k 則/秒）呼叫插件的事件鉤子，
+郵件送往本機的 aiosmtpd 假伺服器（可注入延遲與失敗），每個情境結束後報告：
+
+- 實際送入速率、處理吞吐量與被捨棄的報告數
+- 鉤子延遲的 p50 / p99
+- tracemalloc 記錄的峰值記憶體（會拖慢執行，可用 --no-memory 關閉）
+- 假伺服器收到的郵件數與投遞重試次數
+
+需要在可匯入 AstrBot 的環境中執行，並另外安裝 aiosmtpd：
+
+    pip install aiosmtpd
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --rates 5000 --duration 10 --latency 0.2 --fail-rate 0.1
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from _plugin import load
+
+plugin_main = load("main")
+
+PLATFORMS = ("aiocqhttp", "telegram", "discord")
+KEYWORDS = [f"Keyword{i}" for i in range(20)]
+SENDERS = 1000
+GROUPS = 50
+TICK = 0.01
+
+
+class BenchEvent:
+    """只實作插件會讀取的 AstrMessageEvent 方法"""
+
+    __slots__ = ("reported_error", "_i")
+
+    def __init__(self, i: int, keyword: str):
+        self._i = i
+        self.reported_error = keyword
+
+    def get_platform_name(self):
+        return PLATFORMS[self._i % len(PLATFORMS)]
+
+    def get_sender_name(self):
+        return f"user{self._i % SENDERS}"
+
+    def get_sender_id(self):
+        return str(100000 + self._i % SENDERS)
+
+    def get_group_id(self):
+        return str(self._i % GROUPS) if self._i % 3 else ""
+
+    def get_message_str(self):
+        return f"request {self._i} failed: timeout after {self._i % 97} ms"
+
+
+class FakeSMTPHandler:
+    """aiosmtpd 處理器：可注入 DATA 延遲、暫時性（451）與永久性（554）失敗"""
+
+    def __init__(self, latency: float, fail_rate: float, permanent_rate: float):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.permanent_rate = permanent_rate
+        self.rng = random.Random(7)
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.bytes = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        roll = self.rng.random()
+        with self.lock:
+            if roll < self.permanent_rate:
+                self.rejected += 1
+                return "554 5.0.0 injected permanent failure"
+            if roll < self.permanent_rate + self.fail_rate:
+                self.rejected += 1
+                return "451 4.3.0 injected transient failure"
+            self.accepted += 1
+            self.bytes += len(envelope.content)
+        return "250 OK"
+
+
+def _accept_any(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def bench_config(port: int) -> dict:
+    return {
+        "general": {"ingest_queue_size": 10_000},
+        "smtp_settings": {
+            "smtp_server": "127.0.0.1",
+            "smtp_port": port,
+            "smtp_username": "bench",
+            "smtp_password": "bench",
+            "enable_ssl": False,
+            "retry_base_delay": 0.05,
+            "retry_max_delay": 0.5,
+        },
+        "notification_filtering": {"recipient_emails": ["admin@example.com"]},
+        "rate_limit_batching": {
+            "max_emails_per_hour": 1000,
+            "batch_window_seconds": 1,
+            "min_batch_window_seconds": 0.5,
+        },
+    }
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_scenario(rate: int, duration: float, port: int, handler, memory: bool):
+    data_dir = Path(tempfile.mkdtemp(prefix="error_monitor_bench_"))
+    # 插件在 initialize 中透過 StarTools 取得資料目錄，這裡改為臨時目錄
+    plugin_main.StarTools = type(
+        "BenchStarTools", (), {"get_data_dir": staticmethod(lambda: data_dir)}
+    )
+    accepted_before = handler.accepted
+
+    if memory:
+        tracemalloc.start()
+    plugin = plugin_main.ExceptionMonitorPlugin(object(), bench_config(port))
+    await plugin.initialize()
+
+    latencies = []
+    per_tick = max(1, int(rate * TICK))
+    sent = 0
+    started = time.perf_counter()
+    next_tick = started
+    while time.perf_counter() - started < duration:
+        for _ in range(per_tick):
+            event = BenchEvent(sent, KEYWORDS[sent % len(KEYWORDS)])
+            t0 = time.perf_counter()
+            await plugin.consume_reported_error(event)
+            latencies.append(time.perf_counter() - t0)
+            sent += 1
+        next_tick += TICK
+        # 落後於目標速率時只讓出一次事件迴圈，讓 worker 有機會處理
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+    offered_seconds = time.perf_counter() - started
+
+    queue = plugin.ingest_queue
+    delivery = plugin.email_service.delivery
+    await queue.drain()
+    await plugin.terminate()
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "rate": rate,
+        "offered": sent / offered_seconds,
+        "processed": queue.processed,
+        "dropped": queue.dropped,
+        "throughput": queue.processed / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "peak": peak,
+        "emails": handler.accepted - accepted_before,
+        "retries": delivery.retried,
+    }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", default="1000,10000,100000")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="DATA 延遲（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="451 失敗比例")
+    parser.add_argument("--permanent-rate", type=float, default=0.0, help="554 比例")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--no-memory", action="store_true")
+    args = parser.parse_args()
+
+    handler = FakeSMTPHandler(args.latency, args.fail_rate, args.permanent_rate)
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=args.port,
+        authenticator=_accept_any,
+        auth_require_tls=False,
+    )
+    controller.start()
+    try:
+        print(
+            f"{'target/s':>9} {'offered/s':>10} {'processed':>10} {'dropped':>8}"
+            f" {'thru/s':>9} {'p50 µs':>8} {'p99 µs':>8} {'peak MiB':>9}"
+            f" {'emails':>7} {'retries':>8}"
+        )
+        for rate in (int(r) for r in args.rates.split(",")):
+            r = await run_scenario(
+                rate, args.duration, args.port, handler, not args.no_memory
+            )
+            print(
+                f"{r['rate']:>9} {r['offered']:>10.0f} {r['processed']:>10}"
+                f" {r['dropped']:>8} {r['throughput']:>9.0f}"
+                f" {r['p50'] * 1e6:>8.1f} {r['p99'] * 1e6:>8.1f}"
+                f" {r['peak'] / 2**20:>9.1f} {r['emails']:>7} {r['retries']:>8}"
+            )
+    finally:
+        controller.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,78 @@
+"""批次郵件渲染與 MIME 組裝對事件迴圈阻塞時間的基準測試。
+
+一個每 1 毫秒醒來一次的計時協程測量事件迴圈的最大延遲，
+比較在迴圈上直接渲染/組裝（舊做法）與移至執行緒池（目前做法）的差異。
+
+    python benchmarks/bench_loop_blocking.py
+"""
+
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import SMTP
+
+from _plugin import load
+from bench_templates import build_batch
+
+templates = load("templates")
+
+SIZES = (1_000, 5_000)
+TICK = 0.001
+
+
+def render_and_build(aggregates) -> bytes:
+    """與 EmailService._build_message 相同的組裝流程"""
+    subject, body = templates.generate_batch_message_exception_email(aggregates)
+    msg = MIMEMultipart(policy=SMTP)
+    msg["From"] = "monitor@example.com"
+    msg["To"] = "admin@example.com"
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "html", "utf-8", policy=SMTP))
+    return msg.as_bytes()
+
+
+async def max_loop_lag(work) -> float:
+    """執行 work 期間事件迴圈的最大延遲（秒）"""
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lag = max(lag, time.perf_counter() - start - TICK)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(TICK * 5)
+    await work()
+    done = True
+    await task
+    return lag
+
+
+async def main() -> int:
+    executor = ThreadPoolExecutor(max_workers=2)
+    loop = asyncio.get_running_loop()
+    print(f"{'entries':>8} {'inline ms':>10} {'offload ms':>11}")
+    for size in SIZES:
+        aggregates = build_batch(size)
+
+        async def inline():
+            render_and_build(aggregates)
+
+        async def offload():
+            await loop.run_in_executor(executor, render_and_build, aggregates)
+
+        before = await max_loop_lag(inline)
+        after = await max_loop_lag(offload)
+        print(f"{size:>8} {before * 1000:>10.1f} {after * 1000:>11.1f}")
+    executor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
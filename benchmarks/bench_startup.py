@@ -0,0 +1,189 @@
+"""插件載入耗時與第一封異常郵件延遲的基準測試。
+
+1. 載入：在新的直譯器中匯入插件主模組，報告耗時以及是否已載入 aiosmtplib、
+   email.mime 與 aiohttp 等較重的模組（這些模組應延遲到 initialize 或第一次使用時才匯入）。
+2. 第一封郵件：分別在停用與啟用 SMTP 預熱的情況下初始化插件，等待片刻後報告一筆
+   critical 異常，測量從報告到本機 aiosmtpd 假伺服器收到郵件的時間。
+   假伺服器可在 EHLO 時注入延遲，模擬遠端伺服器的握手與登入耗時。
+
+需要在可匯入 AstrBot 的環境中執行，並另外安裝 aiosmtpd：
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --handshake-latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from _plugin import load
+
+HEAVY_MODULES = ("aiosmtplib", "email.mime.multipart", "aiohttp", "sqlite3")
+
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+from _plugin import load
+main = load("main")
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "module_seconds": main.IMPORT_SECONDS,
+    "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+class SlowHandshakeHandler:
+    """aiosmtpd 處理器：在 EHLO 時注入延遲，並記錄每封郵件的到達時間"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.arrivals = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.arrivals.append(time.perf_counter())
+        return "250 OK"
+
+
+def _accept_any(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def measure_import() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class BenchEvent:
+    """只實作插件會讀取的 AstrMessageEvent 方法"""
+
+    def get_platform_name(self):
+        return "aiocqhttp"
+
+    def get_sender_name(self):
+        return "bench"
+
+    def get_sender_id(self):
+        return "1"
+
+    def get_group_id(self):
+        return ""
+
+    def get_message_str(self):
+        return "first alert"
+
+
+async def first_alert(port: int, handler, warm_up: bool, idle: float) -> dict:
+    plugin_main = load("main")
+    data_dir = Path(tempfile.mkdtemp(prefix="error_monitor_bench_"))
+    plugin_main.StarTools = type(
+        "BenchStarTools", (), {"get_data_dir": staticmethod(lambda: data_dir)}
+    )
+    config = {
+        "smtp_settings": {
+            "smtp_server": "localhost",
+            "smtp_port": port,
+            "smtp_username": "bench",
+            "smtp_password": "bench",
+            "enable_ssl": False,
+            "warm_up_on_start": warm_up,
+        },
+        "notification_filtering": {"recipient_emails": ["admin@example.com"]},
+        "watchdog": {"enable_watchdog": False},
+    }
+    plugin = plugin_main.ExceptionMonitorPlugin(object(), config)
+    await plugin.initialize()
+    # 模擬插件啟動後一段時間才發生第一個錯誤
+    await asyncio.sleep(idle)
+
+    arrivals = len(handler.arrivals)
+    reported = time.perf_counter()
+    await plugin.report_error(BenchEvent(), "BenchFirstAlert", severity="critical")
+    while len(handler.arrivals) == arrivals:
+        await asyncio.sleep(0.001)
+    latency = handler.arrivals[-1] - reported
+
+    email_service = plugin.email_service
+    while email_service.first_delivery_seconds is None:
+        await asyncio.sleep(0.001)
+    result = {
+        "initialize": plugin.initialize_seconds,
+        "warmup": email_service.warmup_seconds,
+        "first_alert": latency,
+        "first_delivery": email_service.first_delivery_seconds,
+    }
+    await plugin.terminate()
+    return result
+
+
+def ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--handshake-latency", type=float, default=0.2)
+    parser.add_argument("--idle", type=float, default=1.0)
+    parser.add_argument("--port", type=int, default=8026)
+    args = parser.parse_args()
+
+    probe = measure_import()
+    print(
+        f"匯入 main：{probe['seconds'] * 1000:.1f} ms"
+        f"（模組自身 {probe['module_seconds'] * 1000:.1f} ms）"
+        f"，已載入的較重模組：{', '.join(probe['loaded']) or '無'}"
+    )
+
+    handler = SlowHandshakeHandler(args.handshake_latency)
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=args.port,
+        authenticator=_accept_any,
+        auth_require_tls=False,
+    )
+    controller.start()
+    try:
+        print(
+            f"{'warm-up':>8} {'init ms':>9} {'warmup ms':>10} {'alert ms':>9} {'deliver ms':>11}"
+        )
+        results = {}
+        for warm_up in (False, True):
+            result = await first_alert(args.port, handler, warm_up, args.idle)
+            results[warm_up] = result
+            print(
+                f"{'on' if warm_up else 'off':>8} {ms(result['initialize']):>9}"
+                f" {ms(result['warmup']):>10} {ms(result['first_alert']):>9}"
+                f" {ms(result['first_delivery']):>11}"
+            )
+    finally:
+        controller.stop()
+
+    if "aiosmtplib" in probe["loaded"]:
+        print("匯入 main 時不應載入 aiosmtplib")
+        return 1
+    return 0 if results[True]["first_alert"] < results[False]["first_alert"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,77 @@
+"""批次郵件渲染的微基準測試。
+
+以 1k 到 10k 個不同指紋（每個附 3 則樣本）渲染批次郵件，
+驗證每個條目的平均渲染時間不隨批次大小增長，即渲染為線性時間。
+
+    python benchmarks/bench_templates.py
+"""
+
+import sys
+import time
+
+from _plugin import load
+
+aggregation = load("aggregation")
+records = load("records")
+templates = load("templates")
+
+SIZES = (1_000, 2_000, 5_000, 10_000)
+REPEAT = 3
+# 最大批次的每條目耗時若超過最小批次的此倍數，視為非線性
+TOLERANCE = 2.0
+
+
+def build_batch(size: int):
+    aggregates = []
+    for i in range(size):
+        aggregate = aggregation.ErrorAggregate(f"{i:016x}", f"Keyword<{i % 37}>")
+        for j in range(aggregation.MAX_SAMPLES):
+            record = records.ExceptionRecord(
+                platform="aiocqhttp",
+                sender=f"user & {j}",
+                sender_id=str(100000 + j),
+                group_id=str(i % 11) if j % 2 else "",
+                message=f"<b>Error {i}-{j}</b>: " + "traceback line\n" * 8,
+                keyword=aggregate.keyword,
+                timestamp=1704067200.0,
+            )
+            # 預先轉義（結果會快取在記錄上），只量測模板本身的耗時
+            record.escape()
+            aggregate.add(record)
+        aggregates.append(aggregate)
+    return aggregates
+
+
+def measure(aggregates) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        templates.generate_batch_message_exception_email(aggregates)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    print(f"{'entries':>8} {'total ms':>10} {'us/entry':>10} {'body KiB':>10}")
+    per_entry = []
+    for size in SIZES:
+        aggregates = build_batch(size)
+        elapsed = measure(aggregates)
+        _, body = templates.generate_batch_message_exception_email(aggregates)
+        per_entry.append(elapsed / size * 1e6)
+        print(
+            f"{size:>8} {elapsed * 1e3:>10.2f} {per_entry[-1]:>10.2f}"
+            f" {len(body.encode('utf-8')) / 1024:>10.0f}"
+        )
+
+    ratio = per_entry[-1] / per_entry[0]
+    linear = ratio <= TOLERANCE
+    print(
+        f"\n每條目耗時 {SIZES[-1]} / {SIZES[0]} 比值: {ratio:.2f}"
+        f" -> {'線性' if linear else '非線性'}"
+    )
+    return 0 if linear else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
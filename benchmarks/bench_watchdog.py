@@ -0,0 +1,87 @@
+"""事件迴圈監控（LoopWatchdog）的開銷與偵測基準測試。
+
+1. 開銷：在事件迴圈上反覆執行大量短小的協程，比較啟用監控前後每秒完成的迭代數，
+   並列出監控自身統計的耗時比例（計時協程 + 取樣執行緒的 CPU 時間）。
+2. 偵測：在迴圈上以 time.sleep 阻塞，確認產生一筆附有阻塞堆疊的合成報告。
+
+    python benchmarks/bench_watchdog.py
+    python benchmarks/bench_watchdog.py --duration 5 --interval 0.05
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from _plugin import load
+
+metrics_module = load("metrics")
+watchdog_module = load("watchdog")
+
+
+async def spin(duration: float) -> int:
+    """在 duration 秒內盡可能多地執行 asyncio.sleep(0)，返回迭代數"""
+    iterations = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            await asyncio.sleep(0)
+        iterations += 100
+    return iterations
+
+
+def blocking_handler(seconds: float):
+    """模擬在事件迴圈上執行的同步阻塞呼叫"""
+    time.sleep(seconds)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+    loop = asyncio.get_running_loop()
+
+    baseline = await spin(args.duration) / args.duration
+
+    reports = []
+    watchdog = watchdog_module.LoopWatchdog(
+        reports.append,
+        metrics_module.MetricsRegistry(),
+        interval=args.interval,
+        threshold=args.threshold,
+    )
+    watchdog.start(loop)
+    monitored = await spin(args.duration) / args.duration
+    overhead = watchdog.overhead
+
+    blocking_handler(args.threshold * 3)
+    await asyncio.sleep(args.interval * 3)
+    await watchdog.stop()
+
+    print(f"{'':>12} {'iter/s':>12}")
+    print(f"{'baseline':>12} {baseline:>12.0f}")
+    print(f"{'watchdog':>12} {monitored:>12.0f}")
+    print(f"吞吐量變化: {(monitored / baseline - 1) * 100:+.2f}%")
+    print(f"監控自身統計的開銷: {overhead * 100:.4f}%")
+    print(
+        f"延遲 p50 / p99 / 最大: {watchdog.lag_histogram.quantile(0.5) * 1000:.2f} / "
+        f"{watchdog.lag_histogram.quantile(0.99) * 1000:.2f} / "
+        f"{watchdog.max_lag * 1000:.0f} ms"
+    )
+
+    stalls = [record for record in reports if record.type == "loop_lag"]
+    if not stalls:
+        print("未偵測到阻塞")
+        return 1
+    record = stalls[0]
+    print(f"偵測到阻塞: {record.message}")
+    if not any(frame.name == "blocking_handler" for frame in record.stack or ()):
+        print("阻塞堆疊中沒有 blocking_handler")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,91 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .records import ExceptionRecord
+
+
+class ExceptionCache:
+    """固定容量的環形緩衝區，保存最近的異常記錄。
+
+    除了依時間排序的主緩衝區外，還維護依平台與關鍵字分組的次級索引。
+    由於記錄總是依序寫入與淘汰，被淘汰的記錄必定位於其索引佇列的最前端，
+    因此寫入、淘汰與依索引查詢最近記錄皆為 O(1)。
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = max(1, int(capacity))
+        self._slots: List[Optional[ExceptionRecord]] = [None] * self.capacity
+        self._head = 0  # 下一個寫入位置
+        self._size = 0
+        self.by_platform: Dict[str, Deque[ExceptionRecord]] = {}
+        self.by_keyword: Dict[str, Deque[ExceptionRecord]] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, record: ExceptionRecord):
+        """寫入一筆記錄；已滿時淘汰最舊的記錄"""
+        if self._size == self.capacity:
+            self._unindex(self._slots[self._head])
+        else:
+            self._size += 1
+        self._slots[self._head] = record
+        self._head = (self._head + 1) % self.capacity
+        self.by_platform.setdefault(record.platform, deque()).append(record)
+        self.by_keyword.setdefault(record.keyword, deque()).append(record)
+
+    def recent(
+        self,
+        n: int = 5,
+        platform: Optional[str] = None,
+        keyword: Optional[str] = None,
+    ) -> List[ExceptionRecord]:
+        """返回最近的 n 筆記錄（由新到舊），可依平台或關鍵字篩選"""
+        if platform is not None:
+            return self._tail(self.by_platform.get(platform), n)
+        if keyword is not None:
+            return self._tail(self.by_keyword.get(keyword), n)
+        n = min(n, self._size)
+        return [self._slots[(self._head - 1 - i) % self.capacity] for i in range(n)]
+
+    def counts_by_platform(self) -> Dict[str, int]:
+        return {platform: len(q) for platform, q in self.by_platform.items()}
+
+    def counts_by_keyword(self) -> Dict[str, int]:
+        return {keyword: len(q) for keyword, q in self.by_keyword.items()}
+
+    def clear(self):
+        self._slots = [None] * self.capacity
+        self._head = 0
+        self._size = 0
+        self.by_platform.clear()
+        self.by_keyword.clear()
+
+    def resize(self, capacity: int):
+        """調整容量並保留最近的記錄；縮小時淘汰較舊的部分"""
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity:
+            return
+        records = self.recent(min(self._size, capacity))
+        self.capacity = capacity
+        self.clear()
+        for record in reversed(records):
+            self.append(record)
+
+    @staticmethod
+    def _tail(
+        records: Optional[Deque[ExceptionRecord]], n: int
+    ) -> List[ExceptionRecord]:
+        if not records:
+            return []
+        return [records[-1 - i] for i in range(min(n, len(records)))]
+
+    def _unindex(self, record: ExceptionRecord):
+        for index, key in (
+            (self.by_platform, record.platform),
+            (self.by_keyword, record.keyword),
+        ):
+            records = index[key]
+            records.popleft()
+            if not records:
+                del index[key]
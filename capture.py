@@ -0,0 +1,110 @@
+import random
+import zlib
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+from .records import ExceptionRecord
+
+# 追蹤完整內容抽樣狀態的指紋數上限（最久未出現的先淘汰）
+MAX_TRACKED_FINGERPRINTS = 256
+# 小於此大小的完整內容不壓縮，zlib 的標頭開銷與 CPU 成本不划算
+COMPRESS_MIN_BYTES = 1024
+
+
+def truncate_text(text: str, max_bytes: int) -> Tuple[str, int]:
+    """以 UTF-8 位元組數截斷文字，保留開頭與結尾各約一半。
+
+    返回 (截斷後的文字, 原始位元組數)；max_bytes 為 0 或文字未超出時原樣返回。
+    """
+    data = text.encode("utf-8", "replace")
+    if not max_bytes or len(data) <= max_bytes:
+        return text, len(data)
+    head = data[: max_bytes // 2].decode("utf-8", "ignore")
+    tail = data[len(data) - (max_bytes - max_bytes // 2) :].decode("utf-8", "ignore")
+    omitted = len(data) - len(head.encode("utf-8")) - len(tail.encode("utf-8"))
+    return f"{head}\n…（省略 {omitted} 位元組）…\n{tail}", len(data)
+
+
+class CapturePolicy:
+    """控制每筆報告保存的訊息大小，使每筆記錄的記憶體佔用有固定上限。
+
+    - 訊息超過 ``max_message_bytes`` 時只保留開頭與結尾，指紋、快取、歷史與日誌都使用截斷後的文字
+    - 每個指紋以水塘抽樣保留最多 ``full_samples`` 筆完整內容（上限 ``max_payload_bytes``），
+      供郵件呈現；被擠出水塘的記錄立即釋放完整內容
+    - ``compress`` 啟用時，保留的完整內容以 zlib 壓縮存放，渲染時才解壓
+    """
+
+    def __init__(
+        self,
+        max_message_bytes: int = 2048,
+        full_samples: int = 1,
+        max_payload_bytes: int = 65536,
+        compress: bool = True,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.max_message_bytes = max(0, int(max_message_bytes))
+        self.full_samples = max(0, int(full_samples))
+        self.max_payload_bytes = max(0, int(max_payload_bytes))
+        self.compress = compress
+        self._rng = rng
+        # 指紋 -> [已見的過長訊息數, 保留完整內容的記錄]
+        self._reservoirs: "OrderedDict[str, list]" = OrderedDict()
+
+        # 統計資訊
+        self.truncated = 0
+        self.payload_bytes = 0  # 目前保留的完整內容（壓縮後）位元組數
+
+    def truncate(self, record: ExceptionRecord) -> str:
+        """截斷記錄的訊息；返回原始訊息，供 keep_payload 決定是否保留完整內容"""
+        original = str(record.message or "")
+        message, size = truncate_text(original, self.max_message_bytes)
+        if message is not original:
+            record.message, record.message_bytes = message, size
+            self.truncated += 1
+        return original
+
+    def keep_payload(self, record: ExceptionRecord, original: str):
+        """以水塘抽樣決定是否為記錄保留完整內容；需在計算指紋之後呼叫"""
+        if record.message_bytes is None or not self.full_samples:
+            return
+        entry = self._reservoirs.get(record.fingerprint)
+        if entry is None:
+            entry = self._reservoirs[record.fingerprint] = [0, []]
+            if len(self._reservoirs) > MAX_TRACKED_FINGERPRINTS:
+                _, (_, evicted) = self._reservoirs.popitem(last=False)
+                for sample in evicted:
+                    self._release(sample)
+        else:
+            self._reservoirs.move_to_end(record.fingerprint)
+        entry[0] += 1
+        samples: List[ExceptionRecord] = entry[1]
+        if len(samples) < self.full_samples:
+            samples.append(record)
+        else:
+            slot = int(self._rng() * entry[0])
+            if slot >= self.full_samples:
+                return
+            self._release(samples[slot])
+            samples[slot] = record
+        payload, _ = truncate_text(original, self.max_payload_bytes)
+        data = payload.encode("utf-8")
+        if self.compress and len(data) >= COMPRESS_MIN_BYTES:
+            data = zlib.compress(data)
+            record.payload = data
+        else:
+            record.payload = payload
+        self.payload_bytes += len(data)
+
+    def _release(self, record: ExceptionRecord):
+        if record.payload is not None:
+            self.payload_bytes -= len(
+                record.payload
+                if isinstance(record.payload, bytes)
+                else record.payload.encode("utf-8")
+            )
+            record.payload = None
+
+    def reset(self):
+        """開始新的批處理窗口：重新抽樣，已保留的完整內容留在原本的批次中"""
+        self._reservoirs.clear()
+        self.payload_bytes = 0
@@ -0,0 +1,264 @@
+"""Error Monitor 的離線工具：匯出異常歷史，或以不同的設定重放真實的錯誤流。
+
+需要在可匯入 AstrBot 的環境中、於插件目錄的上一層執行，例如：
+
+    python -m astrbot_plugin_error_monitor.cli export --data-dir DIR --since 7d --format csv -o week.csv
+    python -m astrbot_plugin_error_monitor.cli replay --data-dir DIR --since 14d \\
+        --config config.json --variant "max_emails_per_hour=30" \\
+        --variant "batch_window_seconds=300,adaptive_batching=false"
+
+資料來源為資料目錄下的 history.db（以唯讀模式開啟，插件運行中也可使用），
+或以 --input 指定先前匯出的 NDJSON 檔案（- 表示標準輸入）。
+"""
+
+import argparse
+import json
+import logging
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .history import SEARCH_FIELDS, iter_history, parse_time
+from .replay import (
+    Row,
+    filter_rows,
+    read_ndjson,
+    replay,
+    to_record,
+    write_csv,
+    write_ndjson,
+)
+
+SCHEMA_PATH = Path(__file__).resolve().parent / "_conf_schema.json"
+
+
+def _parse_filters(args: argparse.Namespace) -> Dict[str, str]:
+    filters = {}
+    for item in args.filter or ():
+        name, eq, value = item.partition("=")
+        if not eq or name not in SEARCH_FIELDS:
+            raise ValueError(
+                f"無法辨識的篩選條件「{item}」，可用欄位：{', '.join(SEARCH_FIELDS)}"
+            )
+        filters[name] = value
+    if args.platform:
+        filters["platform"] = args.platform
+    if args.keyword:
+        filters["keyword"] = args.keyword
+    return filters
+
+
+def _time_range(args: argparse.Namespace) -> Tuple[Optional[float], Optional[float]]:
+    since = parse_time(args.since) if args.since else None
+    until = parse_time(args.until) if args.until else None
+    return since, until
+
+
+def open_rows(args: argparse.Namespace, stack: ExitStack) -> Iterator[Row]:
+    """依命令列參數建立「來源 -> 篩選」的串流；歷史資料庫的篩選直接下推到 SQL 查詢"""
+    filters = _parse_filters(args)
+    since, until = _time_range(args)
+    if args.input:
+        stream = (
+            sys.stdin
+            if args.input == "-"
+            else stack.enter_context(open(args.input, encoding="utf-8"))
+        )
+        return filter_rows(read_ndjson(stream), filters, since, until)
+    if not args.data_dir:
+        raise ValueError(
+            "請以 --data-dir 指定插件資料目錄，或以 --input 指定 NDJSON 檔案"
+        )
+    path = Path(args.data_dir) / "history.db"
+    if not path.exists():
+        raise ValueError(f"找不到異常歷史資料庫 {path}")
+    return iter_history(path, filters, since, until)
+
+
+def parse_variant(text: str, schema: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """解析「欄位=值, ...」格式的設定變體。
+
+    欄位可寫成「區段.欄位」，或只寫欄位名稱（依 _conf_schema.json 找出所屬區段）；
+    值以 JSON 解析（30、false、["a@x"]），無法解析時視為字串。
+    """
+    overrides: Dict[str, Dict[str, Any]] = {}
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, eq, raw = item.partition("=")
+        key = key.strip()
+        if not eq:
+            raise ValueError(f"設定變體「{item}」應為 欄位=值")
+        section, dot, field = key.rpartition(".")
+        if not dot:
+            sections = [
+                name for name, spec in schema.items() if key in spec.get("items", {})
+            ]
+            if len(sections) != 1:
+                raise ValueError(
+                    f"無法確定「{key}」所屬的設定區段，請寫成 區段.{key}"
+                    if sections
+                    else f"未知的設定欄位「{key}」"
+                )
+            section, field = sections[0], key
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw.strip()
+        overrides.setdefault(section, {})[field] = value
+    return overrides
+
+
+def _with_overrides(
+    config: Dict[str, Any], overrides: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    merged = {
+        section: dict(values) if isinstance(values, dict) else values
+        for section, values in config.items()
+    }
+    for section, values in overrides.items():
+        merged.setdefault(section, {}).update(values)
+    return merged
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} h"
+    if seconds >= 60:
+        return f"{seconds / 60:.1f} m"
+    return f"{seconds:.0f} s"
+
+
+def run_export(args: argparse.Namespace) -> int:
+    with ExitStack() as stack:
+        rows = open_rows(args, stack)
+        out = (
+            sys.stdout
+            if args.output in (None, "-")
+            else stack.enter_context(
+                open(args.output, "w", encoding="utf-8", newline="")
+            )
+        )
+        writer = write_csv if args.format == "csv" else write_ndjson
+        count = writer(rows, out)
+    print(f"已匯出 {count} 筆異常記錄。", file=sys.stderr)
+    return 0
+
+
+def run_replay(args: argparse.Namespace) -> int:
+    base: Dict[str, Any] = {}
+    if args.config:
+        with open(args.config, encoding="utf-8-sig") as f:
+            base = json.load(f)
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        schema = json.load(f)
+    variants: List[Tuple[str, Dict[str, Any]]] = [("目前設定", base)]
+    for text in args.variant or ():
+        variants.append((text, _with_overrides(base, parse_variant(text, schema))))
+
+    results = []
+    for name, config in variants:
+        # 每組設定都重新串流讀取資料來源，不在記憶體中保留記錄
+        with ExitStack() as stack:
+            records = (to_record(row) for row in open_rows(args, stack))
+            results.append((name, replay(records, config, args.drain_hours * 3600)))
+
+    reports = results[0][1]["reports"] if results else 0
+    print(f"重放 {reports} 則異常報告：")
+    for name, result in results:
+        dropped = sum(result["dropped"].values())
+        print(f"\n[{name}]")
+        print(
+            f"  郵件 {result['emails']} 封（批次 {result['batches']}、"
+            f"風暴警報 {result['storm_alerts']}），單一小時最多 {result['peak_per_hour']} 封"
+        )
+        print(
+            f"  延後 {result['deferred']} 則 / 捨棄 {dropped} 則"
+            + (
+                f"（{', '.join(f'{k}: {v:.0f}' for k, v in result['dropped'].items())}）"
+                if dropped
+                else ""
+            )
+            + f" / 結束時仍未送出 {result['undelivered']} 則"
+        )
+        print(
+            f"  送出延遲 p50 {_format_seconds(result['delay_p50'])}"
+            f" / p95 {_format_seconds(result['delay_p95'])}"
+            f" / 最長 {_format_seconds(result['delay_max'])}"
+        )
+        if args.verbose and result["recipients"]:
+            print(
+                "  收件人: "
+                + ", ".join(f"{r}: {n}" for r, n in result["recipients"].items())
+            )
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]),
+    )
+    source = argparse.ArgumentParser(add_help=False)
+    source.add_argument("--data-dir", help="插件資料目錄（包含 history.db）")
+    source.add_argument("--input", help="改為讀取 NDJSON 檔案，- 表示標準輸入")
+    source.add_argument("--since", help="起始時間，例如 7d、2024-01-01 12:00")
+    source.add_argument("--until", help="結束時間（不含）")
+    source.add_argument("--platform", help="只處理此平台的異常")
+    source.add_argument("--keyword", help="只處理此關鍵字的異常")
+    source.add_argument(
+        "--filter",
+        action="append",
+        help="其他篩選條件，例如 group=123、sender=456，可重複指定",
+    )
+    source.add_argument("-v", "--verbose", action="store_true", help="顯示插件日誌")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", parents=[source], help="匯出異常歷史")
+    export.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    export.add_argument("-o", "--output", help="輸出檔案，預設為標準輸出")
+    export.set_defaults(run=run_export)
+
+    replay_cmd = commands.add_parser(
+        "replay",
+        parents=[source],
+        help="以虛擬時鐘重放異常，比較不同設定的郵件數與延遲",
+    )
+    replay_cmd.add_argument(
+        "--config", help="插件設定檔（JSON），預設使用各設定的預設值"
+    )
+    replay_cmd.add_argument(
+        "--variant",
+        action="append",
+        help="在基準設定上修改的欄位，例如 max_emails_per_hour=30,batch_window_seconds=300；"
+        "可重複指定以比較多組設定",
+    )
+    replay_cmd.add_argument(
+        "--drain-hours",
+        type=float,
+        default=24,
+        help="資料結束後最多再模擬的時數，讓延後的報告有機會送出",
+    )
+    replay_cmd.set_defaults(run=run_replay)
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if not args.verbose:
+        # 重放時每個批處理窗口與每次延後都會記錄日誌，預設只顯示錯誤
+        logger.setLevel(logging.ERROR)
+    try:
+        return args.run(args)
+    except (OSError, ValueError) as e:
+        print(f"錯誤：{e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,128 @@
-import aiosmtplib
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent
 from astrbot.core.message.message_event_result import MessageChain
 from astrbot.core.message.components import Plain
 
+from .history import SEARCH_FIELDS, parse_time
+from .ingest import IngestQueue
+from .metrics import MetricsRegistry
+from .reload import load_config_file
 from .services import EmailService, ExceptionProcessor
 from .templates import generate_test_email
+from .watchdog import LoopWatchdog
 
 
 async def handle_exception_status(
-    event: AstrMessageEvent, processor: ExceptionProcessor, email_service: EmailService
+    event: AstrMessageEvent,
+    processor: ExceptionProcessor,
+    email_service: EmailService,
+    ingest_queue: Optional[IngestQueue] = None,
+    watchdog: Optional[LoopWatchdog] = None,
 ):
     """處理 'exception_status' 指令，顯示插件狀態"""
+    sent_last_hour = processor.limiter.sent_last_hour
+    if processor.reserved_limiter:
+        sent_last_hour += processor.reserved_limiter.sent_last_hour
     status_info = {
         "郵件設定": "已設定" if email_service.sender_address else "未設定",
-        "本週期已寄送郵件": f"{processor.email_counter['count']}/{processor.max_emails_per_hour}",
-        "異常快取數量": len(processor.exception_cache),
+        "最近一小時已寄送郵件": f"{sent_last_hour}/{processor.max_emails_per_hour}",
+        "可用令牌": f"{processor.limiter.tokens:.2f}/{processor.limiter.burst}",
+        "延後發送中": f"{processor.deferred.total} 則"
+        + (
+            f"（critical {processor.deferred.buffers['immediate'].total} 則）"
+            if processor.deferred.buffers["immediate"]
+            else ""
+        ),
+        "異常到達速率": f"{processor.arrival_rate.per_minute:.1f} 則/分鐘",
+        "目前批處理窗口": f"{processor.effective_window():.0f} 秒"
+        + ("（自適應）" if processor.adaptive_batching else ""),
+        "異常快取數量": f"{len(processor.exception_cache)}/{processor.exception_cache.capacity}",
+        "快取平台分佈": ", ".join(
+            f"{platform}: {count}"
+            for platform, count in processor.exception_cache.counts_by_platform().items()
+        )
+        or "無",
+        "批次緩衝區": (
+            f"{processor.message_buffer.total} 則 / {len(processor.message_buffer)} 種"
+            f"（捨棄 {processor.message_buffer.dropped} 則）"
+        ),
+        "SMTP 連線池": (
+            f"命中 {email_service.pool.hits} / 未命中 {email_service.pool.misses}"
+            f" / 重連 {email_service.pool.reconnects}"
+            f" (閒置 {email_service.pool.idle_count}/{email_service.pool.max_size})"
+        ),
+        "SMTP 投遞": _delivery_status(email_service),
+        "啟動耗時": _startup_status(processor.metrics, email_service),
     }
+    if email_service.capabilities:
+        status_info["SMTP 伺服器能力"] = ", ".join(email_service.capabilities)
+    if email_service.routing:
+        sessions = email_service.session_messages
+        status_info["收件人路由"] = f"{len(email_service.routing)} 條規則" + (
+            f" / 每條 SMTP 連線平均送出 {sessions.sum / sessions.count:.1f} 封"
+            if sessions.count
+            else ""
+        )
+    reloads = processor.config_reloads
+    if reloads.values:
+        status_info["設定重新載入"] = " / ".join(
+            f"{label} {reloads.values.get((result,), 0):.0f}"
+            for result, label in (
+                ("applied", "已套用"),
+                ("unchanged", "無變更"),
+                ("failed", "失敗"),
+            )
+        )
+    for channel in processor.notifiers:
+        status_info[f"通知通道 {channel.name}"] = (
+            f"已送出 {channel.sent} / 失敗 {channel.failed} / 逾時 {channel.timeouts}"
+            f" / 緩衝 {channel.buffer.total} 則"
+        )
+    capture = processor.capture_policy
+    if capture.truncated:
+        status_info["訊息截斷"] = (
+            f"{capture.truncated} 則 / 保留完整內容 {capture.payload_bytes / 1024:.1f} KB"
+        )
+    if processor.priority_lanes:
+        reserved = processor.reserved_limiter
+        status_info["優先通道"] = (
+            f"critical 保留額度 {reserved.sent_last_hour}/{reserved.max_per_hour}"
+            if reserved
+            else "critical 無保留額度"
+        ) + f" / 嚴重程度規則 {len(processor.severity_rules)} 條"
+    coordinator = processor.coordinator
+    if coordinator:
+        status_info["多實例協調"] = (
+            f"{coordinator.instance_id}（{'領導者' if coordinator.is_leader else '跟隨者'}）"
+            f" / 轉交 {coordinator.forwarded}（已確認 {coordinator.confirmed}）"
+            f" / 收取 {coordinator.collected}"
+            f" / 去重 {coordinator.duplicates} / 後端錯誤 {coordinator.errors}"
+        )
+    if processor.digests:
+        status_info["摘要報告"] = (
+            f"{'/'.join(processor.digests.periods)} / 已送出 {processor.digests.sent}"
+            f" / 待發送 {len(processor.digests.pending)}"
+        )
+    if processor.analytics:
+        status_info.update(_analytics_status(processor.analytics))
+    status_info.update(_metrics_status(processor.metrics))
+    if ingest_queue:
+        status_info["報告佇列"] = (
+            f"目前 {ingest_queue.depth}/{ingest_queue.max_size}"
+            f"（峰值 {ingest_queue.high_water}）"
+            f" / 已處理 {ingest_queue.processed} / 捨棄 {ingest_queue.dropped}"
+            f" / 失敗 {ingest_queue.failed}"
+        )
+    if watchdog:
+        status_info["事件迴圈監控"] = (
+            f"阻塞 {watchdog.stalls} 次（最長 {watchdog.max_lag * 1000:.0f} ms）"
+            f" / 慢速裝飾階段 {watchdog.slow_passes} 次"
+            f" / 監控開銷 {watchdog.overhead * 100:.3f}%"
+        )
 
     status_text = "異常監控插件狀態：\n"
     for key, value in status_info.items():
@@ -25,6 +131,118 @@ async def handle_exception_status(
     await event.send(MessageChain([Plain(text=status_text)]))
 
 
+_BREAKER_STATES = {"closed": "正常", "open": "暫停", "half_open": "試探中"}
+
+
+def _delivery_status(email_service: EmailService) -> str:
+    delivery = email_service.delivery
+    breaker = delivery.breaker
+    state = _BREAKER_STATES.get(breaker.state, breaker.state)
+    if breaker.state == breaker.OPEN:
+        state += f"（{breaker.time_until_closed():.0f} 秒後試探）"
+    text = (
+        f"{state} / 成功 {delivery.delivered} / 重試 {delivery.retried}"
+        f" / 待重試 {delivery.pending_retries} / 放棄 {delivery.given_up}"
+        f" / 永久失敗 {delivery.permanent_failures}"
+    )
+    if delivery.last_error:
+        text += f" / 最近錯誤 {delivery.last_error}"
+    return text
+
+
+def _analytics_status(analytics) -> dict:
+    """錯誤流的突增偵測與 Top-K 來源摘要"""
+    insights = analytics.snapshot()
+
+    def top(entries):
+        return ", ".join(f"{key}: {count}" for key, count, _ in entries) or "無"
+
+    storm = "風暴中" if analytics.in_storm else "正常"
+    return {
+        "錯誤趨勢": (
+            f"{storm} / 本分鐘 {insights['current_per_minute']} 則"
+            f" / 基線 {insights['baseline_per_minute']:.1f}"
+            f" ± {insights['stddev']:.1f} 則/分鐘 / z = {insights['z_score']:.1f}"
+            f" / 風暴警報 {analytics.storms} 次（冷卻中略過 {analytics.suppressed_storms} 次）"
+        ),
+        "最多錯誤的使用者": top(insights["senders"]),
+        "最多錯誤的群組": top(insights["groups"]),
+        "最常見的關鍵字": top(insights["keywords"]),
+    }
+
+
+def _percentiles_ms(histogram) -> str:
+    if histogram is None or not histogram.count:
+        return "無資料"
+    return (
+        f"p50 {histogram.quantile(0.5) * 1000:.1f} / p95 {histogram.quantile(0.95) * 1000:.1f}"
+        f" / p99 {histogram.quantile(0.99) * 1000:.1f} ms（{histogram.count} 次）"
+    )
+
+
+def _startup_status(metrics: MetricsRegistry, email_service: EmailService) -> str:
+    """插件載入、SMTP 預熱與第一封郵件的投遞耗時"""
+    parts = []
+    for label, name in (
+        ("匯入", "plugin_import_seconds"),
+        ("初始化", "plugin_initialize_seconds"),
+    ):
+        gauge = metrics.get(name)
+        if gauge is not None:
+            parts.append(f"{label} {gauge.value * 1000:.0f} ms")
+    if email_service.warmup_seconds is not None:
+        parts.append(
+            f"SMTP 預熱 {email_service.warmup_seconds * 1000:.0f} ms"
+            + (
+                f"（失敗: {email_service.warmup_error}）"
+                if email_service.warmup_error
+                else ""
+            )
+        )
+    elif email_service.warmup_task:
+        parts.append("SMTP 預熱中")
+    first = email_service.first_delivery_seconds
+    parts.append(
+        f"首封郵件投遞 {first * 1000:.0f} ms" if first is not None else "尚未發送郵件"
+    )
+    return " / ".join(parts)
+
+
+def _metrics_status(metrics: MetricsRegistry) -> dict:
+    """將指標登錄表整理為狀態指令中的數行摘要"""
+    status = {
+        "佇列等待延遲": _percentiles_ms(metrics.get("ingest_wait_seconds")),
+        "報告處理耗時": _percentiles_ms(metrics.get("ingest_process_seconds")),
+        "郵件渲染耗時": _percentiles_ms(metrics.get("render_seconds")),
+        "MIME 組裝耗時": _percentiles_ms(metrics.get("email_build_seconds")),
+        "SMTP 連線": _percentiles_ms(metrics.get("smtp_connect_seconds")),
+        "SMTP 登入": _percentiles_ms(metrics.get("smtp_login_seconds")),
+        "SMTP 傳送": _percentiles_ms(metrics.get("smtp_send_seconds")),
+        "事件迴圈延遲": _percentiles_ms(metrics.get("event_loop_lag_seconds")),
+    }
+    passes = metrics.get("decorating_pass_seconds")
+    if passes is not None and passes.count:
+        status["結果裝飾階段耗時"] = _percentiles_ms(passes)
+    batch_sizes = metrics.get("batch_size")
+    if batch_sizes is not None and batch_sizes.count:
+        status["批次大小"] = (
+            f"p50 {batch_sizes.quantile(0.5):.0f} / p99 {batch_sizes.quantile(0.99):.0f}"
+            f" 則（{batch_sizes.count} 批）"
+        )
+    dropped = metrics.get("reports_dropped_total")
+    if dropped is not None and dropped.values:
+        status["捨棄原因"] = ", ".join(
+            f"{reason}: {count:.0f}" for (reason,), count in dropped.top(10)
+        )
+    reports = metrics.get("reports_total")
+    if reports is not None and reports.values:
+        status["最常見的錯誤來源"] = ", ".join(
+            f"{platform}/{keyword}: {count:.0f}"
+            for (platform, keyword), count in reports.top(5)
+        )
+    return status
+
+
 async def handle_clear_cache(event: AstrMessageEvent, processor: ExceptionProcessor):
     """處理 'clear_exception_cache' 指令，清除異常快取"""
     cache_count = len(processor.exception_cache)
@@ -34,6 +252,14 @@ async def handle_clear_cache(event: AstrMessageEvent, processor: ExceptionProces
 
 async def handle_test_email(event: AstrMessageEvent, email_service: EmailService):
     """處理 'test_exception_email' 指令，寄送測試郵件"""
+    if not email_service.is_configured:
+        await event.send(
+            MessageChain(
+                [Plain(text="測試郵件寄送失敗：郵件服務未配置，請檢查 SMTP 設定。")]
+            )
+        )
+        return
+
     event_info = {
         "platform": event.get_platform_name(),
         "sender_name": event.get_sender_name(),
@@ -42,15 +268,131 @@ async def handle_test_email(event: AstrMessageEvent, email_service: EmailService
     subject, body = generate_test_email(event_info)
 
     try:
-        await email_service.send_email_async(subject, body)
+        # send_email_async 自行記錄 SMTP 錯誤並以返回值表示是否送出
+        sent = await email_service.send_email_async(subject, body)
+    except Exception as e:
+        logger.error(f"[ErrorMonitor] 寄送測試郵件時發生未知錯誤: {e}", exc_info=True)
+        await event.send(MessageChain([Plain(text="測試郵件寄送失敗：發生未知錯誤。")]))
+        return
+    if sent:
         await event.send(MessageChain([Plain(text="測試郵件已寄出，請檢查收件匣。")]))
-    except aiosmtplib.SMTPException as e:
-        logger.error(f"[ErrorMonitor] 測試郵件 SMTP 錯誤: {e}", exc_info=True)
+    else:
         await event.send(
             MessageChain(
                 [Plain(text="測試郵件寄送失敗：SMTP 服務錯誤，請檢查後台日誌。")]
             )
         )
+
+
+async def handle_reload_config(
+    event: AstrMessageEvent,
+    reload: Callable[[Dict[str, Any]], Awaitable[Tuple[List[str], List[str]]]],
+    config_path: Optional[str],
+):
+    """處理 'reload_exception_config' 指令，從設定檔就地套用設定變更"""
+    if not config_path:
+        await event.send(MessageChain([Plain(text="無法取得插件設定檔的路徑。")]))
+        return
+    started = time.perf_counter()
+    try:
+        new_config = await asyncio.to_thread(load_config_file, config_path)
+        applied, restart = await reload(new_config)
     except Exception as e:
-        logger.error(f"[ErrorMonitor] 寄送測試郵件時發生未知錯誤: {e}", exc_info=True)
-        await event.send(MessageChain([Plain(text="測試郵件寄送失敗：發生未知錯誤。")]))
+        logger.error(f"[ErrorMonitor] 重新載入設定失敗: {e}", exc_info=True)
+        await event.send(
+            MessageChain(
+                [
+                    Plain(
+                        text=f"重新載入設定失敗，目前的設定未變更：{type(e).__name__}: {e}"
+                    )
+                ]
+            )
+        )
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if not applied and not restart:
+        text = f"設定沒有變更（{elapsed_ms:.1f} ms）。"
+    else:
+        text = f"已重新載入設定（{elapsed_ms:.1f} ms）。"
+        if applied:
+            text += "\n已套用：" + ", ".join(applied)
+        if restart:
+            text += "\n需要重新載入插件才會生效：" + ", ".join(restart)
+    await event.send(MessageChain([Plain(text=text)]))
+
+
+_SEARCH_USAGE = (
+    "用法：/exception_search [platform=…] [keyword=…] [sender=…] [group=…]"
+    " [fingerprint=…] [since=1h] [until=…] [before=…]"
+)
+
+
+def parse_search_args(text: str) -> Dict[str, Any]:
+    """將 "platform=aiocqhttp since=1h before=<ts>,<id>" 形式的參數解析為 HistoryStore.search 的參數"""
+    tokens = text.split()
+    if tokens and tokens[0].lstrip("/").lower() == "exception_search":
+        tokens = tokens[1:]
+
+    filters = {}
+    query: Dict[str, Any] = {"filters": filters}
+    for token in tokens:
+        name, sep, value = token.partition("=")
+        name = name.lower()
+        if not sep or not value:
+            raise ValueError(f"無法解析「{token}」")
+        if name in SEARCH_FIELDS:
+            filters[name] = value
+        elif name in ("since", "until"):
+            query[name] = parse_time(value)
+        elif name == "before":
+            # 翻頁游標：上一頁最後一筆的 "時間戳,編號"
+            ts, _, row_id = value.partition(",")
+            try:
+                query["before"] = (float(ts), int(row_id))
+            except ValueError:
+                raise ValueError(f"翻頁游標「{value}」格式錯誤，應為 <時間戳>,<編號>")
+        else:
+            raise ValueError(f"不支援的條件「{name}」")
+    return query
+
+
+async def handle_exception_search(
+    event: AstrMessageEvent, processor: ExceptionProcessor
+):
+    """處理 'exception_search' 指令，分頁查詢異常歷史"""
+    if not processor.history:
+        await event.send(MessageChain([Plain(text="異常歷史記錄未啟用。")]))
+        return
+    try:
+        query = parse_search_args(event.get_message_str())
+    except ValueError as e:
+        await event.send(
+            MessageChain([Plain(text=f"查詢參數錯誤：{e}\n{_SEARCH_USAGE}")])
+        )
+        return
+
+    started = time.perf_counter()
+    rows, has_more = await processor.history.search(**query)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if not rows:
+        await event.send(
+            MessageChain(
+                [Plain(text=f"沒有符合條件的異常記錄（{elapsed_ms:.1f} ms）。")]
+            )
+        )
+        return
+
+    lines = [f"異常歷史查詢結果（{elapsed_ms:.1f} ms）："]
+    for row in rows:
+        context = f"群組 {row['group_id']}" if row["group_id"] else "私聊"
+        lines.append(
+            f"#{row['id']} {row['timestamp']} · {row['platform']} · {context}"
+            f" · {row['sender']} ({row['sender_id']}) · [{row['keyword']}]"
+        )
+        lines.append(f"    {str(row['message'] or '')[:80]}")
+    if has_more:
+        last = rows[-1]
+        lines.append(f"在指令後加上 before={last['ts']!r},{last['id']} 查看下一頁。")
+    await event.send(MessageChain([Plain(text="\n".join(lines))]))
@@ -0,0 +1,561 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .scheduler import Clock
+
+# 共享狀態中的鍵
+LEADER_KEY = "leader"
+EMAIL_BUCKET_KEY = "email_bucket"
+OUTBOX_KEY = "outbox"
+CONFIRM_PREFIX = "confirm:"
+DEDUP_PREFIX = "dedup:"
+REDIS_PREFIX = "astrbot_error_monitor:"
+
+
+class CoordinationBackend(ABC):
+    """多個插件實例之間共享狀態的介面。
+
+    每個操作都對應一個 Redis 指令（或一段原子執行的 Lua 腳本），
+    因此可以直接以 Redis 實作，也可以在單機上以 SQLite 或記憶體實作相同的語意。
+    """
+
+    @abstractmethod
+    async def set_nx(self, key: str, value: str, ttl: float) -> bool:
+        """鍵不存在（或已過期）時設定並返回 True（SET key value NX PX ttl）"""
+
+    @abstractmethod
+    async def compare_and_expire(self, key: str, value: str, ttl: float) -> bool:
+        """鍵的值仍為 value 時延長其存活時間"""
+
+    @abstractmethod
+    async def compare_and_delete(self, key: str, value: str) -> bool:
+        """鍵的值仍為 value 時刪除"""
+
+    @abstractmethod
+    async def take_token(self, key: str, capacity: float, rate: float) -> float:
+        """從共享令牌桶取一個令牌；成功返回 0，否則返回需要等待的秒數"""
+
+    @abstractmethod
+    async def return_token(self, key: str, capacity: float):
+        """退還一個令牌"""
+
+    @abstractmethod
+    async def push(self, key: str, item: str):
+        """追加到清單尾端（RPUSH）"""
+
+    @abstractmethod
+    async def pop_all(self, key: str) -> List[str]:
+        """原子地取出並清空整個清單（LRANGE + DEL）"""
+
+    async def close(self):
+        pass
+
+
+def _refill(tokens: float, updated: float, capacity: float, rate: float, now: float):
+    if now > updated:
+        tokens = min(capacity, tokens + (now - updated) * rate)
+    return tokens
+
+
+def _token_wait(tokens: float, rate: float) -> float:
+    if rate <= 0:
+        return float("inf")
+    return (1 - tokens) / rate
+
+
+class LocalBackend(CoordinationBackend):
+    """以記憶體實作的替身，語意與 Redis 後端相同；同一程序中的多個處理器可以共用同一個實例"""
+
+    def __init__(self, clock: Clock = time.time):
+        self.clock = clock
+        self._values: Dict[str, Tuple[str, float]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lists: Dict[str, List[str]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= self.clock():
+            del self._values[key]
+            return None
+        return entry[0]
+
+    async def set_nx(self, key, value, ttl):
+        if self._live(key) is not None:
+            return False
+        self._values[key] = (value, self.clock() + ttl)
+        return True
+
+    async def compare_and_expire(self, key, value, ttl):
+        if self._live(key) != value:
+            return False
+        self._values[key] = (value, self.clock() + ttl)
+        return True
+
+    async def compare_and_delete(self, key, value):
+        if self._live(key) != value:
+            return False
+        del self._values[key]
+        return True
+
+    async def take_token(self, key, capacity, rate):
+        now = self.clock()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = _refill(tokens, updated, capacity, rate, now)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return _token_wait(tokens, rate)
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    async def return_token(self, key, capacity):
+        tokens, updated = self._buckets.get(key, (capacity, self.clock()))
+        self._buckets[key] = (min(capacity, tokens + 1), updated)
+
+    async def push(self, key, item):
+        self._lists.setdefault(key, []).append(item)
+
+    async def pop_all(self, key):
+        return self._lists.pop(key, [])
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires REAL);
+CREATE INDEX IF NOT EXISTS idx_kv_expires ON kv (expires);
+CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL);
+CREATE TABLE IF NOT EXISTS lists (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, item TEXT);
+CREATE INDEX IF NOT EXISTS idx_lists_key ON lists (key, id);
+"""
+
+
+class SQLiteBackend(CoordinationBackend):
+    """以共享目錄中的 SQLite 檔案協調同一台主機上的多個程序。
+
+    每個操作都在 ``BEGIN IMMEDIATE`` 交易中完成，由 SQLite 的檔案鎖保證跨程序的原子性；
+    資料庫操作在專用執行緒中進行，不阻塞事件迴圈。
+    """
+
+    def __init__(self, path: Path, busy_timeout: float = 5.0):
+        self.path = Path(path)
+        self.busy_timeout = busy_timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="error_monitor_coordination"
+        )
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.executescript(_SQLITE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, func, *args):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn, time.time(), *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    async def _atomic(self, func, *args):
+        return await self._run(self._transaction, func, *args)
+
+    @staticmethod
+    def _set_nx(conn, now, key, value, ttl):
+        conn.execute("DELETE FROM kv WHERE expires <= ?", (now,))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, now + ttl),
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _compare_and_expire(conn, now, key, value, ttl):
+        cursor = conn.execute(
+            "UPDATE kv SET expires = ? WHERE key = ? AND value = ? AND expires > ?",
+            (now + ttl, key, value, now),
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _compare_and_delete(conn, now, key, value):
+        cursor = conn.execute(
+            "DELETE FROM kv WHERE key = ? AND value = ? AND expires > ?",
+            (key, value, now),
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _take_token(conn, now, key, capacity, rate):
+        row = conn.execute(
+            "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+        ).fetchone()
+        tokens = _refill(*(row or (capacity, now)), capacity, rate, now)
+        wait = 0.0 if tokens >= 1 else _token_wait(tokens, rate)
+        if not wait:
+            tokens -= 1
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+            (key, tokens, now),
+        )
+        return wait
+
+    @staticmethod
+    def _return_token(conn, now, key, capacity):
+        conn.execute(
+            "UPDATE buckets SET tokens = MIN(?, tokens + 1) WHERE key = ?",
+            (capacity, key),
+        )
+
+    @staticmethod
+    def _push(conn, now, key, item):
+        conn.execute("INSERT INTO lists (key, item) VALUES (?, ?)", (key, item))
+
+    @staticmethod
+    def _pop_all(conn, now, key):
+        rows = conn.execute(
+            "SELECT id, item FROM lists WHERE key = ? ORDER BY id", (key,)
+        ).fetchall()
+        if rows:
+            conn.execute(
+                "DELETE FROM lists WHERE key = ? AND id <= ?", (key, rows[-1][0])
+            )
+        return [item for _, item in rows]
+
+    async def set_nx(self, key, value, ttl):
+        return await self._atomic(self._set_nx, key, value, ttl)
+
+    async def compare_and_expire(self, key, value, ttl):
+        return await self._atomic(self._compare_and_expire, key, value, ttl)
+
+    async def compare_and_delete(self, key, value):
+        return await self._atomic(self._compare_and_delete, key, value)
+
+    async def take_token(self, key, capacity, rate):
+        return await self._atomic(self._take_token, key, capacity, rate)
+
+    async def return_token(self, key, capacity):
+        await self._atomic(self._return_token, key, capacity)
+
+    async def push(self, key, item):
+        await self._atomic(self._push, key, item)
+
+    async def pop_all(self, key):
+        return await self._atomic(self._pop_all, key)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+
+_LUA_COMPARE_AND_EXPIRE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_LUA_COMPARE_AND_DELETE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 以 Redis 伺服器時間計算，避免各主機時鐘不一致；返回等待秒數的字串（0 表示成功）
+_LUA_TAKE_TOKEN = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+if now > updated then
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+elseif rate > 0 then
+    wait = (1 - tokens) / rate
+else
+    wait = -1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+return tostring(wait)
+"""
+
+_LUA_RETURN_TOKEN = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + 1)))
+end
+return 0
+"""
+
+
+class RedisBackend(CoordinationBackend):
+    """以 Redis 協調跨主機的實例；需要另外安裝 redis 套件"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError(
+                "使用 redis 協調後端需要安裝 redis 套件（pip install redis）"
+            ) from e
+        self._client = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def set_nx(self, key, value, ttl):
+        return bool(
+            await self._client.set(
+                REDIS_PREFIX + key, value, nx=True, px=max(1, int(ttl * 1000))
+            )
+        )
+
+    async def compare_and_expire(self, key, value, ttl):
+        return bool(
+            await self._client.eval(
+                _LUA_COMPARE_AND_EXPIRE,
+                1,
+                REDIS_PREFIX + key,
+                value,
+                max(1, int(ttl * 1000)),
+            )
+        )
+
+    async def compare_and_delete(self, key, value):
+        return bool(
+            await self._client.eval(
+                _LUA_COMPARE_AND_DELETE, 1, REDIS_PREFIX + key, value
+            )
+        )
+
+    async def take_token(self, key, capacity, rate):
+        wait = float(
+            await self._client.eval(
+                _LUA_TAKE_TOKEN, 1, REDIS_PREFIX + key, capacity, rate
+            )
+        )
+        return float("inf") if wait < 0 else wait
+
+    async def return_token(self, key, capacity):
+        await self._client.eval(_LUA_RETURN_TOKEN, 1, REDIS_PREFIX + key, capacity)
+
+    async def push(self, key, item):
+        await self._client.rpush(REDIS_PREFIX + key, item)
+
+    async def pop_all(self, key):
+        async with self._client.pipeline(transaction=True) as pipe:
+            items, _ = (
+                await pipe.lrange(REDIS_PREFIX + key, 0, -1)
+                .delete(REDIS_PREFIX + key)
+                .execute()
+            )
+        return items
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class Coordinator:
+    """在多個插件實例之間協調郵件發送。
+
+    - 共享令牌桶：所有實例合計的郵件數不超過設定的上限
+    - 指紋去重：同一個指紋（或風暴警報）在去重窗口內只由一個實例發送
+    - 領導者選舉：只有持有租約的領導者發送批次郵件，其他實例把批次轉交給領導者合併；
+      領導者送出後把轉交編號推回來源實例的確認清單，來源實例收到確認才確認自己的持久化日誌
+
+    共享後端不可用時一律退回單機行為（不限流、不去重、各自發送），確保警報不會因此遺失。
+    """
+
+    def __init__(
+        self,
+        backend: CoordinationBackend,
+        instance_id: str = None,
+        lease_seconds: float = 30,
+    ):
+        self.backend = backend
+        self.instance_id = instance_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = max(3.0, float(lease_seconds))
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+        # 統計資訊，供 exception_status 顯示
+        self.forwarded = 0
+        self.collected = 0
+        self.confirmed = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._task = loop.create_task(self._election_loop())
+
+    def _backend_failed(self, action: str, e: Exception):
+        self.errors += 1
+        logger.warning(
+            f"[ErrorMonitor] 協調後端{action}失敗，改為單機行為。異常類型: {type(e).__name__}: {e}"
+        )
+
+    async def _election_loop(self):
+        try:
+            while True:
+                await self.elect()
+                await asyncio.sleep(self.lease_seconds / 3)
+        except asyncio.CancelledError:
+            pass
+
+    async def elect(self) -> bool:
+        """取得或續約領導者租約，返回目前是否為領導者"""
+        try:
+            if self.is_leader:
+                leader = await self.backend.compare_and_expire(
+                    LEADER_KEY, self.instance_id, self.lease_seconds
+                )
+            else:
+                leader = await self.backend.set_nx(
+                    LEADER_KEY, self.instance_id, self.lease_seconds
+                )
+        except Exception as e:
+            self._backend_failed("選舉", e)
+            leader = False
+        if leader != self.is_leader:
+            logger.info(
+                f"[ErrorMonitor] 實例 {self.instance_id} "
+                + ("成為領導者，負責發送批次郵件。" if leader else "不再是領導者。")
+            )
+        self.is_leader = leader
+        return leader
+
+    async def acquire_email(self, capacity: float, rate: float) -> float:
+        """從共享令牌桶取得一封郵件的額度；返回 0 表示成功，否則為需要等待的秒數"""
+        try:
+            return await self.backend.take_token(EMAIL_BUCKET_KEY, capacity, rate)
+        except Exception as e:
+            self._backend_failed("限流", e)
+            return 0.0
+
+    async def return_email(self, capacity: float):
+        try:
+            await self.backend.return_token(EMAIL_BUCKET_KEY, capacity)
+        except Exception as e:
+            self._backend_failed("退還額度", e)
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        """在 ttl 秒內只有第一個宣告 key 的實例返回 True"""
+        try:
+            claimed = await self.backend.set_nx(
+                DEDUP_PREFIX + key, self.instance_id, ttl
+            )
+        except Exception as e:
+            self._backend_failed("去重", e)
+            return True
+        if not claimed:
+            self.duplicates += 1
+        return claimed
+
+    async def forward(self, state: Dict[str, Any]) -> Optional[str]:
+        """把批次轉交給領導者並返回轉交編號；失敗時返回 None，由呼叫者自行發送"""
+        forward_id = uuid.uuid4().hex
+        state = {**state, "id": forward_id, "origin": self.instance_id}
+        try:
+            await self.backend.push(
+                OUTBOX_KEY, json.dumps(state, ensure_ascii=False, default=str)
+            )
+        except Exception as e:
+            self._backend_failed("轉交批次", e)
+            return None
+        self.forwarded += 1
+        return forward_id
+
+    async def collect(self) -> List[Dict[str, Any]]:
+        """領導者取出其他實例轉交的所有批次"""
+        try:
+            items = await self.backend.pop_all(OUTBOX_KEY)
+        except Exception as e:
+            self._backend_failed("讀取轉交批次", e)
+            return []
+        self.collected += len(items)
+        return [json.loads(item) for item in items]
+
+    async def confirm(self, origin: str, forward_id: str):
+        """領導者送出轉交的批次後，通知來源實例可以確認其持久化日誌"""
+        try:
+            await self.backend.push(CONFIRM_PREFIX + origin, forward_id)
+        except Exception as e:
+            # 未確認的報告保留在來源實例的日誌中，重啟後重新發送
+            self._backend_failed("確認轉交批次", e)
+
+    async def confirmations(self) -> List[str]:
+        """取出領導者已送出的本實例轉交編號"""
+        try:
+            items = await self.backend.pop_all(CONFIRM_PREFIX + self.instance_id)
+        except Exception as e:
+            self._backend_failed("讀取轉交確認", e)
+            return []
+        self.confirmed += len(items)
+        return items
+
+    async def close(self):
+        """停止選舉並釋放租約，讓其他實例可以立即接手"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.is_leader:
+            try:
+                await self.backend.compare_and_delete(LEADER_KEY, self.instance_id)
+            except Exception as e:
+                self._backend_failed("釋放租約", e)
+            self.is_leader = False
+        await self.backend.close()
+
+
+def build_coordinator(config, data_dir: Optional[Path]) -> Optional[Coordinator]:
+    """依 coordination 設定建立協調器；未啟用時返回 None"""
+    settings = (config or {}).get("coordination", {})
+    if not settings.get("enable_coordination", False):
+        return None
+    backend_name = settings.get("backend", "sqlite")
+    if backend_name == "redis":
+        backend = RedisBackend(settings.get("redis_url", "redis://localhost:6379/0"))
+    else:
+        shared_dir = settings.get("shared_dir", "").strip()
+        if not shared_dir and not data_dir:
+            logger.error("[ErrorMonitor] 未設定 shared_dir，無法啟用跨實例協調。")
+            return None
+        backend = SQLiteBackend(Path(shared_dir or data_dir) / "coordination.db")
+    return Coordinator(
+        backend,
+        instance_id=settings.get("instance_id", "").strip() or None,
+        lease_seconds=settings.get("leader_lease_seconds", 30),
+    )
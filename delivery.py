@@ -0,0 +1,303 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional, Set
+
+from astrbot.api import logger
+
+Clock = Callable[[], float]
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+
+class DeliveryError(Exception):
+    """郵件投遞失敗；permanent 表示重試也不會成功（例如認證失敗或 5xx 回應）"""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class ConfigurationError(DeliveryError):
+    """郵件服務設定不完整；與 SMTP 伺服器的狀態無關，不計入斷路器"""
+
+    def __init__(self, message: str):
+        super().__init__(message, permanent=True)
+
+
+def classify_smtp_error(error: BaseException) -> str:
+    """將投遞錯誤分類為暫時性（4xx、網路問題）或永久性（5xx、認證失敗）"""
+    if isinstance(error, DeliveryError):
+        return PERMANENT if error.permanent else TRANSIENT
+    # 延遲匯入（見 services.LAZY_MODULES）；投遞失敗時它必定已經載入
+    import aiosmtplib
+
+    if isinstance(
+        error, (aiosmtplib.SMTPAuthenticationError, aiosmtplib.SMTPNotSupported)
+    ):
+        return PERMANENT
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        codes = [e.code for e in error.recipients]
+        return PERMANENT if codes and all(code >= 500 for code in codes) else TRANSIENT
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return PERMANENT if error.code >= 500 else TRANSIENT
+    # 連線中斷、逾時與其他網路錯誤都視為暫時性
+    return TRANSIENT
+
+
+class CircuitBreaker:
+    """斷路器：連續失敗達到門檻後暫停投遞，冷卻後放行一次試探。
+
+    - closed：正常投遞
+    - open：拒絕投遞，直到冷卻時間結束
+    - half_open：冷卻結束後僅放行一次試探，成功則關閉，失敗則以加倍的冷卻時間重新打開
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60,
+        max_reset_timeout: float = 1800,
+        clock: Clock = time.monotonic,
+    ):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_reset_timeout = max(1.0, float(reset_timeout))
+        self.max_reset_timeout = max(self.base_reset_timeout, float(max_reset_timeout))
+        self.clock = clock
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        self.opened_at = 0.0
+        self._probing = False
+
+    def reconfigure(self, failure_threshold: int, reset_timeout: float):
+        """調整門檻與冷卻時間；目前的狀態與連續失敗次數保留，打開中的冷卻照舊計時"""
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_reset_timeout = max(1.0, float(reset_timeout))
+        self.max_reset_timeout = max(self.base_reset_timeout, self.max_reset_timeout)
+        if self.state == self.CLOSED:
+            self.reset_timeout = self.base_reset_timeout
+
+    def time_until_closed(self) -> float:
+        """距離允許下一次投遞的秒數；0 表示現在即可投遞"""
+        if self.state == self.CLOSED:
+            return 0.0
+        if self.state == self.HALF_OPEN:
+            # 已有試探正在進行，其他投遞稍後再試
+            return 1.0 if self._probing else 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        """是否允許本次投遞；在冷卻結束後會轉入 half_open 並放行一次試探"""
+        if self.state == self.OPEN and self.time_until_closed() <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == self.CLOSED
+
+    def end_probe(self):
+        """試探結束但沒有結果時（被取消、設定錯誤）釋放試探，讓下一次投遞重新試探"""
+        self._probing = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN:
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            logger.warning(
+                f"[ErrorMonitor] SMTP 連續失敗 {self.consecutive_failures} 次，"
+                f"斷路器打開，{self.reset_timeout:.0f} 秒內暫停投遞。"
+            )
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        self._probing = False
+
+
+class DeliveryManager:
+    """帶重試與斷路器的郵件投遞。
+
+    第一次投遞會直接等待結果；暫時性失敗會在背景以帶抖動的指數退避重試，
+    永久性失敗或重試次數用盡時呼叫 ``on_failure``，成功時呼叫 ``on_success``；
+    投遞在送出前被取消（例如插件停止）時只呼叫 ``on_cancel``，讓呼叫端退還預扣的額度。
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Any], Awaitable[None]],
+        breaker: Optional[CircuitBreaker] = None,
+        max_attempts: int = 5,
+        base_delay: float = 5,
+        max_delay: float = 600,
+        max_pending: int = 100,
+        rng: Callable[[float, float], float] = random.uniform,
+    ):
+        self._send = send
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+        self.max_pending = max(0, int(max_pending))
+        self._rng = rng
+        self._retry_tasks: Set[asyncio.Task] = set()
+
+        # 統計資訊，供 exception_status 顯示
+        self.delivered = 0
+        self.retried = 0
+        self.transient_failures = 0
+        self.permanent_failures = 0
+        self.given_up = 0
+        self.last_error: Optional[str] = None
+
+    def reconfigure(self, max_attempts: int, base_delay: float, max_delay: float):
+        """調整重試次數與退避時間；已排程的重試照原定時間進行，之後的嘗試使用新設定"""
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+
+    @property
+    def pending_retries(self) -> int:
+        return len(self._retry_tasks)
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失敗後的等待時間（full jitter 指數退避）"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return self._rng(0, ceiling)
+
+    async def submit(
+        self,
+        message: Any,
+        on_success: Callable[[], None] = None,
+        on_failure: Callable[[bool], None] = None,
+        on_cancel: Callable[[], None] = None,
+    ) -> bool:
+        """投遞一封已組裝好的郵件；返回第一次嘗試是否成功（失敗時可能仍在背景重試）"""
+        return await self._attempt(message, 1, on_success, on_failure, on_cancel)
+
+    async def _attempt(
+        self, message, attempt, on_success, on_failure, on_cancel
+    ) -> bool:
+        if not self.breaker.allow():
+            self._schedule_retry(
+                message, attempt, on_success, on_failure, on_cancel, open_circuit=True
+            )
+            return False
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            await self._send(message)
+        except asyncio.CancelledError:
+            # 被取消的投遞不算失敗：只退還額度，不計入捨棄，報告留在持久化日誌中於下次啟動時重送
+            if on_cancel:
+                on_cancel()
+            raise
+        except Exception as e:
+            kind = classify_smtp_error(e)
+            self.last_error = f"{type(e).__name__} ({kind})"
+            if kind == PERMANENT:
+                self.permanent_failures += 1
+                # 永久性錯誤（例如認證失敗）同樣代表伺服器目前不可用；
+                # 但郵件服務未配置是本地的設定問題，不影響斷路器
+                if not isinstance(e, ConfigurationError):
+                    self.breaker.record_failure()
+                logger.error(
+                    f"發送郵件失敗（永久性錯誤，不再重試）。異常類型: {type(e).__name__}"
+                )
+                self._fail(on_failure, permanent=True)
+                return False
+
+            self.transient_failures += 1
+            self.breaker.record_failure()
+            if attempt >= self.max_attempts:
+                logger.error(
+                    f"發送郵件失敗，已重試 {attempt} 次仍未成功，放棄投遞。異常類型: {type(e).__name__}"
+                )
+                self._fail(on_failure, permanent=False)
+                return False
+            logger.warning(
+                f"發送郵件失敗（暫時性錯誤），將稍後重試。異常類型: {type(e).__name__}"
+            )
+            self._schedule_retry(
+                message, attempt + 1, on_success, on_failure, on_cancel
+            )
+            return False
+        finally:
+            # 試探被取消（例如重新載入或批處理任務被取消）時不會記錄成功或失敗，
+            # 必須釋放試探，否則斷路器會永遠停在 half_open 並延後所有投遞
+            if probe:
+                self.breaker.end_probe()
+
+        self.breaker.record_success()
+        self.delivered += 1
+        if on_success:
+            on_success()
+        return True
+
+    def _schedule_retry(
+        self, message, attempt, on_success, on_failure, on_cancel, open_circuit=False
+    ):
+        if len(self._retry_tasks) >= self.max_pending:
+            logger.error("[ErrorMonitor] 待重試的郵件過多，放棄本次投遞。")
+            self._fail(on_failure, permanent=False)
+            return
+        if open_circuit:
+            delay = max(self.breaker.time_until_closed(), 1.0)
+        else:
+            delay = self.backoff(attempt - 1)
+        task = asyncio.get_running_loop().create_task(
+            self._retry_after(
+                delay, message, attempt, on_success, on_failure, on_cancel
+            )
+        )
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+        if on_cancel:
+            # 尚未開始執行就被取消的任務不會進入 _retry_after，在此退還額度
+            task.add_done_callback(lambda t: t.cancelled() and on_cancel())
+
+    async def _retry_after(
+        self, delay, message, attempt, on_success, on_failure, on_cancel
+    ):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # 插件停止時放棄等待；報告仍保留在持久化日誌中，重啟後會重放
+            if on_cancel:
+                on_cancel()
+            return
+        self.retried += 1
+        try:
+            await self._attempt(message, attempt, on_success, on_failure, on_cancel)
+        except asyncio.CancelledError:
+            # _attempt 已呼叫過 on_cancel
+            pass
+
+    def _fail(self, on_failure, permanent: bool):
+        if not permanent:
+            self.given_up += 1
+        if on_failure:
+            on_failure(permanent)
+
+    async def close(self):
+        """取消所有待重試的投遞"""
+        tasks = list(self._retry_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,329 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from astrbot.api import logger
+
+from .records import ExceptionRecord
+
+# 摘要週期：名稱 -> (顯示名稱, 名義長度秒數)
+PERIODS = {"hourly": ("每小時", 3600), "daily": ("每日", 86400)}
+
+# 每個週期中每種維度最多保留的鍵數，超出的鍵併入「其他」，確保狀態大小固定
+MAX_KEYS = 200
+MAX_FINGERPRINTS = 2000
+OTHER = "其他"
+# 判斷「新錯誤」時記住的指紋數量上限（最久未出現的先淘汰）
+MAX_KNOWN_FINGERPRINTS = 10000
+# 尚未送出的摘要上限（例如郵件服務長時間不可用）
+MAX_PENDING_DIGESTS = 48
+
+SendDigest = Callable[
+    [Dict[str, Any], Callable[[], None], Callable[[bool], None]], Awaitable[None]
+]
+
+
+def period_start(period: str, ts: float) -> float:
+    """返回 ts 所在週期的開始時間（本地時間的整點或午夜）"""
+    t = time.localtime(ts)
+    hour = t.tm_hour if period == "hourly" else 0
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, hour, 0, 0, 0, 0, -1))
+
+
+def next_period_start(period: str, start: float) -> float:
+    # 以 1.5 倍名義長度再取整，日光節約時間造成的 23/25 小時的日子也能正確對齊
+    return period_start(period, start + PERIODS[period][1] * 1.5)
+
+
+def _bump(counts: Dict[str, int], key: str, n: int = 1):
+    if key not in counts and len(counts) >= MAX_KEYS:
+        key = OTHER
+    counts[key] = counts.get(key, 0) + n
+
+
+def _top(counts: Dict[str, int], n: int) -> List[List]:
+    return [
+        [key, counts[key]]
+        for key in sorted(counts, key=counts.__getitem__, reverse=True)[:n]
+    ]
+
+
+class PeriodCounters:
+    """單一摘要週期的累計計數；於擷取時增量更新，可序列化以便跨重啟延續"""
+
+    def __init__(self, period: str, start: float):
+        self.period = period
+        self.start = start
+        self.end = next_period_start(period, start)
+        self.total = 0
+        self.keywords: Dict[str, int] = {}
+        self.platforms: Dict[str, int] = {}
+        self.groups: Dict[str, int] = {}
+        # 指紋 -> [關鍵字, 次數, 是否為本週期首次出現]
+        self.fingerprints: Dict[str, List] = {}
+        self.untracked = 0  # 超出指紋上限、未分類為新/既有的報告數
+
+    def observe(self, record: ExceptionRecord, known: bool):
+        self.total += 1
+        _bump(self.keywords, str(record.keyword))
+        _bump(self.platforms, str(record.platform))
+        if record.is_group:
+            _bump(self.groups, str(record.group_id))
+        entry = self.fingerprints.get(record.fingerprint)
+        if entry is not None:
+            entry[1] += 1
+        elif len(self.fingerprints) < MAX_FINGERPRINTS:
+            self.fingerprints[record.fingerprint] = [str(record.keyword), 1, not known]
+        else:
+            self.untracked += 1
+
+    def totals(self) -> Dict[str, Any]:
+        """供下一個週期比較趨勢用的精簡數據"""
+        return {"total": self.total, "keywords": dict(self.keywords)}
+
+    def summary(
+        self, previous: Optional[Dict[str, Any]], top_n: int, catch_up: bool
+    ) -> Dict[str, Any]:
+        new = [entry for entry in self.fingerprints.values() if entry[2]]
+        recurring = [entry for entry in self.fingerprints.values() if not entry[2]]
+        previous_keywords = previous["keywords"] if previous else {}
+        return {
+            "period": self.period,
+            "label": PERIODS[self.period][0],
+            "start": self.start,
+            "end": self.end,
+            "catch_up": catch_up,
+            "total": self.total,
+            "previous_total": previous["total"] if previous else None,
+            "keywords": [
+                [key, count, previous_keywords.get(key, 0) if previous else None]
+                for key, count in _top(self.keywords, top_n)
+            ],
+            "platforms": _top(self.platforms, top_n),
+            "groups": _top(self.groups, top_n),
+            "new_kinds": len(new),
+            "new_reports": sum(entry[1] for entry in new),
+            "recurring_kinds": len(recurring),
+            "recurring_reports": sum(entry[1] for entry in recurring),
+            "untracked": self.untracked,
+            "new_errors": sorted(new, key=lambda entry: entry[1], reverse=True)[:top_n],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "start": self.start,
+            "total": self.total,
+            "keywords": dict(self.keywords),
+            "platforms": dict(self.platforms),
+            "groups": dict(self.groups),
+            "fingerprints": dict(self.fingerprints),
+            "untracked": self.untracked,
+        }
+
+    @classmethod
+    def from_dict(cls, period: str, data: Dict[str, Any]) -> "PeriodCounters":
+        counters = cls(period, data["start"])
+        counters.total = data.get("total", 0)
+        counters.keywords = data.get("keywords", {})
+        counters.platforms = data.get("platforms", {})
+        counters.groups = data.get("groups", {})
+        counters.fingerprints = data.get("fingerprints", {})
+        counters.untracked = data.get("untracked", 0)
+        return counters
+
+
+class DigestScheduler:
+    """定期（每小時/每日）摘要報告的排程器。
+
+    計數在每筆報告擷取時增量更新，週期結束時產生摘要並交給 ``send`` 發送，
+    不需要重新掃描原始事件。計數、上一週期的數據與尚未送出的摘要都保存在 ``path``，
+    插件重啟後會補發停機期間結束的週期，且每個週期只會成功發送一次。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        periods: List[str],
+        send: SendDigest,
+        top_n: int = 10,
+        skip_empty: bool = True,
+        save_interval: float = 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = Path(path)
+        self.periods = [period for period in periods if period in PERIODS]
+        self.send = send
+        self.top_n = max(1, int(top_n))
+        self.skip_empty = skip_empty
+        self.save_interval = max(1.0, float(save_interval))
+        self.clock = clock
+
+        self.current: Dict[str, PeriodCounters] = {}
+        self.previous: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.known: Dict[str, float] = {}
+        self.pending: List[Dict[str, Any]] = []
+        self._in_flight = set()
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+        # 統計資訊
+        self.sent = 0
+
+    async def open(self, loop: asyncio.AbstractEventLoop):
+        """載入保存的狀態，結算停機期間已結束的週期，並在 loop 上啟動排程任務"""
+        state = await asyncio.to_thread(self._load)
+        now = self.clock()
+        for period in self.periods:
+            saved = state.get("current", {}).get(period)
+            self.current[period] = (
+                PeriodCounters.from_dict(period, saved)
+                if saved
+                else PeriodCounters(period, period_start(period, now))
+            )
+            self.previous[period] = state.get("previous", {}).get(period)
+        self.known = state.get("known", {})
+        self.pending = [
+            summary
+            for summary in state.get("pending", [])
+            if summary.get("period") in self.periods
+        ]
+        self._roll(now, catch_up=True)
+        self._task = loop.create_task(self._loop())
+
+    def observe(self, record: ExceptionRecord):
+        """於擷取時更新所有週期的計數"""
+        now = self.clock()
+        self._roll(now)
+        known = record.fingerprint in self.known
+        for counters in self.current.values():
+            counters.observe(record, known)
+        # 移到字典末端，淘汰時優先移除最久未出現的指紋
+        self.known.pop(record.fingerprint, None)
+        self.known[record.fingerprint] = now
+        if len(self.known) > MAX_KNOWN_FINGERPRINTS:
+            del self.known[next(iter(self.known))]
+        self._dirty = True
+
+    def _roll(self, now: float, catch_up: bool = False):
+        """結算所有已結束的週期，將摘要放入待發送清單"""
+        for period, counters in self.current.items():
+            if now < counters.end:
+                continue
+            if counters.total or not self.skip_empty:
+                self.pending.append(
+                    counters.summary(self.previous[period], self.top_n, catch_up)
+                )
+            start = period_start(period, now)
+            # 停機跨越多個週期時，中間的週期沒有數據，無法比較趨勢
+            self.previous[period] = counters.totals() if counters.end == start else None
+            self.current[period] = PeriodCounters(period, start)
+            self._dirty = True
+        if len(self.pending) > MAX_PENDING_DIGESTS:
+            del self.pending[: len(self.pending) - MAX_PENDING_DIGESTS]
+
+    def _next_wakeup(self) -> float:
+        until_end = (
+            min((counters.end for counters in self.current.values()), default=0)
+            - self.clock()
+        )
+        return max(0.1, min(self.save_interval, until_end + 0.1))
+
+    async def _loop(self):
+        try:
+            while True:
+                await asyncio.sleep(self._next_wakeup())
+                try:
+                    self._roll(self.clock())
+                    await self._send_pending()
+                    if self._dirty:
+                        await self.save()
+                except Exception as e:
+                    logger.error(f"[ErrorMonitor] 摘要報告排程失敗: {e}", exc_info=True)
+        except asyncio.CancelledError:
+            pass
+
+    async def _send_pending(self):
+        for summary in list(self.pending):
+            key = (summary["period"], summary["start"])
+            if key in self._in_flight:
+                continue
+            self._in_flight.add(key)
+            try:
+                await self.send(
+                    summary, self._on_sent(summary, key), self._on_failed(summary, key)
+                )
+            except BaseException:
+                # send 本身拋出（或被取消）時不會再呼叫回呼；
+                # 必須在此釋放，否則這份摘要會一直被視為發送中而永遠不會重送
+                self._in_flight.discard(key)
+                raise
+
+    def _on_sent(self, summary, key):
+        def on_success():
+            self._in_flight.discard(key)
+            if summary in self.pending:
+                self.pending.remove(summary)
+            self.sent += 1
+            self._dirty = True
+
+        return on_success
+
+    def _on_failed(self, summary, key):
+        def on_failure(permanent: bool):
+            self._in_flight.discard(key)
+            # 暫時性失敗保留在待發送清單中，於下一次排程時重試
+            if permanent and summary in self.pending:
+                self.pending.remove(summary)
+                self._dirty = True
+
+        return on_failure
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """複製各容器的淺層副本，讓序列化能在執行緒中進行而不受事件迴圈上的更新影響"""
+        return {
+            "current": {
+                period: counters.to_dict() for period, counters in self.current.items()
+            },
+            "previous": dict(self.previous),
+            "known": dict(self.known),
+            "pending": list(self.pending),
+        }
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"[ErrorMonitor] 讀取摘要報告狀態失敗，將重新開始計數: {e}")
+            return {}
+
+    def _write(self, snapshot: Dict[str, Any]):
+        text = json.dumps(snapshot, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        """以原子替換的方式保存狀態。
+
+        事件迴圈上只複製容器，序列化（known 最多上萬筆）與寫入都在執行緒中進行。
+        """
+        snapshot = self._snapshot()
+        self._dirty = False
+        await asyncio.to_thread(self._write, snapshot)
+
+    async def close(self):
+        """停止排程並保存狀態；未結束的週期於下次啟動時繼續累計"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            await self.save()
+        except OSError as e:
+            logger.error(f"[ErrorMonitor] 保存摘要報告狀態失敗: {e}")
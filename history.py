@@ -0,0 +1,305 @@
+import asyncio
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .records import ExceptionRecord, format_time
+
+# 可用於查詢的欄位（查詢參數名稱 -> 資料表欄位），每個欄位都有 (欄位, ts) 複合索引
+SEARCH_FIELDS = {
+    "platform": "platform",
+    "sender": "sender_id",
+    "sender_id": "sender_id",
+    "group": "group_id",
+    "group_id": "group_id",
+    "keyword": "keyword",
+    "fingerprint": "fingerprint",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS errors (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    timestamp TEXT,
+    platform TEXT,
+    sender TEXT,
+    sender_id TEXT,
+    group_id TEXT,
+    keyword TEXT,
+    fingerprint TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_errors_ts ON errors (ts);
+CREATE INDEX IF NOT EXISTS idx_errors_platform ON errors (platform, ts);
+CREATE INDEX IF NOT EXISTS idx_errors_sender ON errors (sender_id, ts);
+CREATE INDEX IF NOT EXISTS idx_errors_group ON errors (group_id, ts);
+CREATE INDEX IF NOT EXISTS idx_errors_keyword ON errors (keyword, ts);
+CREATE INDEX IF NOT EXISTS idx_errors_fingerprint ON errors (fingerprint, ts);
+"""
+
+# 資料表欄位，也是匯出檔案的欄位順序
+COLUMNS = (
+    "id",
+    "ts",
+    "timestamp",
+    "platform",
+    "sender",
+    "sender_id",
+    "group_id",
+    "keyword",
+    "fingerprint",
+    "message",
+)
+
+# 保留期清理時每次刪除的列數，避免長時間持有寫入鎖
+_PURGE_CHUNK = 10_000
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+
+
+def parse_time(value: str, now: float = None) -> float:
+    """將 "30m"、"1h"、"7d" 等相對時間或 "2024-01-01 12:00" 等絕對時間轉為 UNIX 時間戳"""
+    now = time.time() if now is None else now
+    match = _DURATION_RE.match(value.strip().lower())
+    if match:
+        return now - float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+    try:
+        return datetime.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"無法解析時間「{value}」，請使用 30m、1h、7d 或 2024-01-01 12:00"
+        )
+
+
+def _where(
+    filters: Dict[str, str], since: Optional[float], until: Optional[float]
+) -> Tuple[str, List[Any]]:
+    clauses, params = [], []
+    for name, value in filters.items():
+        clauses.append(f"{SEARCH_FIELDS[name]} = ?")
+        params.append(value)
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < ?")
+        params.append(until)
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def iter_history(
+    path: Path,
+    filters: Dict[str, str] = None,
+    since: float = None,
+    until: float = None,
+    chunk_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    """依時間由舊到新逐筆讀出歷史記錄，每次只從資料庫取 chunk_size 筆，記憶體佔用固定。
+
+    以唯讀模式開啟，可以在插件運行時對同一個資料庫使用（WAL 模式下不會阻塞寫入）。
+    """
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        where, params = _where(filters or {}, since, until)
+        cursor = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM errors {where} ORDER BY ts, id",
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(COLUMNS, row))
+    finally:
+        conn.close()
+
+
+class HistoryStore:
+    """以 SQLite 保存可查詢的異常歷史。
+
+    寫入先累積在記憶體中，由背景任務定期（或累積到 ``batch_size`` 筆時）以單一交易批次寫入；
+    所有資料庫操作都在同一條專用執行緒中進行，不阻塞事件迴圈。
+    超過 ``retention_days`` 的記錄會定期分批刪除並回收空間。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        retention_days: float = 30,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        purge_interval: float = 3600,
+        page_size: int = 10,
+    ):
+        self.path = Path(path)
+        self.retention_seconds = max(0.0, float(retention_days)) * 86400
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self.page_size = max(1, int(page_size))
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="error_monitor_history"
+        )
+        self._pending: List[Tuple] = []
+        self._wakeup = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._last_purge = 0.0
+
+        # 統計資訊
+        self.inserted = 0
+        self.purged = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    async def open(self):
+        await self._run(self._open)
+        self._writer_task = asyncio.get_running_loop().create_task(self._writer_loop())
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        # auto_vacuum 只能在建立資料表前設定，對既有資料庫不會生效
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self._conn = conn
+
+    def add(self, record: ExceptionRecord):
+        """登記一筆異常；實際寫入由背景任務批次完成"""
+        if self._closed:
+            return
+        # 時間字串在寫入執行緒中才格式化
+        self._pending.append(
+            (
+                record.timestamp or time.time(),
+                record.platform,
+                record.sender,
+                record.sender_id,
+                record.group_id,
+                record.keyword,
+                record.fingerprint,
+                record.message,
+            )
+        )
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _writer_loop(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                if time.time() - self._last_purge >= self.purge_interval:
+                    await self._run(self._purge)
+            except Exception as e:
+                logger.error(f"[ErrorMonitor] 寫入異常歷史失敗: {e}")
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        await self._run(self._insert, rows)
+
+    def _insert(self, rows: List[Tuple]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO errors (ts, timestamp, platform, sender, sender_id,"
+                " group_id, keyword, fingerprint, message)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((row[0], format_time(row[0]), *row[1:]) for row in rows),
+            )
+        self.inserted += len(rows)
+
+    def _purge(self):
+        """刪除超過保留期的記錄並回收空間"""
+        self._last_purge = time.time()
+        if not self.retention_seconds:
+            return
+        cutoff = self._last_purge - self.retention_seconds
+        while True:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM errors WHERE id IN"
+                    " (SELECT id FROM errors WHERE ts < ? LIMIT ?)",
+                    (cutoff, _PURGE_CHUNK),
+                )
+            self.purged += cursor.rowcount
+            if cursor.rowcount < _PURGE_CHUNK:
+                break
+        self._conn.execute("PRAGMA incremental_vacuum")
+        # 更新查詢規劃器的統計資訊，多條件查詢時才能選到選擇性最高的索引
+        self._conn.execute("PRAGMA optimize")
+
+    async def search(
+        self,
+        filters: Dict[str, str] = None,
+        since: float = None,
+        until: float = None,
+        before: Tuple[float, int] = None,
+        page_size: int = None,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """依條件查詢歷史記錄（由新到舊）；返回 (本頁記錄, 是否還有下一頁)。
+
+        以鍵集分頁：下一頁傳入本頁最後一筆的 (ts, id) 作為 before，
+        查詢直接從索引中的該位置繼續，頁數再深也不需要掃描並丟棄前面的記錄。
+        """
+        # 先寫入尚未提交的記錄，確保剛發生的異常也能查到
+        await self._flush()
+        return await self._run(
+            self._search,
+            filters or {},
+            since,
+            until,
+            before,
+            page_size or self.page_size,
+        )
+
+    def _search(self, filters, since, until, before, page_size):
+        where, params = _where(filters, since, until)
+        if before is not None:
+            # 列值比較可以直接使用 (欄位, ts) 索引（隱含 rowid 即 id）定位起點
+            where += f"{' AND' if where else 'WHERE'} (ts, id) < (?, ?)"
+            params.extend(before)
+        # 多取一筆以判斷是否還有下一頁，避免對大量資料執行 COUNT
+        cursor = self._conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM errors {where}"
+            " ORDER BY ts DESC, id DESC LIMIT ?",
+            (*params, page_size + 1),
+        )
+        rows = [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+        return rows[:page_size], len(rows) > page_size
+
+    async def close(self):
+        """寫入剩餘的記錄並關閉資料庫"""
+        self._closed = True
+        self._wakeup.set()
+        if self._writer_task:
+            await asyncio.gather(self._writer_task, return_exceptions=True)
+        if self._conn:
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"[ErrorMonitor] 寫入異常歷史失敗: {e}")
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from astrbot.api import logger
+
+from .records import ExceptionRecord
+
+
+class IngestQueue:
+    """有界的異常報告佇列，將事件鉤子與報告處理解耦。
+
+    事件鉤子只負責擷取記錄並以 ``put_nowait`` 放入佇列，實際處理（指紋、持久化、
+    批處理與郵件發送）由固定數量的背景 worker 完成。佇列已滿時直接捨棄新的報告並計數，
+    確保鉤子永遠不會因為下游變慢而阻塞使用者的回覆流程。
+    """
+
+    def __init__(self, processor, max_size: int = 1000, workers: int = 2):
+        self.processor = processor
+        self.max_size = max(1, int(max_size))
+        self.worker_count = max(1, int(workers))
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+        # 統計資訊，供 exception_status 顯示
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.high_water = 0
+
+        metrics = processor.metrics
+        self.wait_latency = metrics.histogram(
+            "ingest_wait_seconds", "報告從放入佇列到開始處理的等待時間"
+        )
+        self.process_latency = metrics.histogram(
+            "ingest_process_seconds", "單筆報告的處理耗時（指紋、持久化、批處理）"
+        )
+        self.dropped_reports = metrics.counter(
+            "reports_dropped_total", "未能送出或被捨棄的異常報告數", ("reason",)
+        )
+        metrics.gauge("ingest_queue_depth", "報告佇列目前的深度", lambda: self.depth)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """在指定的事件迴圈上建立佇列與 worker"""
+        self._queue = asyncio.Queue(self.max_size)
+        self._workers = [
+            loop.create_task(self._worker()) for _ in range(self.worker_count)
+        ]
+
+    def submit(self, record: ExceptionRecord) -> bool:
+        """放入一筆報告；佇列已滿時捨棄並返回 False"""
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait((record, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self.dropped_reports.inc("queue_full")
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(
+                    f"[ErrorMonitor] 異常報告佇列已滿，已捨棄 {self.dropped} 則報告。"
+                )
+            return False
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    async def _worker(self):
+        while True:
+            record, enqueued_at = await self._queue.get()
+            started = time.perf_counter()
+            self.wait_latency.observe(started - enqueued_at)
+            try:
+                await self.processor.process_record(record)
+                self.processed += 1
+                self.process_latency.observe(time.perf_counter() - started)
+            except Exception as e:
+                self.failed += 1
+                logger.error(
+                    f"[ErrorMonitor] 處理異常報告時發生錯誤: {e}", exc_info=True
+                )
+            finally:
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = 10):
+        """等待佇列中剩餘的報告處理完畢，然後停止所有 worker"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"[ErrorMonitor] 等待異常報告佇列清空逾時，仍有 {self.depth} 則報告未處理。"
+            )
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,274 @@
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional, Set
+
+Clock = Callable[[], float]
+
+HOUR = 3600.0
+
+# 令牌桶數量達到此值時才開始清理閒置的令牌桶
+MIN_SWEEP_SIZE = 64
+
+
+class TokenBucket:
+    """令牌桶：以固定速率補充令牌，容量即允許的突發數量"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated", "clock")
+
+    def __init__(self, capacity: float, rate: float, clock: Clock = time.monotonic):
+        self.capacity = max(1.0, float(capacity))
+        self.rate = max(0.0, float(rate))  # 每秒補充的令牌數
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        if now > self.updated:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def time_until_available(self) -> float:
+        """距離下一個令牌可用的秒數；0 表示目前即可取得"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        """令牌已補滿：與新建的令牌桶沒有區別，可以安全地丟棄"""
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def refund(self):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def reconfigure(self, capacity: float, rate: float):
+        """調整容量與補充速率，保留目前的令牌數（不超過新容量），已用掉的額度不會因此重置"""
+        self._refill()
+        self.capacity = max(1.0, float(capacity))
+        self.rate = max(0.0, float(rate))
+        self.tokens = min(self.capacity, self.tokens)
+
+
+class BucketGroup:
+    """依鍵（收件人或關鍵字）各自建立的令牌桶，每個鍵每小時最多 limit 次；limit 為 0 表示不限制。
+
+    已補滿的閒置令牌桶在數量增長到上次清理後的兩倍時被丟棄，
+    因此記憶體佔用只與近期活躍的鍵數量相關，清理成本均攤為 O(1)。
+    """
+
+    __slots__ = ("limit", "clock", "_buckets", "_sweep_at")
+
+    def __init__(self, limit: int, clock: Clock = time.monotonic):
+        self.limit = max(0, int(limit))
+        self.clock = clock
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._sweep_at = MIN_SWEEP_SIZE
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: str) -> Optional[TokenBucket]:
+        if not self.limit:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._sweep_at:
+                self._sweep()
+            bucket = self._buckets[key] = TokenBucket(
+                self.limit, self.limit / HOUR, self.clock
+            )
+        return bucket
+
+    def _sweep(self):
+        for key in [k for k, bucket in self._buckets.items() if bucket.is_full()]:
+            del self._buckets[key]
+        self._sweep_at = max(MIN_SWEEP_SIZE, 2 * len(self._buckets))
+
+    def reconfigure(self, limit: int):
+        """調整上限並保留各令牌桶的剩餘令牌；取消上限時丟棄所有令牌桶"""
+        self.limit = max(0, int(limit))
+        if not self.limit:
+            self._buckets.clear()
+        for bucket in self._buckets.values():
+            bucket.reconfigure(self.limit, self.limit / HOUR)
+
+
+class SlidingWindowLog:
+    """滑動窗口日誌：保證任意 window 秒內最多 limit 次；每次檢查均攤 O(1)"""
+
+    __slots__ = ("limit", "window", "clock", "_log")
+
+    def __init__(self, limit: int, window: float = HOUR, clock: Clock = time.monotonic):
+        self.limit = max(0, int(limit))
+        self.window = window
+        self.clock = clock
+        self._log: Deque[float] = deque()
+
+    def __len__(self) -> int:
+        self._evict(self.clock())
+        return len(self._log)
+
+    def _evict(self, now: float):
+        while self._log and self._log[0] <= now - self.window:
+            self._log.popleft()
+
+    def time_until_available(self) -> float:
+        now = self.clock()
+        self._evict(now)
+        if len(self._log) < self.limit:
+            return 0.0
+        if not self._log:
+            return float("inf")
+        return self._log[0] + self.window - now
+
+    def try_acquire(self) -> bool:
+        if self.time_until_available() > 0:
+            return False
+        self._log.append(self.clock())
+        return True
+
+    def refund(self):
+        if self._log:
+            self._log.pop()
+
+
+class RateLimiter:
+    """郵件發送限流器。
+
+    全域層級同時使用令牌桶（限制突發）與滑動窗口（保證任意一小時內不超過上限），
+    另可為每位收件人與每個關鍵字設定獨立的每小時上限（見 BucketGroup，0 表示不限制）。
+    所有時間皆取自可注入的 ``clock``，方便在測試或重放中模擬時間。
+    """
+
+    def __init__(
+        self,
+        max_per_hour: int,
+        burst: int = 0,
+        per_recipient_per_hour: int = 0,
+        per_keyword_per_hour: int = 0,
+        clock: Clock = time.monotonic,
+    ):
+        self.clock = clock
+        self.max_per_hour = max(0, int(max_per_hour))
+        self.burst = int(burst) if burst and burst > 0 else max(1, self.max_per_hour)
+        self.per_recipient_per_hour = max(0, int(per_recipient_per_hour))
+        self.per_keyword_per_hour = max(0, int(per_keyword_per_hour))
+
+        self.bucket = TokenBucket(self.burst, self.max_per_hour / HOUR, clock)
+        self.window = SlidingWindowLog(self.max_per_hour, HOUR, clock)
+        self._recipient_buckets = BucketGroup(self.per_recipient_per_hour, clock)
+        self._keyword_buckets = BucketGroup(self.per_keyword_per_hour, clock)
+
+        self.granted = 0
+        self.denied = 0
+
+    @property
+    def sent_last_hour(self) -> int:
+        return len(self.window)
+
+    @property
+    def tokens(self) -> float:
+        self.bucket._refill()
+        return self.bucket.tokens
+
+    def _recipient_bucket(self, recipient: str) -> Optional[TokenBucket]:
+        return self._recipient_buckets.get(recipient)
+
+    def _keyword_bucket(self, keyword: str) -> Optional[TokenBucket]:
+        return self._keyword_buckets.get(keyword)
+
+    def _global_limiters(self, recipients: Iterable[str]):
+        limiters = [self.bucket, self.window]
+        for recipient in recipients:
+            bucket = self._recipient_bucket(recipient)
+            if bucket is not None:
+                limiters.append(bucket)
+        return limiters
+
+    def time_until_available(
+        self, recipients: Iterable[str] = (), keywords: Iterable[str] = ()
+    ) -> float:
+        """距離可以發送下一封郵件的秒數（至少一個關鍵字可用時）"""
+        wait = max(
+            limiter.time_until_available()
+            for limiter in self._global_limiters(recipients)
+        )
+        keyword_buckets = [
+            b for b in (self._keyword_bucket(k) for k in keywords) if b is not None
+        ]
+        if keyword_buckets:
+            wait = max(wait, min(b.time_until_available() for b in keyword_buckets))
+        return wait
+
+    def acquire(
+        self, recipients: Iterable[str] = (), keywords: Iterable[str] = ()
+    ) -> Optional[Set[str]]:
+        """嘗試取得一封郵件的發送額度。
+
+        返回允許發送的關鍵字集合；若全域/收件人額度不足或所有關鍵字都已超限，返回 None。
+        只有在成功時才會扣除額度。
+        """
+        limiters = self._global_limiters(recipients)
+        if any(limiter.time_until_available() > 0 for limiter in limiters):
+            self.denied += 1
+            return None
+
+        keywords = set(keywords)
+        allowed = set()
+        for keyword in keywords:
+            bucket = self._keyword_bucket(keyword)
+            if bucket is None or bucket.try_acquire():
+                allowed.add(keyword)
+        if keywords and not allowed:
+            self.denied += 1
+            return None
+
+        for limiter in limiters:
+            limiter.try_acquire()
+        self.granted += 1
+        return allowed
+
+    def refund(self, recipients: Iterable[str] = (), keywords: Iterable[str] = ()):
+        """退還一次 acquire 所扣除的額度"""
+        for limiter in self._global_limiters(recipients):
+            limiter.refund()
+        for keyword in keywords:
+            bucket = self._keyword_bucket(keyword)
+            if bucket is not None:
+                bucket.refund()
+        self.granted = max(0, self.granted - 1)
+
+    def reconfigure(
+        self,
+        max_per_hour: int,
+        burst: int = 0,
+        per_recipient_per_hour: int = 0,
+        per_keyword_per_hour: int = 0,
+    ):
+        """就地調整上限。
+
+        滑動窗口的發送記錄與各令牌桶的剩餘令牌都會保留，因此調整後最近一小時內
+        已送出的郵件仍會計入新的上限；取消收件人或關鍵字上限時丟棄對應的令牌桶。
+        """
+        self.max_per_hour = max(0, int(max_per_hour))
+        self.burst = int(burst) if burst and burst > 0 else max(1, self.max_per_hour)
+        self.bucket.reconfigure(self.burst, self.max_per_hour / HOUR)
+        self.window.limit = self.max_per_hour
+        self.per_recipient_per_hour = max(0, int(per_recipient_per_hour))
+        self.per_keyword_per_hour = max(0, int(per_keyword_per_hour))
+        self._recipient_buckets.reconfigure(self.per_recipient_per_hour)
+        self._keyword_buckets.reconfigure(self.per_keyword_per_hour)
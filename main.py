@@ -1,6 +1,10 @@
+import time
+
+_import_started = time.perf_counter()
+
 import asyncio
 import re
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from astrbot.api import logger, AstrBotConfig
 from astrbot.api.event import filter, AstrMessageEvent
@@ -8,12 +12,17 @@ from astrbot.api.star import Context, Star, StarTools
 from astrbot.core.message.components import Plain
 from astrbot.core.message.message_event_result import MessageChain
 
-from .commands import (
-    handle_clear_cache,
-    handle_exception_status,
-    handle_test_email,
-)
-from .services import EmailService, ExceptionProcessor
+from .records import parse_report
+
+if TYPE_CHECKING:
+    from .ingest import IngestQueue
+    from .metrics import PrometheusFileExporter
+    from .services import EmailService, ExceptionProcessor
+    from .watchdog import LoopWatchdog
+
+# 服務、指令與 SMTP 相關模組都在 initialize 或第一次使用時才匯入，
+# 監控停用時載入插件只需匯入本模組與 records
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 
 class ExceptionMonitorPlugin(Star):
@@ -24,54 +33,183 @@ class ExceptionMonitorPlugin(Star):
         self.enable_monitoring = self.general_config.get("enable_monitoring", True)
 
         # 將服務初始化延遲到 initialize，因為 __init__ 是同步的
-        self.email_service: Optional[EmailService] = None
-        self.exception_processor: Optional[ExceptionProcessor] = None
+        self.email_service: Optional["EmailService"] = None
+        self.exception_processor: Optional["ExceptionProcessor"] = None
+        self.ingest_queue: Optional["IngestQueue"] = None
+        self.metrics_exporter: Optional["PrometheusFileExporter"] = None
+        self.watchdog: Optional["LoopWatchdog"] = None
+        self.initialize_seconds: Optional[float] = None
+        self.time_decorating_pass = False
         self.data_dir = None  # 在 initialize 中进行异步初始化
 
     async def initialize(self):
         """在插件啟用時初始化所有服務"""
+        started = time.perf_counter()
         try:
             logger.info("正在初始化 Error Monitor 插件...")
             if not self.enable_monitoring:
                 logger.info("Error Monitor 插件的監控功能已禁用。")
                 return
 
+            from .ingest import IngestQueue
+            from .metrics import MetricsRegistry, PrometheusFileExporter
+            from .services import EmailService, ExceptionProcessor
+            from .watchdog import LoopWatchdog
+
             main_loop = asyncio.get_running_loop()
             self.data_dir = StarTools.get_data_dir()
-            self.email_service = EmailService(self.config)
+            metrics = MetricsRegistry()
+            metrics.gauge(
+                "plugin_import_seconds", "插件主模組的匯入耗時", lambda: IMPORT_SECONDS
+            )
+            metrics.gauge(
+                "plugin_initialize_seconds",
+                "插件 initialize() 的耗時（不含背景預熱）",
+                lambda: self.initialize_seconds or 0.0,
+            )
+            self.email_service = EmailService(self.config, metrics)
+            # DNS、連線、EHLO 與登入在背景進行，不延遲插件初始化
+            self.email_service.start_warm_up(main_loop)
             self.exception_processor = ExceptionProcessor(
-                self.config, self.email_service, self, main_loop, self.data_dir
+                self.config, self.email_service, self, main_loop, self.data_dir, metrics
+            )
+            await self.exception_processor.start()
+            self.ingest_queue = IngestQueue(
+                self.exception_processor,
+                max_size=self.general_config.get("ingest_queue_size", 1000),
+                workers=self.general_config.get("ingest_workers", 2),
             )
+            self.ingest_queue.start(main_loop)
+
+            watchdog_config = self.config.get("watchdog", {})
+            if watchdog_config.get("enable_watchdog", False):
+                # 事件迴圈延遲與阻塞堆疊作為合成的異常報告，走與其他報告相同的處理流程
+                self.watchdog = LoopWatchdog(
+                    self.ingest_queue.submit,
+                    metrics,
+                    interval=watchdog_config.get("watchdog_interval_ms", 100) / 1000,
+                    threshold=watchdog_config.get("loop_lag_threshold_ms", 1000) / 1000,
+                    capture_stack=watchdog_config.get("capture_blocking_stack", True),
+                    slow_pass_threshold=watchdog_config.get(
+                        "slow_pass_threshold_ms", 2000
+                    )
+                    / 1000,
+                )
+                self.watchdog.start(main_loop)
+                self.time_decorating_pass = watchdog_config.get(
+                    "time_decorating_pass", False
+                )
+
+            if self.general_config.get("prometheus_export", False):
+                self.metrics_exporter = PrometheusFileExporter(
+                    metrics,
+                    self.data_dir / "metrics.prom",
+                    self.general_config.get("prometheus_export_interval", 60),
+                )
+                self.metrics_exporter.start()
 
-            logger.info("Error Monitor 插件已成功初始化。")
+            self.initialize_seconds = time.perf_counter() - started
+            logger.info(
+                f"Error Monitor 插件已成功初始化，耗時 {self.initialize_seconds * 1000:.0f} ms。"
+            )
         except Exception as e:
             logger.error(f"[ErrorMonitor] CRITICAL: 插件初始化失敗: {e}", exc_info=True)
+            # 停止已經啟動的部分（背景預熱、處理器、佇列工作者、監控），避免它們在插件停用後繼續運行
+            try:
+                await self._stop_services()
+            except Exception as stop_error:
+                logger.error(
+                    f"[ErrorMonitor] 清理初始化失敗的服務時發生錯誤: {stop_error}",
+                    exc_info=True,
+                )
+            self.watchdog = None
+            self.ingest_queue = None
             self.exception_processor = None
+            self.email_service = None
+            self.metrics_exporter = None
 
     async def terminate(self):
         """插件終止時的操作"""
+        await self._stop_services()
+        logger.info("Error Monitor 插件已卸載。")
+
+    async def _stop_services(self):
+        """依啟動的相反順序停止已建立的服務"""
+        if self.watchdog:
+            await self.watchdog.stop()
+        if self.ingest_queue:
+            # 先處理完佇列中剩餘的報告，再停止處理器
+            await self.ingest_queue.drain()
         if self.exception_processor:
             await self.exception_processor.stop()
-        logger.info("Error Monitor 插件已卸載。")
+        if self.email_service:
+            await self.email_service.close()
+        if self.metrics_exporter:
+            await self.metrics_exporter.stop()
+
+    async def reload_config(
+        self, new_config: Dict[str, Any]
+    ) -> Tuple[List[str], List[str]]:
+        """
+        公開的 API：比較新設定與目前生效的設定，就地套用可以直接生效的變更。
+
+        不會重建郵件服務與處理器，緩衝區、快取、限流器額度與進行中的批次都會保留。
+        返回 (已套用的欄位, 需要重新載入插件才會生效的欄位)；
+        新設定無效時拋出異常，且目前的設定完全不受影響；
+        監控服務未初始化（例如初始化失敗）時拋出 RuntimeError。
+        """
+        from .reload import diff_config, merge_applied
+
+        if not self.exception_processor:
+            raise RuntimeError("監控服務未初始化，無法重新載入設定。")
+        changes = diff_config(self.config, new_config)
+        applied, restart = self.exception_processor.apply_config(new_config, changes)
+        merge_applied(self.config, changes, applied)
+        if applied:
+            logger.info(f"[ErrorMonitor] 已重新載入設定: {', '.join(applied)}")
+        if restart:
+            logger.warning(
+                f"[ErrorMonitor] 以下設定需要重新載入插件才會生效: {', '.join(restart)}"
+            )
+        return applied, restart
+
+    @filter.on_decorating_result(priority=1_000_000)
+    async def _mark_decorating_start(self, event: AstrMessageEvent, *args, **kwargs):
+        """以最高優先級最先執行，記錄結果裝飾階段的開始時間"""
+        if self.time_decorating_pass:
+            event._error_monitor_pass_start = time.perf_counter()
+
+    @filter.on_decorating_result(priority=-1_000_000)
+    async def _measure_decorating_pass(self, event: AstrMessageEvent, *args, **kwargs):
+        """以最低優先級最後執行，記錄整個結果裝飾階段（所有插件的處理器）的耗時"""
+        started = getattr(event, "_error_monitor_pass_start", None)
+        if started is not None and self.watchdog:
+            self.watchdog.observe_pass(event, time.perf_counter() - started)
 
     @filter.on_decorating_result(priority=1)  # 使用較低的優先級，確保在生產者之後執行
     async def consume_reported_error(self, event: AstrMessageEvent, *args, **kwargs):
-        """監聽事件，消費由其他插件附加的錯誤報告。"""
+        """監聽事件，消費由其他插件附加的錯誤報告。
+
+        ``reported_error`` 可以是關鍵字字串、例外物件，或包含 keyword、severity、
+        exception、tags、extra 的字典。
+        """
 
         # 檢查事件對象上是否存在 'reported_error' 屬性
         reported_error = getattr(event, "reported_error", None)
         if reported_error:
             logger.debug("[ErrorMonitor] 檢測到事件上附加的錯誤報告，準備處理...")
             try:
-                # 調用現有的核心處理方法
-                if self.exception_processor:
-                    logger.debug(
-                        "[ErrorMonitor] ExceptionProcessor 實例存在，準備調用 process_message_exception..."
-                    )
-                    await self.exception_processor.process_message_exception(
-                        event, reported_error
+                # 只擷取記錄並放入佇列，實際處理由背景 worker 完成，不阻塞回覆流程
+                report = parse_report(reported_error)
+                if report is None:
+                    logger.warning(
+                        f"[ErrorMonitor] 無法辨識的錯誤報告類型: {type(reported_error).__name__}"
                     )
-                    logger.info("[ErrorMonitor] 已成功處理來自事件的附加錯誤報告。")
+                elif self.exception_processor and self.ingest_queue:
+                    if self.ingest_queue.submit(
+                        self.exception_processor.capture(event, **report)
+                    ):
+                        logger.debug("[ErrorMonitor] 已將事件附加的錯誤報告放入佇列。")
                 else:
                     logger.error(
                         "[ErrorMonitor] CRITICAL: ExceptionProcessor 實例為 None！插件初始化可能失敗。"
@@ -79,18 +217,42 @@ class ExceptionMonitorPlugin(Star):
             except Exception as e:
                 logger.error(f"[ErrorMonitor] 處理事件附加的錯誤報告時發生異常: {e}")
 
-    async def report_error(self, event: AstrMessageEvent, keyword: str):
+    async def report_error(
+        self,
+        event: AstrMessageEvent,
+        keyword: str,
+        severity: str = "error",
+        exception: Optional[BaseException] = None,
+        tags: Optional[List[str]] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ):
         """
         公開的 API，供其他插件呼叫以報告錯誤。
+
+        severity 為 debug、info、warning、error 或 critical；exception 的堆疊
+        只擷取摘要（最多 20 幀），原始碼行與附加資訊在發送通知時才格式化。
         """
-        if not self.enable_monitoring or not self.exception_processor:
+        if (
+            not self.enable_monitoring
+            or not self.exception_processor
+            or not self.ingest_queue
+        ):
             return
 
         if keyword:
             logger.info(
                 f"接收到來自 '{event.get_platform_name()}' 的錯誤報告，關鍵字: {keyword}"
             )
-            await self.exception_processor.process_message_exception(event, keyword)
+            self.ingest_queue.submit(
+                self.exception_processor.capture(
+                    event,
+                    keyword,
+                    severity=severity,
+                    exc=exception,
+                    tags=tags or (),
+                    extra=extra,
+                )
+            )
 
     # --- 指令處理器 ---
     @filter.permission_type(filter.PermissionType.ADMIN)
@@ -102,6 +264,8 @@ class ExceptionMonitorPlugin(Star):
                 MessageChain([Plain(text="監控功能未啟用或郵件服務未初始化。")])
             )
             return
+        from .commands import handle_test_email
+
         await handle_test_email(event, self.email_service)
 
     @filter.permission_type(filter.PermissionType.ADMIN)
@@ -110,8 +274,14 @@ class ExceptionMonitorPlugin(Star):
         if not self.exception_processor or not self.email_service:
             await event.send(MessageChain([Plain(text="監控服務未初始化。")]))
             return
+        from .commands import handle_exception_status
+
         await handle_exception_status(
-            event, self.exception_processor, self.email_service
+            event,
+            self.exception_processor,
+            self.email_service,
+            self.ingest_queue,
+            self.watchdog,
         )
 
     @filter.permission_type(filter.PermissionType.ADMIN)
@@ -120,4 +290,30 @@ class ExceptionMonitorPlugin(Star):
         if not self.exception_processor:
             await event.send(MessageChain([Plain(text="監控服務未初始化。")]))
             return
+        from .commands import handle_clear_cache
+
         await handle_clear_cache(event, self.exception_processor)
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("exception_search", re_flags=re.IGNORECASE)
+    async def _exception_search_command(self, event: AstrMessageEvent):
+        """分頁查詢異常歷史，例如 /exception_search platform=aiocqhttp since=1h"""
+        if not self.exception_processor:
+            await event.send(MessageChain([Plain(text="監控服務未初始化。")]))
+            return
+        from .commands import handle_exception_search
+
+        await handle_exception_search(event, self.exception_processor)
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("reload_exception_config", re_flags=re.IGNORECASE)
+    async def _reload_config_command(self, event: AstrMessageEvent):
+        """從設定檔重新載入設定，不重建服務也不遺失緩衝中的報告"""
+        if not self.exception_processor:
+            await event.send(MessageChain([Plain(text="監控服務未初始化。")]))
+            return
+        from .commands import handle_reload_config
+
+        await handle_reload_config(
+            event, self.reload_config, getattr(self.config, "config_path", None)
+        )
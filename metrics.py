@@ -0,0 +1,237 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from astrbot.api import logger
+
+# 每個計數器最多追蹤的標籤組合數，超出的組合併入 "other"，確保記憶體佔用固定
+MAX_SERIES = 200
+OTHER = "other"
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> List[float]:
+    return [start * factor**i for i in range(count)]
+
+
+# 延遲：0.1 毫秒到約 105 秒；批次大小：1 到約 16k
+LATENCY_BUCKETS = exponential_buckets(0.0001, 2, 21)
+SIZE_BUCKETS = exponential_buckets(1, 2, 15)
+
+
+class Counter:
+    """帶標籤的計數器；標籤組合數上限為 MAX_SERIES"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        key = tuple(str(v) for v in label_values)
+        if key not in self.values and len(self.values) >= MAX_SERIES:
+            key = (OTHER,) * len(self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def top(self, n: int) -> List[Tuple[Tuple[str, ...], float]]:
+        return sorted(self.values.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    @property
+    def total(self) -> float:
+        return sum(self.values.values())
+
+
+class Gauge:
+    """即時讀取的量測值，讀取時呼叫 fn"""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    @property
+    def value(self) -> float:
+        try:
+            return float(self.fn())
+        except Exception:
+            return float("nan")
+
+
+class Histogram:
+    """固定桶的直方圖；記憶體佔用只與桶數相關，百分位數以桶內線性插值估計。
+
+    可以從執行緒池中觀測（例如渲染耗時），因此更新以鎖保護。
+    """
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.bounds = sorted(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # 最後一格為 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                # 以實際觀測到的最小/最大值收窄桶邊界，少量樣本時估計更準確
+                lower = max(self.bounds[i - 1] if i > 0 else 0.0, self.min)
+                upper = min(
+                    self.bounds[i] if i < len(self.bounds) else self.max, self.max
+                )
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+
+class MetricsRegistry:
+    """插件內部的指標登錄表，供 exception_status 顯示並可匯出為 Prometheus 文字格式"""
+
+    PREFIX = "astrbot_error_monitor_"
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        if name not in self.metrics:
+            self.metrics[name] = Counter(name, help, labels)
+        return self.metrics[name]
+
+    def histogram(
+        self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        if name not in self.metrics:
+            self.metrics[name] = Histogram(name, help, buckets)
+        return self.metrics[name]
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        self.metrics[name] = Gauge(name, help, fn)
+        return self.metrics[name]
+
+    def get(self, name: str):
+        return self.metrics.get(name)
+
+    def render_prometheus(self) -> str:
+        """以 Prometheus 文字格式輸出所有指標"""
+        lines = []
+        for metric in self.metrics.values():
+            name = self.PREFIX + metric.name
+            lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in metric.values.items():
+                    lines.append(
+                        f"{name}{_labels(metric.labels, key)} {_format_value(value)}"
+                    )
+            elif isinstance(metric, Gauge):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(metric.value)}")
+            elif isinstance(metric, Histogram):
+                lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(metric.bounds, metric.counts):
+                    cumulative += bucket_count
+                    lines.append(
+                        f'{name}_bucket{{le="{_format_value(bound)}"}} {cumulative}'
+                    )
+                lines.append(f'{name}_bucket{{le="+Inf"}} {metric.count}')
+                lines.append(f"{name}_sum {_format_value(metric.sum)}")
+                lines.append(f"{name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value: float) -> str:
+    """Prometheus 文字格式的數值：特殊值寫成 NaN、+Inf、-Inf，整數不帶小數點，其他值保留完整精度"""
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class PrometheusFileExporter:
+    """定期將指標以原子替換的方式寫入文字檔，供 node_exporter 的 textfile collector 讀取"""
+
+    def __init__(self, registry: MetricsRegistry, path: Path, interval: float = 60):
+        self.registry = registry
+        self.path = Path(path)
+        self.interval = max(1.0, float(interval))
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def _write(self, text: str):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    async def export(self):
+        await asyncio.to_thread(self._write, self.registry.render_prometheus())
+
+    async def _loop(self):
+        try:
+            while True:
+                try:
+                    await self.export()
+                except OSError as e:
+                    logger.error(f"[ErrorMonitor] 匯出 Prometheus 指標失敗: {e}")
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            pass
+
+    async def stop(self):
+        """停止定期匯出，並寫入最後一次的指標"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            await self.export()
+        except OSError as e:
+            logger.error(f"[ErrorMonitor] 匯出 Prometheus 指標失敗: {e}")
@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import logging.handlers
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from astrbot.api import logger
+from astrbot.core.message.components import Plain
+from astrbot.core.message.message_event_result import MessageChain
+
+from .aggregation import BatchBuffer, ErrorAggregate
+from .limiter import RateLimiter
+from .records import ExceptionRecord
+from .templates import generate_plain_text_summary
+
+if TYPE_CHECKING:
+    import aiohttp
+
+# 通道等待發送額度時單次休眠的上限
+MAX_CHANNEL_SLEEP_SECONDS = 3600
+
+
+class Notification:
+    """送往非郵件通道的一則通知"""
+
+    __slots__ = ("subject", "text", "aggregates", "total")
+
+    def __init__(
+        self, subject: str, text: str, aggregates: List[ErrorAggregate], total: int
+    ):
+        self.subject = subject
+        self.text = text
+        self.aggregates = aggregates
+        self.total = total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "subject": self.subject,
+            "text": self.text,
+            "total": self.total,
+            "errors": [aggregate.to_dict() for aggregate in self.aggregates],
+        }
+
+
+class Notifier(ABC):
+    """通知通道的介面；子類別實作 send，將一則通知送到目的地，失敗時拋出異常"""
+
+    name = "notifier"
+
+    @abstractmethod
+    async def send(self, notification: Notification):
+        """送出一則通知"""
+
+    async def close(self):
+        pass
+
+
+class AstrBotNotifier(Notifier):
+    """透過 AstrBot 的 context.send_message 將通知發送到管理員會話"""
+
+    name = "astrbot"
+
+    def __init__(self, context, sessions: List[str]):
+        self.context = context
+        self.sessions = list(sessions)
+
+    async def send(self, notification: Notification):
+        chain = MessageChain([Plain(text=notification.text)])
+        # 各會話並行發送，一個會話失敗不會中斷其他會話；有任何失敗時整則通知計為失敗
+        results = await asyncio.gather(
+            *(self.context.send_message(session, chain) for session in self.sessions),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise RuntimeError(
+                f"{len(errors)}/{len(self.sessions)} 個會話發送失敗: {errors[0]!r}"
+            )
+
+
+class WebhookNotifier(Notifier):
+    """以 JSON POST 將通知發送到 HTTP Webhook，重用同一個 aiohttp 連線階段"""
+
+    name = "webhook"
+
+    def __init__(self, url: str):
+        self.url = url
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    async def send(self, notification: Notification):
+        if self._session is None or self._session.closed:
+            # aiohttp 匯入耗時較長，只在啟用 Webhook 且第一次發送時才載入
+            import aiohttp
+
+            self._session = aiohttp.ClientSession()
+        async with self._session.post(self.url, json=notification.to_dict()) as resp:
+            resp.raise_for_status()
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+class FileNotifier(Notifier):
+    """將通知追加寫入本地檔案；寫入在執行緒中進行，不阻塞事件迴圈"""
+
+    name = "file"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def _write(self, text: str):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {text}\n")
+
+    async def send(self, notification: Notification):
+        await asyncio.to_thread(self._write, notification.text)
+
+
+class SyslogNotifier(Notifier):
+    """將通知送往 syslog；address 可為 "host:port"（UDP）或 Unix socket 路徑"""
+
+    name = "syslog"
+
+    def __init__(self, address: str):
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            target = (host, int(port))
+        else:
+            target = address
+        self._handler = logging.handlers.SysLogHandler(address=target)
+        self._logger = logging.getLogger("astrbot_error_monitor.syslog")
+        self._logger.propagate = False
+        self._logger.addHandler(self._handler)
+
+    async def send(self, notification: Notification):
+        await asyncio.to_thread(self._logger.error, notification.text)
+
+    async def close(self):
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+
+class NotifierChannel:
+    """為單一通知通道提供獨立的批處理窗口、發送上限與逾時。
+
+    每個通道以自己的背景任務發送，因此較慢的通道（例如 SMTP）不會延遲其他通道。
+    非郵件通道為盡力而為：發送失敗或逾時的批次只計數並記錄，不會重試。
+    """
+
+    def __init__(
+        self,
+        notifier: Notifier,
+        batch_window: float = 30,
+        max_per_hour: int = 0,
+        timeout: float = 10,
+        max_entries: int = 20,
+        buffer_entries: int = 200,
+    ):
+        self.notifier = notifier
+        self.batch_window = max(0.0, float(batch_window))
+        self.timeout = max(0.1, float(timeout))
+        self.max_entries = max_entries
+        self.buffer_entries = buffer_entries
+        # 0 表示不限制
+        self.limiter = RateLimiter(max_per_hour) if max_per_hour else None
+        self.buffer = self._new_buffer()
+        self._task: Optional[asyncio.Task] = None
+
+        # 統計資訊，供 exception_status 顯示
+        self.sent = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    @property
+    def name(self) -> str:
+        return self.notifier.name
+
+    def _new_buffer(self) -> BatchBuffer:
+        return BatchBuffer(self.buffer_entries, "aggregate")
+
+    def offer(self, record: ExceptionRecord):
+        """將記錄放入此通道的緩衝區；窗口尚未開始時啟動發送任務"""
+        self.buffer.add(record)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        try:
+            await asyncio.sleep(self.batch_window)
+            while self.buffer:
+                if self.limiter:
+                    delay = self.limiter.time_until_available()
+                    if delay > 0:
+                        await asyncio.sleep(min(delay, MAX_CHANNEL_SLEEP_SECONDS))
+                        continue
+                    self.limiter.acquire()
+                batch = self.buffer
+                self.buffer = self._new_buffer()
+                if not await self._deliver(batch) and self.limiter:
+                    self.limiter.refund()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(
+                f"[ErrorMonitor] 通知通道 {self.name} 發送任務失敗: {e}", exc_info=True
+            )
+
+    async def _deliver(self, batch: BatchBuffer) -> bool:
+        aggregates = batch.values()
+        subject, text = generate_plain_text_summary(
+            aggregates, dropped=batch.dropped, max_entries=self.max_entries
+        )
+        try:
+            await asyncio.wait_for(
+                self.notifier.send(
+                    Notification(subject, text, aggregates, batch.total)
+                ),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(
+                f"[ErrorMonitor] 通知通道 {self.name} 發送逾時（{self.timeout:g} 秒）。"
+            )
+            return False
+        except Exception as e:
+            self.failed += 1
+            logger.error(
+                f"[ErrorMonitor] 通知通道 {self.name} 發送失敗。異常類型: {type(e).__name__}"
+            )
+            return False
+        self.sent += 1
+        return True
+
+    async def close(self):
+        """停止發送任務，不受發送上限限制地送出剩餘的緩衝區，然後關閉通道"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.buffer:
+            batch = self.buffer
+            self.buffer = self._new_buffer()
+            await self._deliver(batch)
+        await self.notifier.close()
+
+
+class NotifierHub:
+    """將每筆異常記錄分發到所有已啟用的通知通道。
+
+    dispatch 只把記錄放入各通道的緩衝區，不等待任何發送；
+    各通道在自己的背景任務中依各自的窗口與上限並行發送，慢的通道不會拖累其他通道。
+    """
+
+    def __init__(self, channels: List[NotifierChannel] = None):
+        self.channels = list(channels or [])
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def dispatch(self, record: ExceptionRecord):
+        for channel in self.channels:
+            channel.offer(record)
+
+    async def close(self):
+        """並行關閉所有通道，每個通道的最後一批各自受逾時限制"""
+        await asyncio.gather(
+            *(channel.close() for channel in self.channels), return_exceptions=True
+        )
+
+
+def build_notifier_hub(config, context, data_dir: Optional[Path]) -> NotifierHub:
+    """依 notifiers 設定建立已啟用的通知通道"""
+    settings = (config or {}).get("notifiers", {})
+    timeout = settings.get("sink_timeout_seconds", 10)
+    max_entries = settings.get("sink_max_entries", 20)
+    channels = []
+
+    admin_sessions = settings.get("admin_sessions", [])
+    if admin_sessions and context is not None:
+        channels.append(
+            NotifierChannel(
+                AstrBotNotifier(context, admin_sessions),
+                batch_window=settings.get("admin_batch_window_seconds", 30),
+                max_per_hour=settings.get("admin_max_per_hour", 20),
+                timeout=timeout,
+                max_entries=max_entries,
+            )
+        )
+
+    webhook_url = settings.get("webhook_url", "").strip()
+    if webhook_url:
+        channels.append(
+            NotifierChannel(
+                WebhookNotifier(webhook_url),
+                batch_window=settings.get("webhook_batch_window_seconds", 30),
+                max_per_hour=settings.get("webhook_max_per_hour", 60),
+                timeout=timeout,
+                max_entries=max_entries,
+            )
+        )
+
+    log_window = settings.get("log_batch_window_seconds", 0)
+    log_file = settings.get("log_file", "").strip()
+    if log_file:
+        path = Path(log_file)
+        if not path.is_absolute() and data_dir:
+            path = Path(data_dir) / path
+        channels.append(
+            NotifierChannel(
+                FileNotifier(path),
+                batch_window=log_window,
+                timeout=timeout,
+                max_entries=max_entries,
+            )
+        )
+
+    syslog_address = settings.get("syslog_address", "").strip()
+    if syslog_address:
+        try:
+            channels.append(
+                NotifierChannel(
+                    SyslogNotifier(syslog_address),
+                    batch_window=log_window,
+                    timeout=timeout,
+                    max_entries=max_entries,
+                )
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"[ErrorMonitor] 無法連接 syslog ({syslog_address}): {e}")
+
+    return NotifierHub(channels)
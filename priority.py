@@ -0,0 +1,152 @@
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .aggregation import BatchBuffer
+from .records import SEVERITY_RANK, normalize_severity
+
+# 優先通道：critical 立即發送並使用保留額度，warning/error 進入批處理，debug/info 只計入摘要
+LANE_IMMEDIATE = "immediate"
+LANE_BATCH = "batch"
+LANE_DIGEST = "digest"
+LANES = (LANE_IMMEDIATE, LANE_BATCH)
+
+# 關鍵字 -> 嚴重程度的匹配結果快取上限
+MAX_CACHED_KEYWORDS = 4096
+
+
+def lane_for(severity: str) -> str:
+    rank = SEVERITY_RANK.get(severity, SEVERITY_RANK["error"])
+    if rank >= SEVERITY_RANK["critical"]:
+        return LANE_IMMEDIATE
+    if rank <= SEVERITY_RANK["info"]:
+        return LANE_DIGEST
+    return LANE_BATCH
+
+
+def parse_rule(rule: str) -> Optional[Tuple[str, str]]:
+    """解析「正規表示式=嚴重程度」格式的規則；格式錯誤時返回 None"""
+    pattern, sep, severity = str(rule).rpartition("=")
+    severity = severity.strip().lower()
+    if not sep or not pattern.strip() or severity not in SEVERITY_RANK:
+        return None
+    return pattern.strip(), severity
+
+
+class SeverityRules:
+    """依關鍵字決定嚴重程度的規則集。
+
+    所有規則編譯成一個以具名群組交替的正規表示式，每個關鍵字只需一次匹配；
+    規則依設定順序優先，第一條匹配（re.search 語意）的規則生效。
+    結果依關鍵字快取，同一個關鍵字不會重複匹配。
+    """
+
+    def __init__(self, rules: Iterable[str] = ()):
+        self.severities: List[str] = []
+        alternatives = []
+        for rule in rules or ():
+            parsed = parse_rule(rule)
+            if parsed is None:
+                logger.warning(
+                    f"[ErrorMonitor] 忽略格式錯誤的嚴重程度規則「{rule}」，應為「正規表示式=嚴重程度」。"
+                )
+                continue
+            pattern, severity = parsed
+            try:
+                re.compile(f".*?(?:{pattern})")
+            except re.error as e:
+                logger.warning(f"[ErrorMonitor] 忽略無效的嚴重程度規則「{rule}」: {e}")
+                continue
+            # 每條規則前加上 .*? 並以 re.match 在開頭嘗試：交替依序嘗試，
+            # 因此排在前面的規則優先，而不是在字串中最早出現的匹配優先
+            alternatives.append(f"(?P<r{len(self.severities)}>.*?(?:{pattern}))")
+            self.severities.append(severity)
+        self._regex = None
+        if alternatives:
+            try:
+                self._regex = re.compile("|".join(alternatives), re.DOTALL)
+            except re.error as e:
+                # 例如不同規則使用了相同名稱的群組
+                logger.warning(f"[ErrorMonitor] 嚴重程度規則無法合併編譯，已停用: {e}")
+                self.severities = []
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.severities)
+
+    def match(self, keyword: str) -> Optional[str]:
+        """返回關鍵字對應的嚴重程度；沒有規則匹配時返回 None"""
+        if self._regex is None:
+            return None
+        try:
+            return self._cache[keyword]
+        except KeyError:
+            pass
+        m = self._regex.match(keyword)
+        severity = self.severities[int(m.lastgroup[1:])] if m else None
+        if len(self._cache) >= MAX_CACHED_KEYWORDS:
+            self._cache.clear()
+        self._cache[keyword] = severity
+        return severity
+
+    def classify(self, keyword: str, severity: str) -> str:
+        """規則優先於報告者指定的嚴重程度"""
+        return self.match(str(keyword)) or normalize_severity(severity)
+
+
+class DeferredLanes:
+    """各優先通道中因額度不足而延後的報告。
+
+    每個通道各自合併為一個緩衝區；取得額度時以「老化優先順序」選擇下一個通道：
+    排序鍵為 通道等級 × aging_seconds + 最早延後的時間，
+    因此低優先通道每多等待 aging_seconds 秒就提升一級，不會被持續的高優先報告餓死。
+    """
+
+    def __init__(
+        self,
+        new_buffer: Callable[[], BatchBuffer],
+        aging_seconds: float = 600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._new_buffer = new_buffer
+        self.aging_seconds = max(0.0, float(aging_seconds))
+        self.clock = clock
+        self.buffers: Dict[str, BatchBuffer] = {lane: new_buffer() for lane in LANES}
+        self.since: Dict[str, Optional[float]] = {lane: None for lane in LANES}
+
+    def __bool__(self) -> bool:
+        return any(self.buffers.values())
+
+    @property
+    def total(self) -> int:
+        return sum(buffer.total for buffer in self.buffers.values())
+
+    def add(self, lane: str, batch: BatchBuffer):
+        self.buffers[lane].merge(batch)
+        if self.since[lane] is None:
+            self.since[lane] = self.clock()
+
+    def waited(self, lane: str) -> float:
+        """通道中最早的延後報告已等待的秒數"""
+        since = self.since[lane]
+        return 0.0 if since is None else self.clock() - since
+
+    def next_lane(self) -> Optional[str]:
+        waiting = [lane for lane in LANES if self.buffers[lane]]
+        if not waiting:
+            return None
+        return min(
+            waiting,
+            key=lambda lane: LANES.index(lane) * self.aging_seconds + self.since[lane],
+        )
+
+    def pop(self, lane: str) -> BatchBuffer:
+        batch = self.buffers[lane]
+        self.buffers[lane] = self._new_buffer()
+        self.since[lane] = None
+        return batch
+
+    def keywords(self, lane: str):
+        return self.buffers[lane].keywords
@@ -0,0 +1,296 @@
+import html
+import json
+import time
+import traceback
+import zlib
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Any, Iterable, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from astrbot.api.event import AstrMessageEvent
+
+_FIELDS = (
+    "type",
+    "platform",
+    "sender",
+    "sender_id",
+    "group_id",
+    "message",
+    "keyword",
+    "timestamp",
+    "fingerprint",
+    "severity",
+    "tags",
+    "extra",
+    "error",
+    "message_bytes",
+)
+
+# 嚴重程度由低到高；無法辨識的值一律視為 error
+SEVERITIES = ("debug", "info", "warning", "error", "critical")
+SEVERITY_RANK = {severity: rank for rank, severity in enumerate(SEVERITIES)}
+DEFAULT_SEVERITY = "error"
+
+# 擷取堆疊時保留的最多幀數（最靠近拋出點的幀）
+MAX_TRACEBACK_FRAMES = 20
+MAX_TAGS = 16
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def normalize_severity(severity: Any) -> str:
+    severity = str(severity or "").lower()
+    return severity if severity in SEVERITY_RANK else DEFAULT_SEVERITY
+
+
+def format_time(ts: Union[float, str, None]) -> str:
+    """將 UNIX 時間戳格式化為本地時間字串；只在渲染時呼叫"""
+    if ts is None or isinstance(ts, str):
+        return ts or ""
+    return time.strftime(TIME_FORMAT, time.localtime(ts))
+
+
+def to_epoch(value: Union[float, str, None]) -> Optional[float]:
+    """將時間戳或舊版本保存的時間字串轉為 UNIX 時間戳"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return datetime.strptime(value, TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def capture_stack(
+    exc: BaseException, limit: int = MAX_TRACEBACK_FRAMES
+) -> traceback.StackSummary:
+    """擷取例外的堆疊摘要。
+
+    不讀取原始碼行（lookup_lines=False），也不保留 frame 物件與區域變數，
+    原始碼行只在渲染時才經由 linecache 載入。
+    """
+    frames = list(traceback.walk_tb(exc.__traceback__))[-limit:]
+    return traceback.StackSummary.extract(frames, lookup_lines=False)
+
+
+def parse_report(report: Any) -> Optional[Dict[str, Any]]:
+    """將 ``reported_error`` 的值轉為 ExceptionRecord.from_event 的參數。
+
+    可以是關鍵字字串、例外物件，或包含 keyword / severity / exception / tags / extra
+    的字典；無法辨識或沒有關鍵字時返回 None。
+    """
+    if isinstance(report, str):
+        return {"keyword": report} if report else None
+    if isinstance(report, BaseException):
+        return {"keyword": type(report).__name__, "exc": report}
+    if isinstance(report, dict):
+        exc = report.get("exception")
+        keyword = report.get("keyword") or (type(exc).__name__ if exc else None)
+        if not keyword:
+            return None
+        return {
+            "keyword": str(keyword),
+            "severity": report.get("severity"),
+            "exc": exc if isinstance(exc, BaseException) else None,
+            "tags": report.get("tags"),
+            "extra": report.get("extra"),
+        }
+    return None
+
+
+class ExceptionRecord:
+    """單筆異常報告，使用 __slots__ 以降低每筆記錄的記憶體佔用。
+
+    timestamp 為 UNIX 時間戳（浮點數），堆疊保存為未格式化的 StackSummary；
+    時間字串、堆疊文字與 HTML 轉義都延遲到渲染通知時才產生。
+    """
+
+    __slots__ = _FIELDS + (
+        "stack",
+        "payload",
+        "spool_seq",
+        "route",
+        "_event",
+        "_html",
+    )
+
+    def __init__(
+        self,
+        platform: str,
+        sender: str,
+        sender_id: str,
+        group_id: str,
+        message: str,
+        keyword: str,
+        timestamp: float,
+        fingerprint: Optional[str] = None,
+        type: str = "message",
+        severity: str = DEFAULT_SEVERITY,
+        tags: Iterable[str] = (),
+        extra: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        stack: Optional[traceback.StackSummary] = None,
+        message_bytes: Optional[int] = None,
+    ):
+        self.type = type
+        self.platform = platform
+        self.sender = sender
+        self.sender_id = sender_id
+        self.group_id = group_id
+        self.message = message
+        self.keyword = keyword
+        self.timestamp = timestamp
+        self.fingerprint = fingerprint
+        self.severity = normalize_severity(severity)
+        self.tags = tuple(str(tag) for tag in tags or ())[:MAX_TAGS]
+        self.extra = extra or None
+        # 例外類型與訊息，例如 "TimeoutError: read timed out"
+        self.error = error
+        self.stack = stack
+        # 訊息被截斷時的原始位元組數，未截斷時為 None
+        self.message_bytes = message_bytes
+        # 被抽樣保留的完整訊息（str，或 zlib 壓縮後的 bytes），見 capture.CapturePolicy
+        self.payload: Union[str, bytes, None] = None
+        # 在持久化日誌中的序號，未寫入日誌時為 None
+        self.spool_seq: Optional[int] = None
+        # 收件人路由（排序後的收件人元組，空元組為預設收件人），見 routing.RoutingTable；
+        # 由設定決定，不寫入日誌，重放時重新計算
+        self.route: Tuple[str, ...] = ()
+        # 尚未讀取欄位的訊息事件，見 resolve()
+        self._event: Optional["AstrMessageEvent"] = None
+        self._html: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def from_event(
+        cls,
+        event: "AstrMessageEvent",
+        keyword: str,
+        severity: str = DEFAULT_SEVERITY,
+        exc: Optional[BaseException] = None,
+        tags: Iterable[str] = (),
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> "ExceptionRecord":
+        """從訊息事件擷取異常報告。
+
+        只記錄時間戳與例外的堆疊摘要；事件上的平台、使用者與訊息等欄位
+        留待 worker 呼叫 resolve() 時才讀取，被佇列捨棄的報告不會產生這些開銷。
+        """
+        record = cls(
+            platform=None,
+            sender=None,
+            sender_id=None,
+            group_id=None,
+            message=None,
+            keyword=keyword,
+            timestamp=time.time(),
+            severity=severity,
+            tags=tags,
+            extra=extra,
+        )
+        if exc is not None:
+            record.error = f"{exc.__class__.__name__}: {exc}"
+            record.stack = capture_stack(exc)
+        record._event = event
+        return record
+
+    def resolve(self) -> "ExceptionRecord":
+        """讀取事件上的欄位並釋放事件的參照；重複呼叫不會重新讀取"""
+        event = self._event
+        if event is not None:
+            self._event = None
+            self.platform = event.get_platform_name()
+            self.sender = event.get_sender_name()
+            self.sender_id = event.get_sender_id()
+            self.group_id = event.get_group_id()
+            self.message = event.get_message_str()
+        return self
+
+    @property
+    def is_group(self) -> bool:
+        return bool(self.group_id) and self.group_id != "N/A"
+
+    @property
+    def payload_text(self) -> str:
+        if isinstance(self.payload, bytes):
+            return zlib.decompress(self.payload).decode("utf-8")
+        return self.payload or ""
+
+    @property
+    def traceback_text(self) -> str:
+        return "".join(self.stack.format()) if self.stack else ""
+
+    def escape(self) -> Dict[str, str]:
+        """HTML 轉義所有顯示欄位；每筆記錄只轉義一次，之後的渲染直接重用"""
+        if self._html is None:
+            self._html = {
+                field: html.escape(str(getattr(self, field)))
+                for field in (
+                    "platform",
+                    "sender",
+                    "sender_id",
+                    "keyword",
+                    "message",
+                    "severity",
+                )
+            }
+            self._html["timestamp"] = html.escape(format_time(self.timestamp))
+            self._html["group_id"] = html.escape(str(self.group_id or "N/A"))
+            self._html["tags"] = html.escape(", ".join(self.tags))
+            self._html["extra"] = (
+                html.escape(
+                    json.dumps(self.extra, ensure_ascii=False, indent=2, default=str)
+                )
+                if self.extra
+                else ""
+            )
+            self._html["error"] = html.escape(self.error or "")
+            self._html["traceback"] = html.escape(self.traceback_text)
+        return self._html
+
+    @property
+    def escaped(self) -> Dict[str, str]:
+        return self.escape()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {field: getattr(self, field) for field in _FIELDS}
+        data["tags"] = list(self.tags)
+        # 只保存 (檔案, 行號, 函式)，原始碼行在載入後渲染時才查詢
+        data["stack"] = (
+            [[frame.filename, frame.lineno, frame.name] for frame in self.stack]
+            if self.stack
+            else None
+        )
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExceptionRecord":
+        stack = data.get("stack")
+        record = cls(
+            **{
+                field: data.get(field)
+                for field in _FIELDS
+                if field not in ("type", "timestamp", "severity", "tags")
+            },
+            type=data.get("type") or "message",
+            timestamp=to_epoch(data.get("timestamp")),
+            severity=data.get("severity"),
+            tags=data.get("tags") or (),
+            stack=(
+                traceback.StackSummary.from_list(
+                    [(filename, lineno, name, None) for filename, lineno, name in stack]
+                )
+                if stack
+                else None
+            ),
+        )
+        record.spool_seq = data.get("spool_seq")
+        return record
+
+    def summary_lines(self) -> List[str]:
+        """純文字通道使用的例外摘要（例外訊息與堆疊最後一幀）"""
+        if not self.error:
+            return []
+        lines = [self.error]
+        if self.stack:
+            frame = self.stack[-1]
+            lines.append(f"at {frame.filename}:{frame.lineno} in {frame.name}")
+        return lines
@@ -0,0 +1,127 @@
+import json
+from typing import Any, Callable, Dict, List, Mapping, Tuple
+
+# 可以在執行中直接套用的設定（區段 -> 欄位）；其他欄位變更時需重新載入插件才會生效
+HOT_RELOADABLE: Dict[str, Tuple[str, ...]] = {
+    "smtp_settings": (
+        "smtp_server",
+        "smtp_port",
+        "smtp_username",
+        "smtp_password",
+        "sender_address",
+        "enable_ssl",
+        "pool_size",
+        "pool_idle_timeout",
+        "pool_keepalive_interval",
+        "worker_threads",
+        "retry_max_attempts",
+        "retry_base_delay",
+        "retry_max_delay",
+        "breaker_failure_threshold",
+        "breaker_reset_timeout",
+        "warm_up_on_start",
+    ),
+    "notification_filtering": (
+        "recipient_emails",
+        "routing_rules",
+        "max_rendered_entries",
+        "attachment_threshold_kb",
+        "attachment_format",
+    ),
+    "rate_limit_batching": (
+        "max_emails_per_hour",
+        "burst_size",
+        "max_emails_per_recipient_per_hour",
+        "max_emails_per_keyword_per_hour",
+        "enable_batching",
+        "batch_window_seconds",
+        "adaptive_batching",
+        "min_batch_window_seconds",
+        "max_batch_window_seconds",
+        "batch_quiet_seconds",
+        "batch_flush_threshold",
+        "storm_rate_per_minute",
+        "max_buffer_entries",
+        "buffer_overflow_policy",
+        "cache_size",
+    ),
+    "priority": (
+        "enable_priority_lanes",
+        "severity_rules",
+        "critical_reserved_per_hour",
+        "starvation_seconds",
+    ),
+}
+
+# 只要其中之一變更，就需要以新的連線池重新建立 SMTP 連線
+SMTP_CONNECTION_FIELDS = (
+    "smtp_server",
+    "smtp_port",
+    "smtp_username",
+    "smtp_password",
+    "enable_ssl",
+    "pool_size",
+)
+
+# 設定變更：區段 -> 欄位 -> (舊值, 新值)
+Changes = Dict[str, Dict[str, Tuple[Any, Any]]]
+
+
+def diff_config(old: Mapping[str, Any], new: Mapping[str, Any]) -> Changes:
+    """逐區段比較兩份設定，只返回值有變化的欄位（缺少的欄位視為 None）"""
+    changes: Changes = {}
+    for section in set(old) | set(new):
+        old_section, new_section = old.get(section, {}), new.get(section, {})
+        if not isinstance(old_section, Mapping) or not isinstance(new_section, Mapping):
+            if old_section != new_section:
+                changes.setdefault(section, {})[""] = (old_section, new_section)
+            continue
+        for key in set(old_section) | set(new_section):
+            before, after = old_section.get(key), new_section.get(key)
+            if before != after:
+                changes.setdefault(section, {})[key] = (before, after)
+    return changes
+
+
+def split_changes(changes: Changes) -> Tuple[List[str], List[str]]:
+    """把變更的欄位分成可直接套用的與需要重新載入插件的，以「區段.欄位」表示"""
+    hot, restart = [], []
+    for section, fields in sorted(changes.items()):
+        for key in sorted(fields):
+            name = f"{section}.{key}" if key else section
+            if key in HOT_RELOADABLE.get(section, ()):
+                hot.append(name)
+            else:
+                restart.append(name)
+    return hot, restart
+
+
+def commit(steps: List[Callable[[], None]]):
+    """依序執行已準備好的套用步驟。
+
+    步驟在準備階段已完成所有可能失敗的解析與驗證，本身只做賦值，
+    且中間沒有 await，因此對事件迴圈上的其他工作而言整次重新載入是原子的。
+    """
+    for step in steps:
+        step()
+
+
+def merge_applied(config: Dict[str, Any], changes: Changes, applied: List[str]):
+    """把已套用的欄位寫回目前的設定；需要重新載入的欄位保持原值，下次比較時仍會列出"""
+    for name in applied:
+        section, _, key = name.partition(".")
+        _, after = changes[section][key]
+        values = config.setdefault(section, {})
+        if after is None:
+            values.pop(key, None)
+        else:
+            values[key] = after
+
+
+def load_config_file(path: str) -> Dict[str, Any]:
+    """讀取插件的設定檔（AstrBot 以 UTF-8 JSON 儲存）"""
+    with open(path, encoding="utf-8-sig") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError("設定檔的頂層必須是物件")
+    return config
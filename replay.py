@@ -0,0 +1,293 @@
+import asyncio
+import csv
+import json
+from collections import Counter as TallyCounter, deque
+from typing import IO, Any, Callable, Deque, Dict, Iterable, Iterator
+
+from astrbot.api import AstrBotConfig
+
+from .history import COLUMNS, SEARCH_FIELDS
+from .metrics import MetricsRegistry, exponential_buckets
+from .priority import LANE_BATCH
+from .records import ExceptionRecord
+from .services import EmailService, ExceptionProcessor
+
+# 重放時會產生外部副作用或需要資料目錄的設定區段，一律停用
+DISABLED_SECTIONS = ("notifiers", "coordination", "digest", "history", "watchdog")
+
+# 報告從發生到隨郵件送出的延遲：1 秒到約 12 天
+DELAY_BUCKETS = exponential_buckets(1, 2, 21)
+
+Row = Dict[str, Any]
+
+
+# --- 串流管線：來源 -> 篩選 -> 輸出，每一段都是產生器，記憶體佔用與資料量無關 ---
+
+
+def read_ndjson(stream: IO[str]) -> Iterator[Row]:
+    """逐行讀取 NDJSON（例如先前匯出的檔案）"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def filter_rows(
+    rows: Iterable[Row],
+    filters: Dict[str, str] = None,
+    since: float = None,
+    until: float = None,
+) -> Iterator[Row]:
+    """依時間範圍與欄位值篩選記錄，條件與 HistoryStore 的查詢相同"""
+    conditions = [
+        (SEARCH_FIELDS[name], value) for name, value in (filters or {}).items()
+    ]
+    for row in rows:
+        ts = row.get("ts")
+        if since is not None and (ts is None or ts < since):
+            continue
+        if until is not None and (ts is None or ts >= until):
+            continue
+        if all(str(row.get(field)) == value for field, value in conditions):
+            yield row
+
+
+def write_ndjson(rows: Iterable[Row], out: IO[str]) -> int:
+    count = 0
+    for row in rows:
+        out.write(json.dumps(row, ensure_ascii=False))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def write_csv(rows: Iterable[Row], out: IO[str]) -> int:
+    writer = csv.DictWriter(out, COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def to_record(row: Row) -> ExceptionRecord:
+    """把歷史記錄還原為異常記錄；歷史資料庫不保存嚴重程度，一律視為 error"""
+    data = dict(row)
+    data["timestamp"] = row.get("ts")
+    return ExceptionRecord.from_dict(data)
+
+
+# --- 虛擬時間 ---
+
+
+class _VirtualSelector:
+    """包裝事件迴圈的 selector：不實際等待，而是把虛擬時鐘推進到下一個計時器"""
+
+    def __init__(self, selector, loop: "VirtualTimeLoop"):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if not events and timeout:
+            self._loop.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """以虛擬時間運行的事件迴圈。
+
+    沒有可執行的工作時直接跳到下一個計時器，因此 asyncio.sleep 與 wait_for 的逾時
+    不佔用實際時間，數週的資料可以在數秒內重放完畢。重放的程式碼不能等待執行緒或網路。
+
+    虛擬時鐘從 0 開始。計時器至少在 MIN_STEP 秒後觸發，否則「再等極短時間」的輪詢
+    （例如令牌桶只差極小的令牌）會因為時間沒有前進而無限循環。
+    """
+
+    MIN_STEP = 0.001
+
+    def __init__(self):
+        super().__init__()
+        self._now = 0.0
+        self._selector = _VirtualSelector(self._selector, self)
+
+    def time(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += seconds
+
+    def call_at(self, when, callback, *args, context=None):
+        return super().call_at(
+            max(when, self._now + self.MIN_STEP), callback, *args, context=context
+        )
+
+
+# --- 重放用的替身 ---
+
+
+class ReplayEmailService(EmailService):
+    """不連線 SMTP 的郵件服務：只記錄每封郵件的收件人與（虛擬）發送時間"""
+
+    def __init__(self, config: AstrBotConfig, clock: Callable[[], float]):
+        super().__init__(config, MetricsRegistry())
+        self.clock = clock
+        self.emails = 0
+        self.by_recipient: TallyCounter = TallyCounter()
+        self.peak_per_hour = 0
+        self._last_hour: Deque[float] = deque()
+
+    @property
+    def is_configured(self) -> bool:
+        return True
+
+    def start_warm_up(self, loop: asyncio.AbstractEventLoop):
+        pass
+
+    async def run_blocking(self, func, *args):
+        # 在事件迴圈中直接執行，等待執行緒會讓虛擬時鐘誤以為閒置而向前跳
+        return func(*args)
+
+    async def build_message(self, subject, body, attachments=(), recipients=None):
+        return b""
+
+    async def _deliver(self, envelopes):
+        now = self.clock()
+        while envelopes:
+            recipients, _ = envelopes.pop(0)
+            self.emails += 1
+            self.by_recipient.update(recipients)
+            self._last_hour.append(now)
+        while self._last_hour and self._last_hour[0] <= now - 3600:
+            self._last_hour.popleft()
+        self.peak_per_hour = max(self.peak_per_hour, len(self._last_hour))
+
+
+class ReplaySpool:
+    """取代持久化日誌：以日誌序號追蹤每則報告，確認時記錄它從發生到送出的延遲"""
+
+    def __init__(self, clock: Callable[[], float], delays):
+        self.clock = clock
+        self.delays = delays
+        self._next_seq = 0
+        # 序號 -> 發生時間；只保存尚未送出的報告
+        self.pending: Dict[int, float] = {}
+
+    def append(self, data: Row) -> int:
+        # 記錄在其發生時間才被處理，因此目前的虛擬時間即為發生時間
+        self._next_seq += 1
+        self.pending[self._next_seq] = self.clock()
+        return self._next_seq
+
+    def ack(self, ranges, dead: bool = False):
+        now = self.clock()
+        for first_seq, last_seq in ranges:
+            for seq in range(first_seq, last_seq + 1):
+                ts = self.pending.pop(seq, None)
+                # 放棄投遞的報告已計入捨棄數，不計入送出延遲
+                if ts is not None and not dead:
+                    self.delays.observe(max(0.0, now - ts))
+
+
+class ReplayProcessor(ExceptionProcessor):
+    """統計因額度不足或斷路器而延後的報告數"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deferred_reports = 0
+
+    def _defer(self, batch, lane: str = LANE_BATCH):
+        self.deferred_reports += batch.total
+        super()._defer(batch, lane)
+
+
+def replay_config(config: Dict[str, Any]) -> AstrBotConfig:
+    """複製設定並停用會產生外部副作用的區段；SMTP 設定不會被使用"""
+    safe = {
+        section: dict(values) if isinstance(values, dict) else values
+        for section, values in config.items()
+        if section not in DISABLED_SECTIONS
+    }
+    return AstrBotConfig(safe)
+
+
+async def _replay(
+    records: Iterator[ExceptionRecord], config: AstrBotConfig, drain_seconds: float
+) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    email_service = ReplayEmailService(config, loop.time)
+    processor = ReplayProcessor(
+        config, email_service, None, loop, None, email_service.metrics, clock=loop.time
+    )
+    delays = processor.metrics.histogram(
+        "replay_delay_seconds", "報告從發生到送出的延遲", DELAY_BUCKETS
+    )
+    processor.spool = ReplaySpool(loop.time, delays)
+
+    reports = 0
+    origin = None
+    for record in records:
+        if origin is None:
+            origin = record.timestamp or 0.0
+        wait = (record.timestamp or origin) - origin - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await processor.process_record(record)
+        reports += 1
+
+    # 資料結束後繼續推進時間，讓批處理窗口與延後的報告有機會送出
+    deadline = loop.time() + drain_seconds
+    while loop.time() < deadline and (
+        processor.deferred
+        or processor.message_buffer
+        or (processor.batch_send_task and not processor.batch_send_task.done())
+    ):
+        await asyncio.sleep(60)
+    undelivered = len(processor.spool.pending)
+    if processor.deferred_drain_task and not processor.deferred_drain_task.done():
+        processor.deferred_drain_task.cancel()
+    await email_service.close()
+
+    dropped = processor.metrics.get("reports_dropped_total")
+    return {
+        "reports": reports,
+        "emails": email_service.emails,
+        "batches": processor.batch_sizes.count,
+        "storm_alerts": (
+            processor.analytics.storms
+            if processor.analytics and processor.storm_alerts
+            else 0
+        ),
+        "peak_per_hour": email_service.peak_per_hour,
+        "recipients": dict(email_service.by_recipient),
+        "deferred": processor.deferred_reports,
+        "undelivered": undelivered,
+        "dropped": {reason: count for (reason,), count in dropped.values.items()},
+        "delay_p50": delays.quantile(0.5),
+        "delay_p95": delays.quantile(0.95),
+        "delay_max": delays.max,
+    }
+
+
+def replay(
+    records: Iterable[ExceptionRecord],
+    config: Dict[str, Any],
+    drain_seconds: float = 86400,
+) -> Dict[str, Any]:
+    """以虛擬時鐘把記錄依發生時間送入 ExceptionProcessor，統計這組設定會寄出的郵件。
+
+    返回郵件數、批次數、風暴警報數、最高每小時郵件數、延後與最終未送出的報告數、
+    各原因的捨棄數，以及報告從發生到送出的延遲百分位數（秒）。
+    資料結束後最多再推進 drain_seconds 秒，仍未送出的報告計入 undelivered。
+    """
+    loop = VirtualTimeLoop()
+    try:
+        return loop.run_until_complete(
+            _replay(iter(records), replay_config(config), drain_seconds)
+        )
+    finally:
+        loop.close()
@@ -0,0 +1,131 @@
+from itertools import product
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from astrbot.api import logger
+
+from .records import SEVERITIES, SEVERITY_RANK, ExceptionRecord
+
+# 可用於路由條件的記錄欄位，順序即索引鍵中值的順序
+ROUTE_FIELDS = ("platform", "group_id", "keyword", "severity")
+
+# 路由以排序後的收件人元組表示，可直接作為批次分區的鍵；空元組代表預設收件人
+Route = Tuple[str, ...]
+DEFAULT_ROUTE: Route = ()
+
+# 記錄欄位 -> 路由的匹配結果快取上限
+MAX_CACHED_ROUTES = 4096
+
+
+def _expand_values(field: str, value: str) -> Optional[FrozenSet[str]]:
+    """展開條件值：以 | 分隔多個值；嚴重程度可寫成 warning+ 表示此等級及以上"""
+    values = set()
+    for option in value.split("|"):
+        option = option.strip()
+        if field == "severity":
+            option = option.lower()
+            at_least = option.endswith("+")
+            option = option.rstrip("+")
+            if option not in SEVERITY_RANK:
+                return None
+            if at_least:
+                values.update(SEVERITIES[SEVERITY_RANK[option] :])
+                continue
+        values.add(option)
+    return frozenset(values)
+
+
+def parse_route(rule: str) -> Optional[Tuple[Dict[str, FrozenSet[str]], Route]]:
+    """解析「條件 => 收件人」格式的路由規則；格式錯誤時返回 None。
+
+    條件以 ; 分隔，每個條件為「欄位=值」，值可用 | 分隔多個；條件寫成 * 表示匹配所有報告。
+    收件人以 , 分隔。例如 ``platform=aiocqhttp; severity=error+ => qq-ops@example.com``。
+    """
+    conditions_text, sep, recipients_text = str(rule).partition("=>")
+    recipients = tuple(
+        sorted({address.strip() for address in recipients_text.split(",")} - {""})
+    )
+    if not sep or not recipients:
+        return None
+    conditions: Dict[str, FrozenSet[str]] = {}
+    for condition in conditions_text.split(";"):
+        condition = condition.strip()
+        if not condition or condition == "*":
+            continue
+        field, eq, value = condition.partition("=")
+        field = field.strip()
+        if not eq or field not in ROUTE_FIELDS or field in conditions:
+            return None
+        values = _expand_values(field, value)
+        if not values:
+            return None
+        conditions[field] = values
+    return conditions, recipients
+
+
+class RoutingTable:
+    """依平台、群組、關鍵字與嚴重程度決定收件人的路由表。
+
+    規則在載入設定時依其使用的欄位組合（遮罩）分組，每組編譯成一個
+    「欄位值元組 -> 收件人集合」的雜湊索引；匹配一筆報告只需對每個遮罩查詢一次，
+    遮罩最多 2^4 種，與規則數量無關。所有匹配規則的收件人取聯集；
+    沒有規則匹配時使用預設收件人（``recipient_emails``）。
+    """
+
+    def __init__(self, rules: Iterable[str] = ()):
+        self.rules = 0
+        # 遮罩（欄位索引元組）-> 欄位值元組 -> 收件人集合
+        self._index: Dict[Tuple[int, ...], Dict[Tuple[str, ...], Set[str]]] = {}
+        for rule in rules or ():
+            parsed = parse_route(rule)
+            if parsed is None:
+                logger.warning(
+                    f"[ErrorMonitor] 忽略格式錯誤的路由規則「{rule}」，應為「欄位=值; ... => 收件人, ...」。"
+                )
+                continue
+            conditions, recipients = parsed
+            mask = tuple(
+                i for i, field in enumerate(ROUTE_FIELDS) if field in conditions
+            )
+            index = self._index.setdefault(mask, {})
+            # 多值條件在編譯時展開為笛卡兒積，匹配時仍只需一次查詢
+            for values in product(*(conditions[ROUTE_FIELDS[i]] for i in mask)):
+                index.setdefault(values, set()).update(recipients)
+            self.rules += 1
+        self._masks = list(self._index.items())
+        self._cache: Dict[Tuple[str, ...], Route] = {}
+
+    def __len__(self) -> int:
+        return self.rules
+
+    @staticmethod
+    def _key(record: ExceptionRecord) -> Tuple[str, ...]:
+        return (
+            str(record.platform or ""),
+            "" if not record.is_group else str(record.group_id),
+            str(record.keyword or ""),
+            record.severity,
+        )
+
+    def route(self, record: ExceptionRecord) -> Route:
+        """返回記錄的路由；需在 resolve() 與決定嚴重程度之後呼叫"""
+        if not self._masks:
+            return DEFAULT_ROUTE
+        key = self._key(record)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        recipients: Set[str] = set()
+        for mask, index in self._masks:
+            matched = index.get(tuple(key[i] for i in mask))
+            if matched:
+                recipients |= matched
+        route = tuple(sorted(recipients)) if recipients else DEFAULT_ROUTE
+        if len(self._cache) >= MAX_CACHED_ROUTES:
+            self._cache.clear()
+        self._cache[key] = route
+        return route
+
+    @staticmethod
+    def recipients(route: Route, default: List[str]) -> List[str]:
+        return list(route) if route else list(default)
@@ -0,0 +1,89 @@
+import math
+import time
+from typing import Callable
+
+Clock = Callable[[], float]
+
+
+class EWMARate:
+    """以指數衰減計數估計事件到達速率（每秒事件數）。
+
+    每次事件使計數加一，計數隨時間以 exp(-dt / tau) 衰減，
+    速率即 計數 / tau；更新與讀取皆為 O(1)。
+    """
+
+    __slots__ = ("tau", "clock", "_count", "_updated")
+
+    def __init__(self, tau: float = 60.0, clock: Clock = time.monotonic):
+        self.tau = max(1e-3, float(tau))
+        self.clock = clock
+        self._count = 0.0
+        self._updated = clock()
+
+    def _decay(self, now: float):
+        if now > self._updated:
+            self._count *= math.exp(-(now - self._updated) / self.tau)
+            self._updated = now
+
+    def observe(self, n: int = 1):
+        self._decay(self.clock())
+        self._count += n
+
+    @property
+    def rate(self) -> float:
+        self._decay(self.clock())
+        return self._count / self.tau
+
+    @property
+    def per_minute(self) -> float:
+        return self.rate * 60
+
+
+class AdaptiveBatchWindow:
+    """依到達速率動態調整批處理窗口。
+
+    - 緩衝區安靜超過 ``quiet_seconds``，或不重複錯誤數達到 ``flush_threshold`` 時提前發送
+      （但至少等待 ``min_window``）
+    - 到達速率超過 ``storm_per_minute`` 時，窗口按比例拉長，最長為 ``max_window``
+    """
+
+    def __init__(
+        self,
+        base_window: float = 60,
+        min_window: float = 5,
+        max_window: float = 300,
+        quiet_seconds: float = 10,
+        flush_threshold: int = 50,
+        storm_per_minute: float = 30,
+        rate: EWMARate = None,
+    ):
+        self.base_window = max(0.0, float(base_window))
+        self.min_window = min(max(0.0, float(min_window)), self.base_window)
+        self.max_window = max(float(max_window), self.base_window)
+        self.quiet_seconds = max(0.0, float(quiet_seconds))
+        self.flush_threshold = max(0, int(flush_threshold))
+        self.storm_per_minute = max(1e-3, float(storm_per_minute))
+        self.rate = rate or EWMARate()
+
+    def current_window(self) -> float:
+        """依目前的到達速率計算窗口長度"""
+        stretch = max(1.0, self.rate.per_minute / self.storm_per_minute)
+        return min(self.max_window, self.base_window * stretch)
+
+    def next_flush_delay(
+        self, first_arrival: float, last_arrival: float, buffered: int, now: float
+    ) -> float:
+        """返回距離應發送批次的秒數；0 表示應立即發送"""
+        elapsed = now - first_arrival
+        deadline = self.current_window() - elapsed
+        if deadline <= 0:
+            return 0.0
+
+        until_min = self.min_window - elapsed
+        if self.flush_threshold and buffered >= self.flush_threshold:
+            return max(0.0, until_min)
+
+        until_quiet = self.quiet_seconds - (now - last_arrival)
+        if self.quiet_seconds:
+            return max(0.0, min(deadline, max(until_quiet, until_min)))
+        return deadline
@@ -1,24 +1,215 @@
 import asyncio
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import functools
+import importlib
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-import aiosmtplib
 from astrbot.api import logger, AstrBotConfig
 from astrbot.api.event import AstrMessageEvent
 
+from .aggregation import BatchBuffer, SeqRanges, compute_fingerprint
+from .analytics import ErrorAnalytics
+from .coordination import build_coordinator
+from .cache import ExceptionCache
+from .capture import CapturePolicy
+from .delivery import (
+    PERMANENT,
+    CircuitBreaker,
+    ConfigurationError,
+    DeliveryManager,
+    classify_smtp_error,
+)
+from .digest import DigestScheduler
+from .history import HistoryStore
+from .limiter import RateLimiter
+from .metrics import SIZE_BUCKETS, MetricsRegistry
+from .notifiers import build_notifier_hub
+from .priority import (
+    LANE_BATCH,
+    LANE_DIGEST,
+    LANE_IMMEDIATE,
+    DeferredLanes,
+    SeverityRules,
+    lane_for,
+)
+from .records import ExceptionRecord
+from .reload import SMTP_CONNECTION_FIELDS, Changes, commit, split_changes
+from .routing import DEFAULT_ROUTE, Route, RoutingTable
+from .scheduler import AdaptiveBatchWindow, EWMARate
+from .spool import ReportSpool
 from .templates import (
     generate_message_exception_email,
     generate_batch_message_exception_email,
+    generate_storm_alert_email,
+    generate_digest_email,
+    build_report_attachment,
+)
+
+if TYPE_CHECKING:
+    import aiosmtplib
+
+# SMTP 客戶端與 MIME 組裝所需的模組延遲到預熱或第一次發送時才匯入，不拖慢插件載入
+LAZY_MODULES = (
+    "aiosmtplib",
+    "email.policy",
+    "email.mime.multipart",
+    "email.mime.text",
+    "email.mime.application",
 )
+# 解析後的 SMTP 伺服器位址的快取時間（秒），逾期後在下一次建立連線時重新解析
+DNS_CACHE_SECONDS = 300
+# 以快取位址建立 TCP 連線的逾時（秒），與 aiosmtplib 的預設值相同
+CONNECT_TIMEOUT = 60
+
+
+class _PooledConnection:
+    """連線池中的一條已驗證 SMTP 連線"""
+
+    __slots__ = ("client", "last_used")
+
+    def __init__(self, client: "aiosmtplib.SMTP"):
+        self.client = client
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """維護可重用、已完成 STARTTLS 與登入的 SMTP 連線"""
+
+    def __init__(
+        self,
+        connect: Callable[[], Awaitable["aiosmtplib.SMTP"]],
+        max_size: int = 2,
+        idle_timeout: float = 300,
+        keepalive_interval: float = 60,
+    ):
+        self._connect = connect
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self._idle: Deque[_PooledConnection] = deque()
+        self._semaphore = asyncio.Semaphore(self.max_size)
+        self._keepalive_task: Optional[asyncio.Task] = None
+        # 重新載入設定後被新連線池取代；借出中的連線歸還時直接關閉
+        self.retired = False
+
+        # 統計資訊，供 exception_status 顯示
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    @asynccontextmanager
+    async def connection(self):
+        """借出一條可用連線，使用完畢後自動歸還；發生錯誤的連線將被丟棄。"""
+        async with self._semaphore:
+            conn = await self._checkout()
+            try:
+                yield conn.client
+            except BaseException:
+                await self._discard(conn)
+                raise
+            if self.retired:
+                await self._discard(conn)
+                return
+            conn.last_used = time.monotonic()
+            self._idle.append(conn)
+            self._ensure_keepalive()
+
+    async def _checkout(self) -> _PooledConnection:
+        """優先取用閒置連線；過期或探測失敗的連線會被關閉並重新建立。"""
+        while self._idle:
+            conn = self._idle.pop()
+            idle_for = time.monotonic() - conn.last_used
+            if idle_for >= self.idle_timeout or not conn.client.is_connected:
+                await self._discard(conn)
+                continue
+            if idle_for >= self.keepalive_interval and not await self._probe(conn):
+                self.reconnects += 1
+                continue
+            self.hits += 1
+            return conn
+
+        self.misses += 1
+        return _PooledConnection(await self._connect())
+
+    async def _probe(self, conn: _PooledConnection) -> bool:
+        """以 NOOP 探測連線是否仍然存活"""
+        try:
+            await conn.client.noop()
+        except Exception:
+            await self._discard(conn)
+            return False
+        conn.last_used = time.monotonic()
+        return True
+
+    async def _discard(self, conn: _PooledConnection):
+        try:
+            if conn.client.is_connected:
+                await conn.client.quit()
+        except Exception:
+            pass
+        finally:
+            conn.client.close()
+
+    def _ensure_keepalive(self):
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.get_running_loop().create_task(
+                self._keepalive_loop()
+            )
+
+    async def _keepalive_loop(self):
+        """定期對閒置連線發送 NOOP，並關閉超過閒置時限的連線；池為空時自動結束。"""
+        try:
+            while self._idle:
+                await asyncio.sleep(self.keepalive_interval)
+                now = time.monotonic()
+                for _ in range(len(self._idle)):
+                    if not self._idle:
+                        break
+                    conn = self._idle.popleft()
+                    if now - conn.last_used >= self.idle_timeout:
+                        await self._discard(conn)
+                    elif await self._probe(conn):
+                        self._idle.append(conn)
+        except asyncio.CancelledError:
+            pass
+
+    async def retire(self):
+        """停止借出新連線：關閉閒置連線，正在使用的連線在送完後歸還時關閉"""
+        self.retired = True
+        await self.close()
+
+    async def close(self):
+        """關閉所有閒置連線並停止保活任務"""
+        if self._keepalive_task and not self._keepalive_task.done():
+            self._keepalive_task.cancel()
+        while self._idle:
+            await self._discard(self._idle.pop())
 
 
 class EmailService:
     """處理郵件發送服務"""
 
-    def __init__(self, config: AstrBotConfig):
+    def __init__(self, config: AstrBotConfig, metrics: MetricsRegistry = None):
         # 如果 config 為 None，提供一個空的實例以安全地 .get()
         safe_config = config or AstrBotConfig({})
         smtp_settings = safe_config.get("smtp_settings", {})
@@ -31,54 +222,450 @@ class EmailService:
         self.sender_address = smtp_settings.get("sender_address") or self.smtp_username
         self.smtp_settings = smtp_settings  # 保存設置以供後續使用
         self.recipient_emails = notification_filtering.get("recipient_emails", [])
+        # 依平台/群組/關鍵字/嚴重程度決定收件人的路由表，未匹配的報告寄給 recipient_emails
+        self.routing = RoutingTable(notification_filtering.get("routing_rules", []))
         self.enable_ssl = smtp_settings.get("enable_ssl", True)
 
-    async def send_email_async(self, subject: str, body: str):
-        """異步發送郵件"""
-        smtp_password = self.smtp_settings.get("smtp_password", "")
-        if not all(
+        self.metrics = metrics or MetricsRegistry()
+        self.connect_latency = self.metrics.histogram(
+            "smtp_connect_seconds", "SMTP 連線建立耗時"
+        )
+        self.login_latency = self.metrics.histogram(
+            "smtp_login_seconds", "SMTP STARTTLS 與登入耗時"
+        )
+        self.send_latency = self.metrics.histogram(
+            "smtp_send_seconds", "SMTP 單封郵件傳送耗時"
+        )
+        self.build_latency = self.metrics.histogram(
+            "email_build_seconds", "MIME 郵件組裝耗時"
+        )
+        self.session_messages = self.metrics.histogram(
+            "smtp_session_messages", "每次借用 SMTP 連線送出的郵件數", SIZE_BUCKETS
+        )
+
+        self.pool = self._new_pool(smtp_settings)
+        # 重新載入設定後讓被取代的舊連線池退場的背景任務
+        self._retiring: Set[asyncio.Task] = set()
+        # 郵件渲染與 MIME 組裝（含 base64 編碼）在有界的執行緒池中進行，不阻塞共用的事件迴圈
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, int(smtp_settings.get("worker_threads", 2))),
+            thread_name_prefix="error_monitor",
+        )
+        # 暫時性失敗以帶抖動的指數退避重試，連續失敗時由斷路器暫停投遞
+        self.delivery = DeliveryManager(
+            self._deliver,
+            CircuitBreaker(
+                failure_threshold=smtp_settings.get("breaker_failure_threshold", 5),
+                reset_timeout=smtp_settings.get("breaker_reset_timeout", 60),
+            ),
+            max_attempts=smtp_settings.get("retry_max_attempts", 5),
+            base_delay=smtp_settings.get("retry_base_delay", 5),
+            max_delay=smtp_settings.get("retry_max_delay", 600),
+        )
+
+        # 背景預熱：解析位址、建立一條已登入的連線並記錄伺服器的 EHLO 能力
+        self.warm_up_on_start = smtp_settings.get("warm_up_on_start", True)
+        self.warmup_task: Optional[asyncio.Task] = None
+        # 快取的伺服器位址 [(family, proto, sockaddr)] 與其到期時間
+        self._addresses: List[Tuple[int, int, Any]] = []
+        self._addresses_expire = 0.0
+        self.capabilities: Dict[str, str] = {}
+        self.warmup_seconds: Optional[float] = None
+        self.warmup_error: Optional[str] = None
+        # 第一封郵件的投遞耗時（含建立連線），用於比較預熱的效果
+        self.first_delivery_seconds: Optional[float] = None
+        self.metrics.gauge(
+            "smtp_warmup_seconds",
+            "啟動時 SMTP 預熱（匯入、DNS、連線、EHLO、STARTTLS 與登入）的耗時",
+            lambda: self.warmup_seconds or 0.0,
+        )
+        self.metrics.gauge(
+            "first_delivery_seconds",
+            "第一封郵件的投遞耗時",
+            lambda: self.first_delivery_seconds or 0.0,
+        )
+
+    def _new_pool(self, smtp_settings: Dict[str, Any]) -> SMTPConnectionPool:
+        return SMTPConnectionPool(
+            self._open_connection,
+            max_size=smtp_settings.get("pool_size", 2),
+            idle_timeout=smtp_settings.get("pool_idle_timeout", 300),
+            keepalive_interval=smtp_settings.get("pool_keepalive_interval", 60),
+        )
+
+    @property
+    def is_configured(self) -> bool:
+        return all(
             [
                 self.smtp_server,
                 self.smtp_username,
-                smtp_password,
+                self.smtp_settings.get("smtp_password", ""),
                 self.recipient_emails,
             ]
+        )
+
+    def start_warm_up(self, loop: asyncio.AbstractEventLoop):
+        if self.warm_up_on_start:
+            self.warmup_task = loop.create_task(self.warm_up())
+
+    async def warm_up(self):
+        """在背景預熱郵件服務，使第一封異常郵件不必等待 DNS、TCP、EHLO、STARTTLS 與登入。
+
+        在執行緒中匯入 SMTP 與 MIME 模組，解析並快取伺服器位址，然後建立一條已登入的連線
+        放回連線池（同時驗證帳號密碼並記錄 EHLO 能力）。失敗只記錄警告，發送時會照常重新連線。
+        """
+        started = time.perf_counter()
+        try:
+            for name in LAZY_MODULES:
+                await asyncio.to_thread(importlib.import_module, name)
+            if not self.is_configured:
+                return
+            async with self.pool.connection():
+                pass
+            logger.info(
+                f"[ErrorMonitor] SMTP 預熱完成，耗時 {(time.perf_counter() - started) * 1000:.0f} ms。"
+                f"伺服器支援: {', '.join(self.capabilities) or '無'}"
+            )
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.warmup_error = f"{type(e).__name__}: {e}"
+            if classify_smtp_error(e) == PERMANENT:
+                logger.error(
+                    f"[ErrorMonitor] SMTP 預熱失敗，請檢查伺服器設定與帳號密碼: {self.warmup_error}"
+                )
+            else:
+                logger.warning(
+                    f"[ErrorMonitor] SMTP 預熱失敗，將在發送郵件時重新連線: {self.warmup_error}"
+                )
+        finally:
+            self.warmup_seconds = time.perf_counter() - started
+
+    async def _resolve(self) -> List[Tuple[int, int, Any]]:
+        """解析 SMTP 伺服器位址並快取 DNS_CACHE_SECONDS 秒"""
+        if not self._addresses or time.monotonic() >= self._addresses_expire:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                self.smtp_server, self.smtp_port, type=socket.SOCK_STREAM
+            )
+            self._addresses = [
+                (family, proto, sockaddr) for family, _, proto, _, sockaddr in infos
+            ]
+            self._addresses_expire = time.monotonic() + DNS_CACHE_SECONDS
+        return self._addresses
+
+    async def _connect_socket(self) -> socket.socket:
+        """以快取的位址依序嘗試建立 TCP 連線；全部失敗時清除快取，下一次連線重新解析"""
+        loop = asyncio.get_running_loop()
+        error: Optional[BaseException] = None
+        for family, proto, sockaddr in await self._resolve():
+            sock = socket.socket(family, socket.SOCK_STREAM, proto)
+            sock.setblocking(False)
+            try:
+                await asyncio.wait_for(
+                    loop.sock_connect(sock, sockaddr), CONNECT_TIMEOUT
+                )
+                return sock
+            except (OSError, asyncio.TimeoutError) as e:
+                sock.close()
+                error = e
+            except BaseException:
+                sock.close()
+                raise
+        self._addresses = []
+        raise ConnectionError(
+            f"無法連線到 SMTP 伺服器 {self.smtp_server}:{self.smtp_port}: {error}"
+        )
+
+    async def _open_connection(self) -> "aiosmtplib.SMTP":
+        """建立新的 SMTP 連線，完成 STARTTLS 與登入"""
+        import aiosmtplib
+
+        smtp_password = self.smtp_settings.get("smtp_password", "")
+        # Brevo 在 587 端口上使用 STARTTLS
+        # 我們需要連接，然後手動升級到 TLS 並登錄
+        with self.connect_latency.time():
+            # 以快取的位址自行建立 TCP 連線，省去 DNS 查詢；hostname 仍用於 TLS 憑證驗證
+            sock = await self._connect_socket()
+            smtp_client = aiosmtplib.SMTP(hostname=self.smtp_server, sock=sock)
+            try:
+                await smtp_client.connect()
+            except BaseException:
+                smtp_client.close()
+                sock.close()
+                raise
+        login_started = time.perf_counter()
+        try:
+            if self.enable_ssl:
+                try:
+                    await smtp_client.starttls()
+                except aiosmtplib.SMTPException as e:
+                    # 如果連線已自動升級到 TLS，aiosmtplib 會引發此異常。
+                    # 我們可以安全地忽略它並繼續。
+                    if "already using tls" not in str(e).lower():
+                        raise  # 重新引發其他非預期的 SMTP 錯誤
+
+            # 使用您的 Brevo 登錄名和 SMTP 密鑰進行驗證
+            await smtp_client.login(self.smtp_username, smtp_password)
+        except BaseException:
+            smtp_client.close()
+            raise
+        self.login_latency.observe(time.perf_counter() - login_started)
+        self.capabilities = dict(smtp_client.esmtp_extensions)
+        return smtp_client
+
+    def prepare_reload(
+        self, config: AstrBotConfig, changes: Changes
+    ) -> List[Callable[[], None]]:
+        """準備就地套用新設定的步驟（見 reload.commit）。
+
+        所有解析與驗證都在這裡完成，失敗時直接拋出異常且不改動任何狀態。
+        連線相關欄位變更時以新的連線池取代舊池：舊池中閒置的連線立即關閉，
+        正在送信的連線在送完後歸還時關閉，因此進行中的投遞不會中斷；
+        之後的投遞與重試都使用新的連線池。
+        """
+        smtp_settings = config.get("smtp_settings", {})
+        notification_filtering = config.get("notification_filtering", {})
+        steps: List[Callable[[], None]] = []
+
+        filtering_changes = changes.get("notification_filtering", {})
+        if (
+            "recipient_emails" in filtering_changes
+            or "routing_rules" in filtering_changes
         ):
-            logger.warning("郵件服務未配置，無法發送郵件。")
-            return
+            recipient_emails = list(notification_filtering.get("recipient_emails", []))
+            routing = RoutingTable(notification_filtering.get("routing_rules", []))
+
+            def apply_routing():
+                # 已進入緩衝區的報告保留擷取時的路由；預設路由在發送時才解析為 recipient_emails
+                self.recipient_emails = recipient_emails
+                self.routing = routing
+
+            steps.append(apply_routing)
+
+        smtp_changes = changes.get("smtp_settings", {})
+        if not smtp_changes:
+            return steps
+        idle_timeout = float(smtp_settings.get("pool_idle_timeout", 300))
+        keepalive_interval = float(smtp_settings.get("pool_keepalive_interval", 60))
+        worker_threads = max(1, int(smtp_settings.get("worker_threads", 2)))
+        retry = (
+            int(smtp_settings.get("retry_max_attempts", 5)),
+            float(smtp_settings.get("retry_base_delay", 5)),
+            float(smtp_settings.get("retry_max_delay", 600)),
+        )
+        breaker = (
+            int(smtp_settings.get("breaker_failure_threshold", 5)),
+            float(smtp_settings.get("breaker_reset_timeout", 60)),
+        )
+        rotate = any(field in smtp_changes for field in SMTP_CONNECTION_FIELDS)
+        pool = self._new_pool(smtp_settings) if rotate else None
+
+        def apply_smtp():
+            self.smtp_settings = smtp_settings
+            self.smtp_server = smtp_settings.get("smtp_server", "").strip()
+            self.smtp_port = smtp_settings.get("smtp_port", 587)
+            self.smtp_username = smtp_settings.get("smtp_username", "")
+            self.sender_address = (
+                smtp_settings.get("sender_address") or self.smtp_username
+            )
+            self.enable_ssl = smtp_settings.get("enable_ssl", True)
+            self.warm_up_on_start = smtp_settings.get("warm_up_on_start", True)
+            self.delivery.reconfigure(*retry)
+            self.delivery.breaker.reconfigure(*breaker)
+            if "worker_threads" in smtp_changes:
+                # 舊執行緒池中已排入的工作會照常完成
+                self.executor.shutdown(wait=False)
+                self.executor = ThreadPoolExecutor(
+                    max_workers=worker_threads, thread_name_prefix="error_monitor"
+                )
+            if pool is not None:
+                self._rotate_pool(pool)
+            else:
+                self.pool.idle_timeout = idle_timeout
+                self.pool.keepalive_interval = keepalive_interval
 
-        msg = MIMEMultipart()
+        steps.append(apply_smtp)
+        return steps
+
+    def _rotate_pool(self, pool: SMTPConnectionPool):
+        """改用新的連線池，並在背景讓舊池優雅退場"""
+        loop = asyncio.get_running_loop()
+        retired = loop.create_task(self.pool.retire())
+        self._retiring.add(retired)
+        retired.add_done_callback(self._retiring.discard)
+        # 統計資訊延續到新的連線池
+        pool.hits, pool.misses, pool.reconnects = (
+            self.pool.hits,
+            self.pool.misses,
+            self.pool.reconnects,
+        )
+        self.pool = pool
+        self._addresses = []
+        self.capabilities = {}
+        self.warmup_error = None
+        if self.warmup_task and not self.warmup_task.done():
+            self.warmup_task.cancel()
+        # 以新的伺服器與帳號預熱，同時及早驗證新的帳號密碼
+        self.start_warm_up(loop)
+
+    async def run_blocking(self, func, *args):
+        """在郵件服務的執行緒池中執行阻塞或 CPU 密集的工作"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(func, *args)
+        )
+
+    def route_recipients(self, route: Route = DEFAULT_ROUTE) -> List[str]:
+        return self.routing.recipients(route, self.recipient_emails)
+
+    def _build_message(
+        self,
+        subject: str,
+        body: str,
+        attachments: List[Tuple[str, bytes]] = (),
+        recipients: List[str] = None,
+    ) -> bytes:
+        """組裝並序列化 MIME 郵件；在執行緒池中執行"""
+        from email.mime.application import MIMEApplication
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        from email.policy import SMTP
+
+        started = time.perf_counter()
+        msg = MIMEMultipart(policy=SMTP)
         msg["From"] = self.sender_address
-        msg["To"] = ", ".join(self.recipient_emails)
+        msg["To"] = ", ".join(recipients or self.recipient_emails)
         msg["Subject"] = subject
-        msg.attach(MIMEText(body, "html", "utf-8"))
+        msg.attach(MIMEText(body, "html", "utf-8", policy=SMTP))
+        for filename, data in attachments:
+            part = MIMEApplication(data, "gzip", policy=SMTP)
+            part.add_header("Content-Disposition", "attachment", filename=filename)
+            msg.attach(part)
+        message = msg.as_bytes()
+        self.build_latency.observe(time.perf_counter() - started)
+        return message
 
+    async def build_message(
+        self,
+        subject: str,
+        body: str,
+        attachments: List[Tuple[str, bytes]] = (),
+        recipients: List[str] = None,
+    ) -> bytes:
+        return await self.run_blocking(
+            self._build_message, subject, body, attachments, recipients
+        )
+
+    async def _deliver(self, envelopes: List[Tuple[List[str], bytes]]):
+        """透過連線池中的同一條連線依序送出多封已組裝的郵件（收件人, 內容）。
+
+        失敗時直接拋出異常，由投遞層決定是否重試；已送出的郵件會從 envelopes 中移除，
+        因此重試只會重送尚未送出的部分。
+        """
+        import aiosmtplib
+
+        if not self.is_configured:
+            raise ConfigurationError("郵件服務未配置")
+
+        started = time.perf_counter()
+        try:
+            await self._send_envelopes(envelopes)
+        except aiosmtplib.SMTPServerDisconnected:
+            # 池中的連線可能已被伺服器單方面關閉，透明地以新連線重試一次
+            self.pool.reconnects += 1
+            await self._send_envelopes(envelopes)
+        if self.first_delivery_seconds is None:
+            self.first_delivery_seconds = time.perf_counter() - started
+
+    async def _send_envelopes(self, envelopes: List[Tuple[List[str], bytes]]):
+        sent = 0
         try:
-            # Brevo 在 587 端口上使用 STARTTLS
-            # 我們需要連接，然後手動升級到 TLS 並登錄
-            smtp_client = aiosmtplib.SMTP(
-                hostname=self.smtp_server, port=self.smtp_port
-            )
-            async with smtp_client:
-                if self.enable_ssl:
-                    try:
-                        await smtp_client.starttls()
-                    except aiosmtplib.SMTPException as e:
-                        # 如果連線已自動升級到 TLS，aiosmtplib 會引發此異常。
-                        # 我們可以安全地忽略它並繼續。
-                        if "already using tls" not in str(e).lower():
-                            raise  # 重新引發其他非預期的 SMTP 錯誤
-
-                # 使用您的 Brevo 登錄名和 SMTP 密鑰進行驗證
-                await smtp_client.login(self.smtp_username, smtp_password)
-
-                # 發送郵件
-                await smtp_client.send_message(msg)
-            logger.info(f"成功發送異常郵件至: {', '.join(self.recipient_emails)}")
+            async with self.pool.connection() as smtp_client:
+                while envelopes:
+                    recipients, message = envelopes[0]
+                    with self.send_latency.time():
+                        await smtp_client.sendmail(
+                            self.sender_address, recipients, message
+                        )
+                    envelopes.pop(0)
+                    sent += 1
+                    logger.info(f"成功發送異常郵件至: {', '.join(recipients)}")
+        finally:
+            if sent:
+                self.session_messages.observe(sent)
+
+    async def send_email_async(self, subject: str, body: str) -> bool:
+        """異步發送郵件（不重試），返回是否成功送出"""
+        if not self.is_configured:
+            logger.warning("郵件服務未配置，無法發送郵件。")
+            return False
+        try:
+            message = await self.build_message(subject, body)
+            await self._deliver([(self.recipient_emails, message)])
+            return True
         except Exception as e:
             logger.error(
                 f"發送郵件失敗，請檢查 SMTP 配置和網路通信。異常類型: {type(e).__name__}"
             )
+            return False
+
+    async def submit(
+        self,
+        subject: str,
+        body: str,
+        on_success: Callable[[], None] = None,
+        on_failure: Callable[[bool], None] = None,
+        attachments: List[Tuple[str, bytes]] = (),
+        recipients: List[str] = None,
+        on_cancel: Callable[[], None] = None,
+    ) -> bool:
+        """透過重試佇列投遞郵件；最終結果以 on_success / on_failure 回呼通知，被取消時呼叫 on_cancel"""
+        return await self.submit_many(
+            [(subject, body, attachments, recipients)],
+            on_success,
+            on_failure,
+            on_cancel,
+        )
+
+    async def submit_many(
+        self,
+        messages: List[Tuple[str, str, List[Tuple[str, bytes]], List[str]]],
+        on_success: Callable[[], None] = None,
+        on_failure: Callable[[bool], None] = None,
+        on_cancel: Callable[[], None] = None,
+    ) -> bool:
+        """將多封郵件（主旨, 正文, 附件, 收件人）作為一次投遞，在同一個已驗證的 SMTP 連線中送出。
+
+        全部送出後才呼叫 on_success；重試只重送尚未送出的郵件。
+        """
+        if not self.is_configured:
+            logger.warning("郵件服務未配置，無法發送郵件。")
+            if on_failure:
+                on_failure(True)
+            return False
+        # 郵件只組裝一次，重試時直接重用序列化後的內容
+        envelopes = []
+        for subject, body, attachments, recipients in messages:
+            recipients = list(recipients or self.recipient_emails)
+            message = await self.build_message(subject, body, attachments, recipients)
+            envelopes.append((recipients, message))
+        return await self.delivery.submit(envelopes, on_success, on_failure, on_cancel)
+
+    async def close(self):
+        """取消待重試的投遞並關閉連線池中的所有連線"""
+        if self.warmup_task and not self.warmup_task.done():
+            self.warmup_task.cancel()
+            await asyncio.gather(self.warmup_task, return_exceptions=True)
+        await self.delivery.close()
+        await self.pool.close()
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 批次內容改以附件提供時，郵件正文中列出的錯誤種類數
+ATTACHMENT_SUMMARY_ENTRIES = 10
+
+# 延後發送任務單次等待的上限，避免在額度永遠不足（例如上限設為 0）時無限期休眠
+MAX_DEFER_SLEEP_SECONDS = 3600
 
 
 class ExceptionProcessor:
@@ -91,6 +678,8 @@ class ExceptionProcessor:
         star_instance,
         main_loop: asyncio.AbstractEventLoop,
         data_dir: "Path",
+        metrics: MetricsRegistry = None,
+        clock: Callable[[], float] = time.monotonic,
     ):
         self.star_instance = star_instance
         self.email_service = email_service
@@ -98,30 +687,740 @@ class ExceptionProcessor:
         self.data_dir = data_dir
         safe_config = config or AstrBotConfig({})
         rate_limit_batching = safe_config.get("rate_limit_batching", {})
+        notification_filtering = safe_config.get("notification_filtering", {})
 
+        self.max_rendered_entries = notification_filtering.get(
+            "max_rendered_entries", 50
+        )
+        self.attachment_threshold_bytes = (
+            notification_filtering.get("attachment_threshold_kb", 256) * 1024
+        )
+        self.attachment_format = notification_filtering.get("attachment_format", "html")
         self.max_emails_per_hour = rate_limit_batching.get("max_emails_per_hour", 10)
         self.enable_batching = rate_limit_batching.get("enable_batching", True)
         self.batch_window_seconds = rate_limit_batching.get("batch_window_seconds", 60)
-        self.message_buffer: List[Dict[str, Any]] = []
+        self.adaptive_batching = rate_limit_batching.get("adaptive_batching", True)
+        # 所有限流、批處理窗口與統計的時間都取自 clock，離線重放時注入虛擬時鐘
+        self.clock = clock
+        # 到達速率的 EWMA 估計，用於動態調整批處理窗口
+        self.arrival_rate = EWMARate(tau=60, clock=self.clock)
+        self.batch_window = AdaptiveBatchWindow(
+            base_window=self.batch_window_seconds,
+            min_window=rate_limit_batching.get("min_batch_window_seconds", 5),
+            max_window=rate_limit_batching.get("max_batch_window_seconds", 300),
+            quiet_seconds=rate_limit_batching.get("batch_quiet_seconds", 10),
+            flush_threshold=rate_limit_batching.get("batch_flush_threshold", 50),
+            storm_per_minute=rate_limit_batching.get("storm_rate_per_minute", 30),
+            rate=self.arrival_rate,
+        )
+        self._batch_first_arrival = 0.0
+        self._batch_last_arrival = 0.0
+        self._batch_wakeup = asyncio.Event()
+        self._flush_requested = False
+        self.max_buffer_entries = rate_limit_batching.get("max_buffer_entries", 200)
+        self.buffer_overflow_policy = rate_limit_batching.get(
+            "buffer_overflow_policy", "aggregate"
+        )
+        # 以指紋為鍵的匯總索引，記憶體佔用只與不重複的錯誤數量相關
+        self.message_buffer = self._new_buffer()
         self.batch_send_task: asyncio.Task = None
 
-        self.email_counter = {
-            "count": 0,
-            "reset_time": datetime.now() + timedelta(hours=1),
-        }
+        # 優先通道：critical 立即發送，並從每小時上限中保留一部分額度給它
+        priority_settings = safe_config.get("priority", {})
+        self.priority_lanes = priority_settings.get("enable_priority_lanes", True)
+        self.severity_rules = SeverityRules(priority_settings.get("severity_rules", []))
+        self.starvation_seconds = priority_settings.get("starvation_seconds", 600)
+        reserved = self._reserved_per_hour(
+            self.priority_lanes,
+            priority_settings.get("critical_reserved_per_hour", 2),
+            self.max_emails_per_hour,
+        )
+        self.reserved_limiter = (
+            RateLimiter(max_per_hour=reserved, clock=self.clock) if reserved else None
+        )
+
+        self.limiter = RateLimiter(
+            max_per_hour=self.max_emails_per_hour - reserved,
+            burst=rate_limit_batching.get("burst_size", 0),
+            per_recipient_per_hour=rate_limit_batching.get(
+                "max_emails_per_recipient_per_hour", 0
+            ),
+            per_keyword_per_hour=rate_limit_batching.get(
+                "max_emails_per_keyword_per_hour", 0
+            ),
+            clock=self.clock,
+        )
+
+        # 訊息截斷與完整內容抽樣，使每筆記錄的記憶體佔用有固定上限
+        capture_settings = safe_config.get("capture", {})
+        self.capture_policy = CapturePolicy(
+            max_message_bytes=capture_settings.get("max_message_bytes", 2048),
+            full_samples=capture_settings.get("full_payload_samples", 1),
+            max_payload_bytes=capture_settings.get("max_payload_kb", 64) * 1024,
+            compress=capture_settings.get("compress_payloads", True),
+        )
+
+        self.exception_cache = ExceptionCache(
+            rate_limit_batching.get("cache_size", 100)
+        )
+
+        # 持久化日誌：所有報告先寫入磁碟，成功送出後才確認，重啟後可重放
+        self.spool = (
+            ReportSpool(Path(data_dir) / "report_spool.jsonl") if data_dir else None
+        )
+        # 可查詢的異常歷史，供 exception_search 指令使用
+        history_settings = safe_config.get("history", {})
+        self.history = (
+            HistoryStore(
+                Path(data_dir) / "history.db",
+                retention_days=history_settings.get("retention_days", 30),
+                page_size=history_settings.get("page_size", 10),
+            )
+            if data_dir and history_settings.get("enable_history", True)
+            else None
+        )
+        # 因達到發送上限而延後的報告（依優先通道分開），待限流器有可用額度時再發送
+        self.deferred = DeferredLanes(
+            self._new_buffer, self.starvation_seconds, clock=self.clock
+        )
+        self.deferred_drain_task: asyncio.Task = None
+
+        self.metrics = metrics or email_service.metrics
+        self.reports_total = self.metrics.counter(
+            "reports_total", "收到的異常報告數", ("platform", "keyword")
+        )
+        self.dropped_reports = self.metrics.counter(
+            "reports_dropped_total", "未能送出或被捨棄的異常報告數", ("reason",)
+        )
+        self.batch_sizes = self.metrics.histogram(
+            "batch_size", "每封批次郵件包含的異常數", SIZE_BUCKETS
+        )
+        self.render_latency = self.metrics.histogram("render_seconds", "郵件渲染耗時")
+        self.config_reloads = self.metrics.counter(
+            "config_reloads_total", "設定重新載入次數", ("result",)
+        )
+        self.metrics.gauge(
+            "deferred_reports",
+            "延後發送中的異常數",
+            lambda: self.deferred.total,
+        )
+        self.metrics.gauge(
+            "batch_buffer_reports",
+            "批次緩衝區中的異常數",
+            lambda: self.message_buffer.total,
+        )
+
+        # 錯誤流的 Top-K 與突增偵測；偵測到錯誤風暴時立即發送警報，不等待批處理窗口
+        analytics_settings = safe_config.get("analytics", {})
+        self.analytics = (
+            ErrorAnalytics(
+                period=analytics_settings.get("top_k_period_minutes", 10) * 60,
+                z_threshold=analytics_settings.get("storm_z_threshold", 4.0),
+                min_per_minute=analytics_settings.get("storm_min_per_minute", 20),
+                storm_cooldown=analytics_settings.get("storm_cooldown_minutes", 30)
+                * 60,
+                clock=self.clock,
+            )
+            if analytics_settings.get("enable_analytics", True)
+            else None
+        )
+        self.storm_alerts = analytics_settings.get("storm_alert", True)
+
+        # 定期摘要報告：計數於擷取時增量更新，週期結束時發送，狀態持久化以便重啟後補發
+        digest_settings = safe_config.get("digest", {})
+        digest_periods = [
+            period
+            for period, enabled in (
+                ("hourly", digest_settings.get("hourly_digest", False)),
+                ("daily", digest_settings.get("daily_digest", False)),
+            )
+            if enabled
+        ]
+        self.digests = (
+            DigestScheduler(
+                Path(data_dir) / "digest_state.json",
+                digest_periods,
+                self._send_digest,
+                top_n=digest_settings.get("digest_top_n", 10),
+                skip_empty=digest_settings.get("skip_empty_digests", True),
+            )
+            if data_dir and digest_periods
+            else None
+        )
+
+        # 多實例協調（共享令牌桶、指紋去重、領導者發送批次），未啟用時為 None
+        self.coordinator = build_coordinator(safe_config, data_dir)
+        self.dedup_window_seconds = safe_config.get("coordination", {}).get(
+            "dedup_window_seconds", 600
+        )
+        self.coordination_task: asyncio.Task = None
+        # 跟隨者：已轉交但領導者尚未確認送出的批次（轉交編號 -> 日誌序號）
+        self._forwarded: Dict[str, SeqRanges] = {}
+        # 領導者：轉交來的匯總使用遞減的負數虛擬序號，不會與本地日誌序號重疊
+        self._forward_seq = 0
+        self._forward_seqs: Dict[int, str] = {}  # 虛擬序號 -> 轉交編號
+        self._forward_pending: Dict[str, List] = {}  # 轉交編號 -> [來源實例, 未送出數]
+        # 退還共享額度等短暫的背景任務，見 _track
+        self._background_tasks: Set[asyncio.Task] = set()
+        # 共享令牌桶拒絕時，下一個令牌預計可用的時間
+        self._shared_available_at = 0.0
+
+        # 郵件以外的通知通道（AstrBot 會話、Webhook、檔案/syslog），各自獨立批處理與限流
+        self.notifiers = build_notifier_hub(
+            safe_config, getattr(star_instance, "context", None), data_dir
+        )
+
+    def _new_buffer(self) -> BatchBuffer:
+        return BatchBuffer(
+            self.max_buffer_entries, self.buffer_overflow_policy, by_route=True
+        )
+
+    @staticmethod
+    def _reserved_per_hour(
+        priority_lanes: bool, reserved: int, max_per_hour: int
+    ) -> int:
+        """critical 通道的保留額度，至少為一般通道留下一封"""
+        if not priority_lanes:
+            return 0
+        return min(max(0, int(reserved)), max(0, int(max_per_hour) - 1))
+
+    def apply_config(
+        self, config: AstrBotConfig, changes: Changes
+    ) -> Tuple[List[str], List[str]]:
+        """就地套用設定變更，返回 (已套用的欄位, 需要重新載入插件才會生效的欄位)。
+
+        先為處理器與郵件服務準備好所有步驟，任何一項驗證失敗都會拋出異常且不改動狀態；
+        之後在同一次同步呼叫中全部套用。緩衝區、延後佇列、異常快取、限流器的已用額度、
+        進行中的批處理任務與待重試的投遞都會保留，因此不會遺失或重複發送報告。
+        """
+        applied, restart = split_changes(changes)
+        if applied:
+            try:
+                steps = self._prepare_reload(config, changes)
+                steps += self.email_service.prepare_reload(config, changes)
+            except Exception:
+                self.config_reloads.inc("failed")
+                raise
+            commit(steps)
+            # 讓進行中的批處理窗口依新的設定重新計算剩餘時間
+            self._batch_wakeup.set()
+        self.config_reloads.inc("applied" if applied else "unchanged")
+        return applied, restart
+
+    def _prepare_reload(
+        self, config: AstrBotConfig, changes: Changes
+    ) -> List[Callable[[], None]]:
+        rate_limit_batching = config.get("rate_limit_batching", {})
+        notification_filtering = config.get("notification_filtering", {})
+        priority_settings = config.get("priority", {})
+        rate_changes = changes.get("rate_limit_batching", {})
+        priority_changes = changes.get("priority", {})
+        steps: List[Callable[[], None]] = []
+
+        if changes.get("notification_filtering"):
+            max_rendered_entries = int(
+                notification_filtering.get("max_rendered_entries", 50)
+            )
+            attachment_threshold_bytes = (
+                int(notification_filtering.get("attachment_threshold_kb", 256)) * 1024
+            )
+            attachment_format = notification_filtering.get("attachment_format", "html")
+
+            def apply_rendering():
+                self.max_rendered_entries = max_rendered_entries
+                self.attachment_threshold_bytes = attachment_threshold_bytes
+                self.attachment_format = attachment_format
+
+            steps.append(apply_rendering)
+
+        if rate_changes.keys() & {
+            "max_emails_per_hour",
+            "burst_size",
+            "max_emails_per_recipient_per_hour",
+            "max_emails_per_keyword_per_hour",
+        } or priority_changes.keys() & {
+            "enable_priority_lanes",
+            "critical_reserved_per_hour",
+        }:
+            max_per_hour = int(rate_limit_batching.get("max_emails_per_hour", 10))
+            priority_lanes = priority_settings.get("enable_priority_lanes", True)
+            reserved = self._reserved_per_hour(
+                priority_lanes,
+                priority_settings.get("critical_reserved_per_hour", 2),
+                max_per_hour,
+            )
+            limits = (
+                max_per_hour - reserved,
+                int(rate_limit_batching.get("burst_size", 0)),
+                int(rate_limit_batching.get("max_emails_per_recipient_per_hour", 0)),
+                int(rate_limit_batching.get("max_emails_per_keyword_per_hour", 0)),
+            )
+
+            def apply_limits():
+                # 限流器就地調整，最近一小時內已送出的郵件仍計入新的上限
+                self.max_emails_per_hour = max_per_hour
+                self.priority_lanes = priority_lanes
+                self.limiter.reconfigure(*limits)
+                if not reserved:
+                    self.reserved_limiter = None
+                elif self.reserved_limiter:
+                    self.reserved_limiter.reconfigure(reserved)
+                else:
+                    self.reserved_limiter = RateLimiter(
+                        max_per_hour=reserved, clock=self.clock
+                    )
+
+            steps.append(apply_limits)
+
+        if rate_changes:
+            batch_window = AdaptiveBatchWindow(
+                base_window=rate_limit_batching.get("batch_window_seconds", 60),
+                min_window=rate_limit_batching.get("min_batch_window_seconds", 5),
+                max_window=rate_limit_batching.get("max_batch_window_seconds", 300),
+                quiet_seconds=rate_limit_batching.get("batch_quiet_seconds", 10),
+                flush_threshold=rate_limit_batching.get("batch_flush_threshold", 50),
+                storm_per_minute=rate_limit_batching.get("storm_rate_per_minute", 30),
+                rate=self.arrival_rate,
+            )
+            max_buffer_entries = int(rate_limit_batching.get("max_buffer_entries", 200))
+            overflow_policy = rate_limit_batching.get(
+                "buffer_overflow_policy", "aggregate"
+            )
+            cache_size = int(rate_limit_batching.get("cache_size", 100))
+
+            def apply_batching():
+                self.enable_batching = rate_limit_batching.get("enable_batching", True)
+                self.adaptive_batching = rate_limit_batching.get(
+                    "adaptive_batching", True
+                )
+                self.batch_window_seconds = batch_window.base_window
+                self.batch_window = batch_window
+                self.max_buffer_entries = max_buffer_entries
+                self.buffer_overflow_policy = overflow_policy
+                # 現有的緩衝區保留已累積的匯總，之後新的指紋依新的容量與策略處理
+                for buffer in (self.message_buffer, *self.deferred.buffers.values()):
+                    buffer.reconfigure(max_buffer_entries, overflow_policy)
+                self.exception_cache.resize(cache_size)
+
+            steps.append(apply_batching)
+
+        if priority_changes.keys() & {"severity_rules", "starvation_seconds"}:
+            severity_rules = SeverityRules(priority_settings.get("severity_rules", []))
+            starvation_seconds = float(priority_settings.get("starvation_seconds", 600))
+
+            def apply_priority():
+                self.severity_rules = severity_rules
+                self.starvation_seconds = starvation_seconds
+                self.deferred.aging_seconds = max(0.0, starvation_seconds)
+
+            steps.append(apply_priority)
+        return steps
+
+    async def start(self):
+        """開啟持久化日誌與歷史資料庫，並重放上次未能送出的報告"""
+        if self.history:
+            await self.history.open()
+        if self.digests:
+            await self.digests.open(self.main_loop)
+        if self.coordinator:
+            await self.coordinator.elect()
+            self.coordinator.start(self.main_loop)
+            self.coordination_task = self.main_loop.create_task(
+                self._collect_forwarded_loop()
+            )
+        if not self.spool:
+            return
+        pending = await self.spool.open()
+        if pending:
+            logger.info(f"從持久化日誌中恢復了 {len(pending)} 則尚未送出的異常報告。")
+            recovered = {
+                LANE_IMMEDIATE: self._new_buffer(),
+                LANE_BATCH: self._new_buffer(),
+            }
+            for data in pending:
+                record = ExceptionRecord.from_dict(data)
+                record.route = self.email_service.routing.route(record)
+                lane = self._lane_for(record.severity)
+                recovered.get(lane, recovered[LANE_BATCH]).add(record)
+            for lane, batch in recovered.items():
+                if batch:
+                    self._defer(batch, lane)
+
+    def _ack_reports(self, batch: BatchBuffer):
+        """在報告成功送出後於持久化日誌中確認。
+
+        只確認批次中實際包含的序號（含被溢出策略捨棄的報告），
+        其他通道或其他分區中延後的報告在各自送出之前都不會被確認。
+        """
+        self._ack_seqs(batch.seqs())
+
+    def _ack_seqs(self, seqs: SeqRanges, dead: bool = False):
+        """確認本地日誌序號；負數的虛擬序號屬於其他實例轉交的批次，改為通知來源實例。
+
+        dead 表示報告已放棄投遞，日誌會把它們移到死信檔；轉交的報告同樣回覆確認，
+        由領導者計入捨棄原因，避免來源實例在每次重啟時重新轉交。
+        """
+        local = []
+        for first, last in seqs.ranges():
+            if last < 0:
+                for seq in range(first, last + 1):
+                    self._confirm_forwarded(seq)
+            else:
+                local.append((first, last))
+        if self.spool and local:
+            self.spool.ack(local, dead=dead)
+
+    def _merge_forwarded(self, buffer: BatchBuffer, state: Dict[str, Any]):
+        """合併其他實例轉交的批次，並登記送出後要通知的來源實例"""
+        forward_id, origin = state.get("id"), state.get("origin")
+        if not forward_id or not origin:
+            # 沒有轉交編號的批次（舊版實例轉交）無法回覆確認
+            buffer.merge_state(state)
+            return
+
+        def next_seq() -> int:
+            self._forward_seq -= 1
+            self._forward_seqs[self._forward_seq] = forward_id
+            return self._forward_seq
+
+        assigned = buffer.merge_state(state, next_seq)
+        if assigned:
+            self._forward_pending[forward_id] = [origin, assigned]
+        else:
+            self._track(
+                self.main_loop.create_task(self.coordinator.confirm(origin, forward_id))
+            )
+
+    def _confirm_forwarded(self, seq: int):
+        """轉交批次中的一個匯總已送出；整批都送出後通知來源實例確認其日誌"""
+        forward_id = self._forward_seqs.pop(seq, None)
+        entry = self._forward_pending.get(forward_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del self._forward_pending[forward_id]
+        if self.coordinator:
+            self._track(
+                self.main_loop.create_task(
+                    self.coordinator.confirm(entry[0], forward_id)
+                )
+            )
+
+    async def _receive_confirmations(self):
+        """跟隨者確認領導者已送出的轉交批次"""
+        for forward_id in await self.coordinator.confirmations():
+            seqs = self._forwarded.pop(forward_id, None)
+            if seqs is not None:
+                self._ack_seqs(seqs)
+
+    def _defer(self, batch: BatchBuffer, lane: str = LANE_BATCH):
+        """暫存超出發送上限的報告，並排程在取得下一個發送額度時發送"""
+        self.deferred.add(lane, batch)
+        if self.deferred_drain_task is None or self.deferred_drain_task.done():
+            self.deferred_drain_task = self.main_loop.create_task(
+                self._drain_deferred_after_reset()
+            )
+
+    async def _drain_deferred_after_reset(self):
+        """等待限流器釋出額度，然後將同一通道中延後的報告合併為一封郵件發送。
+
+        有多個通道在等待時，由 DeferredLanes 依老化優先順序決定先發送哪一個。
+        """
+        try:
+            while self.deferred:
+                lane = self.deferred.next_lane()
+                delay = max(
+                    self._time_until_available(
+                        lane,
+                        self.deferred.keywords(lane),
+                        self._batch_recipients(self.deferred.buffers[lane]),
+                    ),
+                    self.email_service.delivery.breaker.time_until_closed(),
+                    self._shared_available_at - self.clock(),
+                )
+                if delay > 0:
+                    await asyncio.sleep(min(delay, MAX_DEFER_SLEEP_SECONDS))
+                    continue
+
+                batch = self.deferred.pop(lane)
+                logger.info(
+                    f"已取得發送額度，準備發送 {batch.total} 則延後的異常報告。"
+                )
+                await self._send_batch(batch, lane=lane)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"[ErrorMonitor] 發送延後的異常報告失敗: {e}", exc_info=True)
+
+    async def _send_batch(
+        self, batch: BatchBuffer, defer_on_limit=True, lane: str = LANE_BATCH
+    ) -> bool:
+        """發送一個批次的匯總郵件，成功後確認對應的日誌記錄。
+
+        批次依收件人路由分區，每個路由一封郵件並各自取得發送額度；同一批次的所有郵件
+        作為一次投遞，在同一條已驗證的 SMTP 連線中送出。沒有任何路由取得額度時整個批次延後；
+        若只是部分路由或部分關鍵字超出各自的上限，則先發送其餘部分，超限的匯總延後至下一個額度。
+        """
+        if not batch.aggregates:
+            # 所有報告都已被溢出策略捨棄，僅需確認日誌
+            self._ack_reports(batch)
+            return True
+
+        if defer_on_limit and self._circuit_open():
+            logger.warning(
+                f"SMTP 斷路器打開中，本次批次的 {batch.total} 則異常將延後至恢復後發送。"
+            )
+            self._defer(batch, lane)
+            return False
+
+        held = self._new_buffer()
+        # (收件人, 分區, 扣除額度的限流器, 允許的關鍵字)
+        acquired = []
+        for route, partition in batch.partition().items():
+            recipients = self.email_service.route_recipients(route)
+            limiter, allowed = await self._acquire(lane, recipients, partition.keywords)
+            if allowed is None:
+                held.merge(partition)
+                continue
+            rest = partition.split(allowed)
+            if rest:
+                held.merge(rest)
+            acquired.append((recipients, partition, limiter, allowed))
+        if not acquired:
+            if defer_on_limit:
+                logger.warning(
+                    f"已達到郵件發送上限，本次批次的 {batch.total} 則異常將延後至取得下一個發送額度時發送。"
+                )
+                self._defer(batch, lane)
+            return False
+        if held and defer_on_limit:
+            logger.warning(
+                f"部分收件人或關鍵字已達各自的發送上限，其中 {held.total} 則異常將延後發送。"
+            )
+            # 延後的匯總帶著各自的日誌序號，送出時才確認
+            self._defer(held, lane)
+        elif held:
+            # 停止時不再排程延後發送，未確認的報告留在持久化日誌中，下次啟動時重新發送
+            logger.warning(
+                f"部分收件人或關鍵字已達各自的發送上限，其中 {held.total} 則異常將在下次啟動時發送。"
+            )
+
+        # 統計快照在事件迴圈上取得；大批次的渲染可能耗時數十毫秒，移至執行緒池中進行
+        insights = self.analytics.snapshot() if self.analytics else None
+        messages = []
+        failures = []
+        refunds = []
+        for recipients, partition, limiter, allowed in acquired:
+            subject, body, attachments = await self.email_service.run_blocking(
+                self._render_batch, partition, insights
+            )
+            self.batch_sizes.observe(partition.total)
+            messages.append((subject, body, attachments, recipients))
+            # 額度在 acquire 時預扣，投遞最終失敗時退還，因此只有成功送出的郵件會計入上限
+            failures.append(
+                self._delivery_failed(
+                    recipients, allowed, partition.total, limiter, partition.seqs()
+                )
+            )
+            refunds.append(self._delivery_cancelled(recipients, allowed, limiter))
+
+        def on_success():
+            # 只確認這次送出的分區，延後的部分留在持久化日誌中
+            for _, partition, _, _ in acquired:
+                self._ack_reports(partition)
+
+        def on_failure(permanent: bool):
+            for failed in failures:
+                failed(permanent)
+
+        def on_cancel():
+            for refund in refunds:
+                refund()
+
+        return await self.email_service.submit_many(
+            messages, on_success=on_success, on_failure=on_failure, on_cancel=on_cancel
+        )
+
+    def _batch_recipients(self, batch: BatchBuffer) -> List[str]:
+        """批次中所有路由的收件人聯集"""
+        routes = {aggregate.route for aggregate in batch.aggregates.values()}
+        recipients = set()
+        for route in routes or (DEFAULT_ROUTE,):
+            recipients.update(self.email_service.route_recipients(route))
+        return sorted(recipients)
+
+    def _delivery_failed(
+        self,
+        recipients,
+        keywords,
+        count: int,
+        limiter: RateLimiter = None,
+        seqs: SeqRanges = None,
+    ):
+        """投遞最終失敗時的回呼：退還額度、計入捨棄原因，並以死信確認 seqs 中的日誌序號"""
+        refund = self._delivery_cancelled(recipients, keywords, limiter)
+
+        def on_failure(permanent: bool):
+            refund()
+            reason = "delivery_permanent" if permanent else "delivery_given_up"
+            self.dropped_reports.inc(reason, amount=count)
+            # 不再重試的報告移到死信檔，否則日誌無法壓縮，且每次重啟都會重放整批積壓
+            if seqs:
+                self._ack_seqs(seqs, dead=True)
+
+        return on_failure
+
+    def _delivery_cancelled(self, recipients, keywords, limiter: RateLimiter = None):
+        """投遞被取消時的回呼：只退還預扣的額度；報告未確認，下次啟動時重新發送"""
+        limiter = limiter or self.limiter
 
-        self.exception_cache: List[Dict[str, Any]] = []
+        def on_cancel():
+            # 退還給實際扣除額度的限流器（critical 通道可能是保留額度）
+            limiter.refund(recipients, keywords)
+            if self.coordinator:
+                self._track(self.main_loop.create_task(self._return_shared()))
 
-    def _reset_email_counter_if_needed(self):
-        """如果需要，重置郵件計數器"""
-        if datetime.now() >= self.email_counter["reset_time"]:
-            self.email_counter["count"] = 0
-            self.email_counter["reset_time"] = datetime.now() + timedelta(hours=1)
+        return on_cancel
 
-    def _is_rate_limited(self) -> bool:
-        """檢查是否達到每小時郵件發送上限"""
-        self._reset_email_counter_if_needed()
-        return self.email_counter["count"] >= self.max_emails_per_hour
+    def _render_batch(self, batch: BatchBuffer, insights=None):
+        """渲染批次郵件；內容超過附件門檻時改為摘要，並將完整報告壓縮為附件"""
+        with self.render_latency.time():
+            return self._render_batch_parts(batch, insights)
+
+    def _render_batch_parts(self, batch: BatchBuffer, insights=None):
+        aggregates = batch.values()
+        subject, body = generate_batch_message_exception_email(
+            aggregates,
+            dropped=batch.dropped,
+            max_entries=self.max_rendered_entries,
+            insights=insights,
+        )
+        if (
+            not self.attachment_threshold_bytes
+            or len(body.encode("utf-8")) <= self.attachment_threshold_bytes
+        ):
+            return subject, body, []
+
+        attachment = build_report_attachment(
+            aggregates, self.attachment_format, dropped=batch.dropped
+        )
+        subject, body = generate_batch_message_exception_email(
+            aggregates,
+            dropped=batch.dropped,
+            max_entries=ATTACHMENT_SUMMARY_ENTRIES,
+            attachment_name=attachment[0],
+            insights=insights,
+        )
+        return subject, body, [attachment]
+
+    def _time_until_available(self, lane: str, keywords, recipients=None) -> float:
+        if recipients is None:
+            recipients = self.email_service.recipient_emails
+        wait = self.limiter.time_until_available(recipients, keywords)
+        if lane == LANE_IMMEDIATE and self.reserved_limiter:
+            wait = min(wait, self.reserved_limiter.time_until_available(recipients))
+        return wait
+
+    async def _acquire(self, lane: str, recipients, keywords):
+        """取得一封郵件的發送額度，返回 (扣除額度的限流器, 允許的關鍵字集合或 None)。
+
+        critical 通道先使用保留額度；保留額度用盡時才借用一般額度，但若批次通道中
+        已有報告延後超過 starvation_seconds，則不再借用，避免批次郵件被餓死。
+        """
+        limiter, allowed = self.limiter, None
+        if lane == LANE_IMMEDIATE and self.reserved_limiter:
+            allowed = self.reserved_limiter.acquire(recipients, keywords)
+            if allowed is not None:
+                limiter = self.reserved_limiter
+        if allowed is None and (
+            lane != LANE_IMMEDIATE
+            or self.deferred.waited(LANE_BATCH) < self.starvation_seconds
+        ):
+            allowed = self.limiter.acquire(recipients, keywords)
+        if allowed is not None and not await self._acquire_shared():
+            limiter.refund(recipients, allowed)
+            allowed = None
+        return limiter, allowed
+
+    def _shared_capacity(self) -> float:
+        # 共享令牌桶涵蓋所有通道（含 critical 保留額度），容量固定取自一般限流器，
+        # 取得與退還時必須使用相同的容量，否則退還時會把桶內的令牌截斷
+        return self.limiter.burst
+
+    async def _acquire_shared(self) -> bool:
+        """啟用協調時，從所有實例共享的令牌桶取得一封郵件的額度"""
+        if not self.coordinator:
+            return True
+        wait = await self.coordinator.acquire_email(
+            self._shared_capacity(), self.max_emails_per_hour / 3600
+        )
+        if wait > 0:
+            self._shared_available_at = self.clock() + min(
+                wait, MAX_DEFER_SLEEP_SECONDS
+            )
+            return False
+        return True
+
+    async def _return_shared(self):
+        """投遞失敗時把共享令牌桶的額度退還給所有實例"""
+        await self.coordinator.return_email(self._shared_capacity())
+
+    def _track(self, task: asyncio.Task):
+        """保留背景任務的參照，避免在完成前被垃圾回收；stop() 時等待它們結束"""
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _flush_batch(self, batch: BatchBuffer, defer_on_limit=True) -> bool:
+        """批處理窗口結束時的發送入口。
+
+        啟用協調時，非領導者把批次轉交給領導者，報告保留在日誌中，直到領導者回覆已送出才確認；
+        領導者先合併其他實例轉交的批次，同一指紋只會出現一次。轉交失敗時退回自行發送。
+        """
+        if self.coordinator:
+            if not self.coordinator.is_leader:
+                forward_id = await self.coordinator.forward(batch.to_state())
+                if forward_id:
+                    logger.info(f"已將 {batch.total} 則異常轉交給領導者實例合併發送。")
+                    seqs = batch.seqs()
+                    if seqs:
+                        self._forwarded[forward_id] = seqs
+                    return True
+            else:
+                for state in await self.coordinator.collect():
+                    self._merge_forwarded(batch, state)
+        return await self._send_batch(batch, defer_on_limit)
+
+    async def _collect_forwarded_loop(self):
+        """定期確認領導者已送出的轉交批次。
+
+        領導者另外收取其他實例轉交的批次，放入自己的緩衝區並啟動批處理窗口。
+        """
+        try:
+            while True:
+                await asyncio.sleep(max(1.0, float(self.batch_window_seconds)))
+                await self._receive_confirmations()
+                if not self.coordinator.is_leader:
+                    continue
+                states = await self.coordinator.collect()
+                if not states:
+                    continue
+                for state in states:
+                    self._merge_forwarded(self.message_buffer, state)
+                self._ensure_batch_task()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"[ErrorMonitor] 收取轉交批次失敗: {e}", exc_info=True)
+
+    async def _cancel_deferred_drain(self):
+        if self.deferred_drain_task and not self.deferred_drain_task.done():
+            self.deferred_drain_task.cancel()
+            await asyncio.gather(self.deferred_drain_task, return_exceptions=True)
+
+    def _circuit_open(self) -> bool:
+        return self.email_service.delivery.breaker.time_until_closed() > 0
 
     async def stop(self):
         """終止處理器，取消任何正在運行的批處理任務並處理剩餘的緩衝區。"""
@@ -129,99 +1428,283 @@ class ExceptionProcessor:
         # 如果存在正在運行的批處理任務，等待其完成，以避免競態條件
         if self.batch_send_task and not self.batch_send_task.done():
             logger.info("等待當前的批處理任務完成...")
+            # 通知批處理任務立即結束窗口，而不是等待完整的（可能被拉長的）窗口
+            self._flush_requested = True
+            self._batch_wakeup.set()
             try:
                 # 不直接取消，而是等待它自然結束
                 await self.batch_send_task
             except asyncio.CancelledError:
                 logger.warning("批處理任務在等待期間被取消。")
             except Exception as e:
-                logger.error(f"[ErrorMonitor] 等待批處理任務完成時發生意外錯誤: {e}", exc_info=True)
+                logger.error(
+                    f"[ErrorMonitor] 等待批處理任務完成時發生意外錯誤: {e}",
+                    exc_info=True,
+                )
+
+        await self._cancel_deferred_drain()
+        if self.coordination_task and not self.coordination_task.done():
+            self.coordination_task.cancel()
 
         # 檢查緩衝區中是否在任務執行後仍有剩餘日誌（理論上不應該，但作為安全保障）
         if self.message_buffer:
-            logger.info(f"插件終止前，處理剩餘的 {len(self.message_buffer)} 則異常。")
-            messages_to_send = list(self.message_buffer)
-            self.message_buffer.clear()
-
-            if not self._is_rate_limited():
-                self.email_counter["count"] += 1
-                subject, body = generate_batch_message_exception_email(messages_to_send)
-                await self.email_service.send_email_async(subject, body)
+            batch = self.message_buffer
+            self.message_buffer = self._new_buffer()
+            logger.info(f"插件終止前，處理剩餘的 {batch.total} 則異常。")
+
+            if await self._flush_batch(batch, defer_on_limit=False):
                 logger.info("已成功發送剩餘的異常報告。")
             else:
-                logger.warning("已達到郵件發送上限，剩餘的異常報告將被捨棄。")
+                logger.warning("剩餘的異常報告未能送出，將在下次啟動時重新發送。")
+        # 最後一批不會再延後發送；仍再檢查一次，確保停止後沒有殘留的延後發送任務
+        await self._cancel_deferred_drain()
+        # 在關閉協調器之前取消待重試的投遞，被取消的投遞才能把共享額度退還給其他實例
+        await self.email_service.delivery.close()
+
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        if self.coordinator:
+            # 未收到確認的轉交批次保留在日誌中，下次啟動時重新發送
+            await self._receive_confirmations()
+            await self.coordinator.close()
+
+        await self.notifiers.close()
+        if self.digests:
+            await self.digests.close()
+        if self.history:
+            await self.history.close()
+        if self.spool:
+            await self.spool.close()
 
-    async def process_message_exception(self, event: AstrMessageEvent, keyword: str):
+    def capture(
+        self, event: AstrMessageEvent, keyword: str, **report
+    ) -> ExceptionRecord:
+        """從事件擷取異常記錄；只記錄時間戳與堆疊摘要，可以安全地在事件鉤子中呼叫。
+
+        report 可包含 severity、exc、tags 與 extra，見 ExceptionRecord.from_event。
+        """
+        return ExceptionRecord.from_event(event, keyword, **report)
+
+    async def process_message_exception(
+        self, event: AstrMessageEvent, keyword: str, **report
+    ):
         """處理來自訊息的異常"""
-        exception_info = {
-            "type": "message",
-            "platform": event.get_platform_name(),
-            "sender": event.get_sender_name(),
-            "sender_id": event.get_sender_id(),
-            "group_id": event.get_group_id(),
-            "message": event.get_message_str(),
-            "keyword": keyword,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        }
-        if not self.enable_batching:
-            await self._process_internal(exception_info)
+        await self.process_record(self.capture(event, keyword, **report))
+
+    async def process_record(self, record: ExceptionRecord):
+        """處理一筆已擷取的異常記錄"""
+        record.resolve()
+        record.severity = self.severity_rules.classify(record.keyword, record.severity)
+        lane = self._lane_for(record.severity)
+        if lane != LANE_DIGEST:
+            record.route = self.email_service.routing.route(record)
+        # 指紋、快取、歷史與日誌都只使用截斷後的訊息
+        original = self.capture_policy.truncate(record)
+        record.fingerprint = compute_fingerprint(record.keyword, record.message)
+        if lane != LANE_DIGEST:
+            self.capture_policy.keep_payload(record, original)
+        del original
+        # 只計入摘要的報告不會發送通知，不需要寫入持久化日誌
+        if self.spool and lane != LANE_DIGEST:
+            record.spool_seq = self.spool.append(record.to_dict())
+        self.exception_cache.append(record)
+        self.arrival_rate.observe()
+        self.reports_total.inc(record.platform, record.keyword)
+        if self.analytics:
+            storm = self.analytics.observe(record)
+            if storm and self.storm_alerts:
+                # 每次風暴各自一個任務，由 _track 保留參照，stop() 時等待全部送出
+                self._track(self.main_loop.create_task(self._send_storm_alert(storm)))
+        if self.history:
+            self.history.add(record)
+        if self.digests:
+            self.digests.observe(record)
+        if lane == LANE_DIGEST:
             return
+        self.notifiers.dispatch(record)
 
-        # --- 批處理邏輯 ---
-        self.message_buffer.append(exception_info)
+        if lane == LANE_IMMEDIATE or not self.enable_batching:
+            await self._process_internal(record, lane)
+            return
 
-        # 如果沒有正在運行的發送任務，則創建一個
-        if self.batch_send_task is None or self.batch_send_task.done():
-            logger.info(
-                f"檢測到第一個訊息異常，已啟動 {self.batch_window_seconds} 秒的批處理窗口。"
-            )
-            self.batch_send_task = self.main_loop.create_task(
-                self._send_batch_email_after_delay()
+        # --- 批處理邏輯 ---
+        dropped = self.message_buffer.dropped
+        self.message_buffer.add(record)
+        if self.message_buffer.dropped > dropped:
+            self.dropped_reports.inc(
+                "buffer_overflow", amount=self.message_buffer.dropped - dropped
             )
+        # 如果沒有正在運行的發送任務，則創建一個
+        if not self._ensure_batch_task():
+            self._batch_last_arrival = self.clock()
+        if (
+            self.adaptive_batching
+            and self.batch_window.flush_threshold
+            and len(self.message_buffer) >= self.batch_window.flush_threshold
+        ):
+            # 緩衝區達到門檻，喚醒批處理任務重新評估是否提前發送
+            self._batch_wakeup.set()
+
+    def _lane_for(self, severity: str) -> str:
+        """依嚴重程度選擇通道；未啟用任何摘要報告時，debug/info 改走批處理，不會被靜默捨棄"""
+        if not self.priority_lanes:
+            return LANE_BATCH
+        lane = lane_for(severity)
+        if lane == LANE_DIGEST and not self.digests:
+            return LANE_BATCH
+        return lane
+
+    def _ensure_batch_task(self) -> bool:
+        """批處理窗口尚未開始時啟動發送任務；返回是否新建了任務"""
+        now = self.clock()
+        if self.batch_send_task is not None and not self.batch_send_task.done():
+            return False
+        self._batch_first_arrival = self._batch_last_arrival = now
+        logger.info(
+            f"檢測到第一個訊息異常，已啟動 {self.effective_window():.0f} 秒的批處理窗口。"
+        )
+        self.batch_send_task = self.main_loop.create_task(
+            self._send_batch_email_after_delay()
+        )
+        return True
+
+    def effective_window(self) -> float:
+        if self.adaptive_batching:
+            return self.batch_window.current_window()
+        return self.batch_window_seconds
+
+    async def _wait_for_batch_window(self):
+        """等待批處理窗口結束。
+
+        自適應模式下，緩衝區安靜一段時間或達到大小門檻時會提前結束，
+        而在錯誤風暴期間窗口會依到達速率拉長。
+        """
+        # 每次被喚醒（包括重新載入設定後）都以當時的設定重新計算剩餘時間
+        while not self._flush_requested:
+            if self.adaptive_batching:
+                delay = self.batch_window.next_flush_delay(
+                    self._batch_first_arrival,
+                    self._batch_last_arrival,
+                    len(self.message_buffer),
+                    self.clock(),
+                )
+            else:
+                delay = self.batch_window_seconds - (
+                    self.clock() - self._batch_first_arrival
+                )
+            if delay <= 0:
+                return
+            self._batch_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._batch_wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
 
     async def _send_batch_email_after_delay(self):
-        """等待指定時間後，發送批次郵件"""
+        """等待批處理窗口結束後，發送批次郵件"""
         try:
-            await asyncio.sleep(self.batch_window_seconds)
+            await self._wait_for_batch_window()
 
             if not self.message_buffer:
                 return
 
-            # 複製緩存並立即清空，防止新日誌在處理期間進入
-            messages_to_send = list(self.message_buffer)
-            self.message_buffer.clear()
-
-            if self._is_rate_limited():
-                logger.warning(
-                    f"已達到每小時郵件發送上限，本次批次的 {len(messages_to_send)} 則異常將被捨棄。"
-                )
-                return
+            # 替換為新的緩衝區，防止新日誌在處理期間進入
+            batch = self.message_buffer
+            self.message_buffer = self._new_buffer()
+            self.capture_policy.reset()
 
-            self.email_counter["count"] += 1
             logger.info(
-                f"批處理窗口結束，準備發送 {len(messages_to_send)} 則異常的匯總郵件。"
+                f"批處理窗口結束，準備發送 {batch.total} 則異常（{len(batch)} 種）的匯總郵件。"
             )
-            subject, body = generate_batch_message_exception_email(messages_to_send)
-            await self.email_service.send_email_async(subject, body)
+            await self._flush_batch(batch)
         except Exception as e:
             logger.error(f"[ErrorMonitor] 批處理郵件發送任務失敗: {e}", exc_info=True)
 
-    async def _process_internal(self, exception_info: Dict[str, Any]):
-        """內部處理邏輯，判斷是否發送郵件"""
-        self.exception_cache.append(exception_info)
-        if len(self.exception_cache) > 100:  # 防止快取過大
-            self.exception_cache.pop(0)
+    async def _send_storm_alert(self, insights):
+        """立即發送錯誤風暴警報。
 
+        警報不受郵件發送上限限制（風暴期間額度往往已用盡），其頻率由 storm_cooldown_minutes 控制；
+        斷路器打開時直接略過，風暴中的異常仍會照常匯總到批次郵件。
+        """
+        logger.warning(
+            f"[ErrorMonitor] 偵測到錯誤風暴：本分鐘 {insights['current_per_minute']} 則異常，"
+            f"基線 {insights['baseline_per_minute']:.1f} 則/分鐘（z = {insights['z_score']:.1f}）。"
+        )
+        if self._circuit_open():
+            logger.warning("SMTP 斷路器打開中，略過本次錯誤風暴警報郵件。")
+            return
+        if self.coordinator and not await self.coordinator.claim(
+            "storm", self.analytics.storm_cooldown
+        ):
+            logger.info("其他實例已發送本次錯誤風暴警報。")
+            return
+        try:
+            subject, body = generate_storm_alert_email(insights)
+            await self.email_service.submit(subject, body)
+        except Exception as e:
+            logger.error(f"[ErrorMonitor] 發送錯誤風暴警報失敗: {e}", exc_info=True)
+
+    async def _send_digest(self, summary, on_success, on_failure):
+        """發送一份定期摘要報告；斷路器打開時視為暫時性失敗，由排程器稍後重試。
+
+        摘要為排程產生、數量固定（每小時/每日一封），因此不佔用郵件發送上限。
+        """
+        if self._circuit_open():
+            on_failure(False)
+            return
+        subject, body = generate_digest_email(summary)
+        await self.email_service.submit(
+            subject, body, on_success=on_success, on_failure=on_failure
+        )
+
+    async def _process_internal(self, record: ExceptionRecord, lane: str = LANE_BATCH):
+        """內部處理邏輯，判斷是否立即發送單筆郵件"""
         logger.debug("[ErrorMonitor] 正在處理異常...")
 
-        if self._is_rate_limited():
-            logger.warning("已達到每小時郵件發送上限，暫不發送郵件。")
+        seqs = SeqRanges()
+        if record.spool_seq is not None:
+            seqs.add(record.spool_seq)
+
+        def ack():
+            self._ack_seqs(seqs)
+
+        # 同一指紋在去重窗口內只由一個實例發送；critical 報告不去重：
+        # 宣告成功的實例可能尚未送出（例如被限流延後或投遞失敗），不能因此捨棄並確認
+        if (
+            self.coordinator
+            and lane != LANE_IMMEDIATE
+            and not await self.coordinator.claim(
+                record.fingerprint, self.dedup_window_seconds
+            )
+        ):
+            self.dropped_reports.inc("duplicate")
+            ack()
             return
 
-        # 更新計數器
-        self.email_counter["count"] += 1
+        recipients = self.email_service.route_recipients(record.route)
+        keywords = (record.keyword,)
+        limiter, allowed = self.limiter, None
+        if not self._circuit_open():
+            limiter, allowed = await self._acquire(lane, recipients, keywords)
+        if allowed is None:
+            logger.warning(
+                "已達到郵件發送上限或 SMTP 暫停投遞，此異常將延後至可以發送時發送。"
+            )
+            batch = self._new_buffer()
+            batch.add(record)
+            self._defer(batch, lane)
+            return
+
+        with self.render_latency.time():
+            subject, body = generate_message_exception_email(
+                record, self.exception_cache.recent(5)
+            )
 
-        subject, body = generate_message_exception_email(
-            exception_info, self.exception_cache
+        await self.email_service.submit(
+            subject,
+            body,
+            on_success=ack,
+            on_failure=self._delivery_failed(recipients, keywords, 1, limiter, seqs),
+            recipients=recipients,
+            on_cancel=self._delivery_cancelled(recipients, keywords, limiter),
         )
-        await self.email_service.send_email_async(subject, body)
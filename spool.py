@@ -0,0 +1,226 @@
+import asyncio
+import bisect
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional, Sequence, Set, Tuple
+
+from astrbot.api import logger
+
+
+class ReportSpool:
+    """以僅追加的 JSONL 日誌持久化待發送的異常報告，確保重啟後不會遺失。
+
+    每筆報告寫入一條 ``add`` 記錄，成功送出後寫入列出實際送出序號（以區間表示）的 ``ack`` 記錄；
+    放棄投遞的報告以帶有 ``dead`` 標記的 ``ack`` 確認，壓縮時移到死信檔（``*.dead.jsonl``）保存。
+    所有寫入都在背景任務中合併為一次 write + fsync（group commit），
+    並透過 ``asyncio.to_thread`` 在執行緒中完成，不會阻塞事件迴圈。
+    日誌超過 ``compact_threshold_bytes`` 時，依仍未確認的序號集合重寫，只保留這些報告。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        commit_interval: float = 0.2,
+        compact_threshold_bytes: int = 1024 * 1024,
+    ):
+        self.path = Path(path)
+        self.commit_interval = commit_interval
+        self.compact_threshold_bytes = compact_threshold_bytes
+        self.dead_letter_path = self.path.with_suffix(".dead.jsonl")
+
+        self._next_seq = 1
+        # 尚未確認的序號；壓縮時只保留這些報告
+        self._live: Set[int] = set()
+        # 下一次壓縮的檔案大小門檻；壓縮後仍很大時提高，避免每次提交都重寫
+        self._compact_at = compact_threshold_bytes
+        self._pending_lines: List[str] = []
+        self._wakeup = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._file = None
+        self._closed = False
+
+    async def open(self) -> List[Dict[str, Any]]:
+        """開啟日誌並返回上次未送出的報告（依序號排序）"""
+        pending, max_seq = await asyncio.to_thread(self._load_and_compact)
+        self._next_seq = max_seq + 1
+        self._live = {report["spool_seq"] for report in pending}
+        self._writer_task = asyncio.get_running_loop().create_task(self._writer_loop())
+        return pending
+
+    def append(self, report: Dict[str, Any]) -> int:
+        """登記一筆報告並返回其序號；實際寫入由背景任務批次完成"""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._live.add(seq)
+        self._enqueue({"op": "add", "seq": seq, "report": report})
+        return seq
+
+    @property
+    def outstanding(self) -> int:
+        """尚未確認的報告數"""
+        return len(self._live)
+
+    def ack(self, ranges: Sequence[Tuple[int, int]], dead: bool = False):
+        """標記 ranges 中各個 [起, 迄] 序號區間內的報告已送出；dead 表示已放棄投遞"""
+        for first, last in ranges:
+            for seq in range(first, last + 1):
+                self._live.discard(seq)
+        entry = {"op": "ack", "ranges": [list(r) for r in ranges]}
+        if dead:
+            entry["dead"] = True
+        self._enqueue(entry)
+
+    async def close(self):
+        """寫入所有尚未提交的記錄並關閉日誌"""
+        self._closed = True
+        self._wakeup.set()
+        if self._writer_task:
+            try:
+                await self._writer_task
+            except Exception as e:
+                logger.error(f"[ErrorMonitor] 關閉異常報告日誌時發生錯誤: {e}")
+        if self._pending_lines:
+            await asyncio.to_thread(self._commit, self._drain_pending())
+        if self._file:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    def _enqueue(self, entry: Dict[str, Any]):
+        self._pending_lines.append(json.dumps(entry, ensure_ascii=False, default=str))
+        self._wakeup.set()
+
+    def _drain_pending(self) -> List[str]:
+        lines = self._pending_lines
+        self._pending_lines = []
+        return lines
+
+    async def _writer_loop(self):
+        while not self._closed:
+            await self._wakeup.wait()
+            # 等待一個提交窗口，讓同一時間段的寫入合併成一次 fsync
+            await asyncio.sleep(self.commit_interval)
+            self._wakeup.clear()
+            lines = self._drain_pending()
+            if not lines:
+                continue
+            try:
+                size = await asyncio.to_thread(self._commit, lines)
+                # 沒有未確認的報告時重寫成本極低（空檔案），超過門檻即可壓縮
+                if size >= self._compact_at or (
+                    not self._live and size >= self.compact_threshold_bytes
+                ):
+                    # 序號集合在事件迴圈上複製；之後才確認的報告留到下一次壓縮
+                    size = await asyncio.to_thread(self._compact, set(self._live))
+                    self._compact_at = max(self.compact_threshold_bytes, size * 2)
+            except Exception as e:
+                logger.error(f"[ErrorMonitor] 寫入異常報告日誌失敗: {e}")
+
+    def _commit(self, lines: List[str]) -> int:
+        """(執行緒中) 寫入並 fsync，返回目前的檔案大小"""
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def _compact(self, live: Set[int]) -> int:
+        """(執行緒中) 只保留 live 中的報告重寫日誌，返回重寫後的檔案大小"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._rewrite(live.__contains__)
+        return self.path.stat().st_size
+
+    def _load_and_compact(self) -> Tuple[List[Dict[str, Any]], int]:
+        """(執行緒中) 重放日誌，找出未確認的報告並重寫為精簡後的日誌；返回 (報告, 最大序號)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        return self._rewrite()
+
+    def _rewrite(
+        self, keep: Optional[Callable[[int], bool]] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """(執行緒中) 重放日誌並重寫為只含未確認（或 keep 指定）報告的日誌。
+
+        標記為放棄投遞的報告在重寫前追加到死信檔。
+        """
+        added: Dict[int, Dict[str, Any]] = {}
+        acked: List[Tuple[int, int]] = []
+        dead: List[Tuple[int, int]] = []
+        max_seq = 0
+
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 最後一行可能因程序中斷而不完整，忽略即可
+                        continue
+                    if entry.get("op") == "add":
+                        added[entry["seq"]] = entry["report"]
+                        max_seq = max(max_seq, entry["seq"])
+                    elif entry.get("op") == "ack":
+                        # 舊版日誌的 ack 記錄只有單一區間
+                        ranges = [
+                            tuple(r) for r in entry.get("ranges") or [entry["range"]]
+                        ]
+                        acked.extend(ranges)
+                        if entry.get("dead"):
+                            dead.extend(ranges)
+
+        is_acked = _range_lookup(acked)
+        if keep is None:
+
+            def keep(seq: int) -> bool:
+                return not is_acked(seq)
+
+        pending_seqs = sorted(seq for seq in added if keep(seq))
+
+        is_dead = _range_lookup(dead)
+        dead_seqs = sorted(seq for seq in added if is_dead(seq) and not keep(seq))
+        if dead_seqs:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for seq in dead_seqs:
+                    f.write(
+                        json.dumps(
+                            {"seq": seq, "report": added[seq]}, ensure_ascii=False
+                        )
+                        + "\n"
+                    )
+                f.flush()
+                os.fsync(f.fileno())
+
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for seq in pending_seqs:
+                f.write(
+                    json.dumps(
+                        {"op": "add", "seq": seq, "report": added[seq]},
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        return [dict(added[seq], spool_seq=seq) for seq in pending_seqs], max_seq
+
+
+def _range_lookup(ranges: List[Tuple[int, int]]) -> Callable[[int], bool]:
+    """合併 [起, 迄] 區間，返回以二分搜尋判斷序號是否在其中的函式"""
+    merged: List[List[int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    starts = [first for first, _ in merged]
+
+    def contains(seq: int) -> bool:
+        i = bisect.bisect_right(starts, seq) - 1
+        return i >= 0 and seq <= merged[i][1]
+
+    return contains
@@ -1,6 +1,11 @@
+import gzip
 import html
+import json
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
+
+from .aggregation import ErrorAggregate
+from .records import ExceptionRecord, format_time
 
 HTML_EMAIL_STYLE = """\
 <style>
@@ -47,6 +52,7 @@ HTML_EMAIL_STYLE = """\
     .msg-h2 { color: #9a6700; }
     .batch-h2 { color: #0969da; }
     .test-h2 { color: #1a7f37; }
+    .storm-h2 { color: #cf222e; }
     p {
         margin-top: 0;
         margin-bottom: 16px;
@@ -102,42 +108,23 @@ HTML_EMAIL_STYLE = """\
 """
 
 
-def generate_message_exception_email(
-    exception_info: Dict[str, Any], recent_logs: List[Dict[str, Any]]
-) -> (str, str):
-    """產生訊息異常的郵件主旨和內容 (HTML)"""
-    subject = "【AstrBot 訊息異常回報】"
+# --- 預先編譯的郵件骨架 ---
+# 靜態的 HTML 外框（含樣式表）只在匯入時組裝一次，渲染時只需拼接動態內容。
 
-    recent_logs_html = "".join(
-        f"<tr><td>{html.escape(str(log.get('timestamp')))}</td><td>{html.escape(str(log.get('message', ''))[:100])}...</td></tr>"
-        for log in reversed(recent_logs[-5:])
-    )
 
-    body = f"""\
+def _compile_page(h2_class: str, title: str) -> (str, str):
+    head = f"""\
     <html>
         <head>{HTML_EMAIL_STYLE}</head>
         <body>
             <div class="email-wrapper">
                 <div class="container">
                     <div class="header">
-                        <h2 class="msg-h2">AstrBot 訊息異常回報</h2>
+                        <h2 class="{h2_class}">{title}</h2>
                     </div>
                     <div class="content">
-                        <p>收到一則可能包含異常資訊的回報，詳細資訊如下：</p>
-                        <table>
-                            <tr><th>時間</th><td>{html.escape(str(exception_info.get("timestamp")))}</td></tr>
-                            <tr><th>平台</th><td>{html.escape(str(exception_info.get("platform")))}</td></tr>
-                            <tr><th>使用者</th><td>{html.escape(str(exception_info.get("sender")))} (ID: {html.escape(str(exception_info.get("sender_id")))})</td></tr>
-                            <tr><th>群組</th><td>{html.escape(str(exception_info.get("group_id", "N/A")))}</td></tr>
-                            <tr><th>關鍵字</th><td>{html.escape(str(exception_info.get("keyword")))}</td></tr>
-                        </table>
-                        <h3>原始訊息</h3>
-                        <pre>{html.escape(str(exception_info.get("message")))}</pre>
-                        <h3>最近 5 筆日誌快取</h3>
-                        <table>
-                            <tr><th>時間</th><th>資訊</th></tr>
-                            {recent_logs_html}
-                        </table>
+"""
+    tail = """\
                     </div>
                     <div class="footer">Generated by AstrBot Error Monitor Plugin</div>
                 </div>
@@ -145,85 +132,344 @@ def generate_message_exception_email(
         </body>
     </html>
     """
-    return subject, body
+    return head, tail
+
+
+_MESSAGE_PAGE = _compile_page("msg-h2", "AstrBot 訊息異常回報")
+_BATCH_PAGE = _compile_page("batch-h2", "AstrBot 批次異常回報")
+_TEST_PAGE = _compile_page("test-h2", "AstrBot 異常監控測試郵件")
+_STORM_PAGE = _compile_page("storm-h2", "AstrBot 錯誤風暴警報")
+_DIGEST_PAGE = _compile_page("batch-h2", "AstrBot 異常摘要報告")
+
+_BATCH_SUMMARY_HEADER = (
+    "<table><tr><th>#</th><th>次數</th><th>關鍵字</th><th>平台</th>"
+    "<th>使用者 / 群組</th><th>首次 / 最後出現</th></tr>"
+)
+
+
+def _render(page: (str, str), parts: List[str]) -> str:
+    """以單次 join 將動態內容嵌入預先編譯的骨架，總耗時與內容長度成線性關係"""
+    head, tail = page
+    return "".join([head, *parts, tail])
+
+
+def _render_sample(sample: ExceptionRecord) -> str:
+    escaped = sample.escaped
+    context = "GP" if sample.is_group else "DM"
+    return "".join(
+        [
+            f"<p>{escaped['timestamp']} · {escaped['platform']} · {context} · "
+            f"{escaped['sender']} (ID: {escaped['sender_id']})</p>",
+            _render_message(sample),
+            *_render_error_details(escaped),
+        ]
+    )
+
+
+def _render_message(record: ExceptionRecord) -> str:
+    """渲染訊息；有抽樣保留的完整內容時呈現完整內容，否則註明已截斷"""
+    escaped = record.escaped
+    if record.payload is not None:
+        # 完整內容每次渲染時才解壓與轉義，不快取在記錄上
+        return f"<pre>{html.escape(record.payload_text)}</pre>"
+    if record.message_bytes is not None:
+        return (
+            f"<p>訊息過長，僅保留開頭與結尾（原始 {record.message_bytes} 位元組）。</p>"
+            f"<pre>{escaped['message']}</pre>"
+        )
+    return f"<pre>{escaped['message']}</pre>"
+
+
+def _render_error_details(escaped: Dict[str, str]) -> List[str]:
+    """渲染結構化報告附帶的標籤、附加資訊與例外堆疊；沒有的欄位不輸出"""
+    parts = []
+    if escaped["tags"]:
+        parts.append(f"<p>標籤：{escaped['tags']}</p>")
+    if escaped["error"]:
+        parts.append(f"<p><strong>{escaped['error']}</strong></p>")
+    if escaped["traceback"]:
+        parts.append(
+            f"<pre>Traceback (most recent call last):\n{escaped['traceback']}</pre>"
+        )
+    if escaped["extra"]:
+        parts.append(f"<pre>{escaped['extra']}</pre>")
+    return parts
+
+
+def _render_top(title: str, entries: List[Tuple[str, int, int]]) -> str:
+    rows = "".join(
+        f"<tr><td>{html.escape(key)}</td><td>{count}"
+        + (f"（誤差 ≤ {error}）" if error else "")
+        + "</td></tr>"
+        for key, count, error in entries
+    )
+    return f"<tr><th>{title}</th><td><table>{rows}</table></td></tr>" if rows else ""
+
+
+def _render_insights(insights: Dict[str, Any]) -> List[str]:
+    """渲染錯誤趨勢摘要（每分鐘速率與 Top-K 來源），insights 為 ErrorAnalytics.snapshot()"""
+    recent = ", ".join(str(count) for count in insights["recent_minutes"]) or "無"
+    return [
+        "<h3>錯誤趨勢</h3><table>",
+        f"<tr><th>本分鐘</th><td>{insights['current_per_minute']} 則"
+        f"（z = {insights['z_score']:.1f}）</td></tr>",
+        f"<tr><th>基線</th><td>{insights['baseline_per_minute']:.1f}"
+        f" ± {insights['stddev']:.1f} 則/分鐘</td></tr>",
+        f"<tr><th>最近每分鐘</th><td>{recent}</td></tr>",
+        _render_top("最多錯誤的使用者", insights["senders"]),
+        _render_top("最多錯誤的群組", insights["groups"]),
+        _render_top("最常見的關鍵字", insights["keywords"]),
+        "</table>",
+        f"<p>來源統計涵蓋最近約 {insights['period_minutes']:.0f}～"
+        f"{2 * insights['period_minutes']:.0f} 分鐘。</p>",
+    ]
+
+
+def _select_shown(aggregates: List[ErrorAggregate], max_entries: int):
+    """依次數挑選要呈現的指紋；返回 (總則數, 呈現的匯總, 未列出種數, 未列出則數)"""
+    total = sum(aggregate.count for aggregate in aggregates)
+    shown = aggregates
+    if max_entries and len(aggregates) > max_entries:
+        shown = sorted(aggregates, key=lambda a: a.count, reverse=True)[:max_entries]
+    hidden_kinds = len(aggregates) - len(shown)
+    hidden_count = total - sum(aggregate.count for aggregate in shown)
+    return total, shown, hidden_kinds, hidden_count
+
+
+def generate_message_exception_email(
+    record: ExceptionRecord, recent_logs: List[ExceptionRecord]
+) -> (str, str):
+    """產生訊息異常的郵件主旨和內容 (HTML)，recent_logs 由新到舊排列"""
+    subject = (
+        "【AstrBot 嚴重異常回報】"
+        if record.severity == "critical"
+        else "【AstrBot 訊息異常回報】"
+    )
+    escaped = record.escaped
+
+    parts = [
+        "<p>收到一則可能包含異常資訊的回報，詳細資訊如下：</p><table>",
+        f"<tr><th>時間</th><td>{escaped['timestamp']}</td></tr>",
+        f"<tr><th>平台</th><td>{escaped['platform']}</td></tr>",
+        f"<tr><th>使用者</th><td>{escaped['sender']} (ID: {escaped['sender_id']})</td></tr>",
+        f"<tr><th>群組</th><td>{escaped['group_id']}</td></tr>",
+        f"<tr><th>關鍵字</th><td>{escaped['keyword']}</td></tr>",
+        f"<tr><th>嚴重程度</th><td>{escaped['severity']}</td></tr>",
+        "</table><h3>原始訊息</h3>",
+        _render_message(record),
+        *_render_error_details(escaped),
+        "<h3>最近 5 筆日誌快取</h3><table><tr><th>時間</th><th>資訊</th></tr>",
+    ]
+    for log in recent_logs[:5]:
+        # 截斷原始訊息後再轉義，避免截斷到實體參照的中間
+        parts.append(
+            f"<tr><td>{log.escaped['timestamp']}</td>"
+            f"<td>{html.escape(str(log.message or '')[:100])}...</td></tr>"
+        )
+    parts.append("</table>")
+
+    return subject, _render(_MESSAGE_PAGE, parts)
 
 
 def generate_batch_message_exception_email(
-    exceptions: List[Dict[str, Any]],
+    aggregates: List[ErrorAggregate],
+    dropped: int = 0,
+    max_entries: int = 0,
+    attachment_name: str = None,
+    insights: Dict[str, Any] = None,
 ) -> (str, str):
-    """產生批次訊息異常的郵件主旨和內容 (HTML)"""
+    """產生批次訊息異常的郵件主旨和內容 (HTML)，每個錯誤指紋僅呈現一次。
+
+    max_entries 大於 0 時最多呈現該數量的指紋（依次數由多到少），其餘以「另有 N 種」概述。
+    attachment_name 不為空時，在開頭註明完整報告已作為附件提供。
+    insights 不為空時，在匯總表之後附上錯誤趨勢摘要。
+    """
     subject = "【AstrBot 批次異常回報】"
+    total, shown, hidden_kinds, hidden_count = _select_shown(aggregates, max_entries)
 
-    exceptions_html = ""
-    for i, exc_info in enumerate(exceptions):
-        message_context = (
-            "GP"
-            if exc_info.get("group_id") and exc_info.get("group_id") != "N/A"
-            else "DM"
+    parts = [
+        f"<p>在最近的批處理窗口內，共收集到 <strong>{total}</strong> 則異常，"
+        f"歸納為 <strong>{len(aggregates)}</strong> 種。詳細資訊如下：</p>"
+    ]
+    if dropped:
+        parts.append(
+            f"<p>緩衝區已滿，另有 <strong>{dropped}</strong> 則異常被捨棄。</p>"
         )
-        exceptions_html += f"""\
-            <h3>異常 #{i + 1}</h3>
-            <table>
-                <tr><th>時間</th><td>{html.escape(str(exc_info.get("timestamp")))}</td></tr>
-                <tr><th>平台</th><td>{html.escape(str(exc_info.get("platform")))}</td></tr>
-                <tr><th>來源</th><td>{html.escape(message_context)}</td></tr>
-                <tr><th>使用者</th><td>{html.escape(str(exc_info.get("sender")))} (ID: {html.escape(str(exc_info.get("sender_id")))})</td></tr>
-                <tr><th>群組</th><td>{html.escape(str(exc_info.get("group_id", "N/A")))}</td></tr>
-                <tr><th>關鍵字</th><td>{html.escape(str(exc_info.get("keyword")))}</td></tr>
-            </table>
-            <pre>{html.escape(str(exc_info.get("message")))}</pre>
-            {"<hr>" if i < len(exceptions) - 1 else ""}
-        """
-
-    body = f"""\
-    <html>
-        <head>{HTML_EMAIL_STYLE}</head>
-        <body>
-            <div class="email-wrapper">
-                <div class="container">
-                    <div class="header">
-                        <h2 class="batch-h2">AstrBot 批次異常回報</h2>
-                    </div>
-                    <div class="content">
-                        <p>在最近的批處理窗口內，共收集到 <strong>{len(exceptions)}</strong> 則異常。詳細資訊如下：</p>
-                        {exceptions_html}
-                    </div>
-                    <div class="footer">Generated by AstrBot Error Monitor Plugin</div>
-                </div>
-            </div>
-        </body>
-    </html>
-    """
+    if attachment_name:
+        parts.append(
+            f"<p>完整報告過大，僅列出摘要；完整內容請見附件 "
+            f"<strong>{html.escape(attachment_name)}</strong>。</p>"
+        )
+
+    parts.append(_BATCH_SUMMARY_HEADER)
+    for i, aggregate in enumerate(shown):
+        parts.append(
+            f"<tr><td>#{i + 1}</td><td>{aggregate.count}</td>"
+            f"<td>{aggregate.keyword_html}</td>"
+            f"<td>{html.escape(', '.join(sorted(aggregate.platforms)))}</td>"
+            f"<td>{len(aggregate.senders)} / {len(aggregate.groups)}</td>"
+            f"<td>{format_time(aggregate.first_seen)}<br>"
+            f"{format_time(aggregate.last_seen)}</td></tr>"
+        )
+    if hidden_kinds:
+        parts.append(
+            f'<tr><td colspan="6">+{hidden_kinds} 種（共 {hidden_count} 則）未列出</td></tr>'
+        )
+    parts.append("</table>")
+    if insights:
+        parts.extend(_render_insights(insights))
+
+    for i, aggregate in enumerate(shown):
+        parts.append(
+            f"<h3>異常 #{i + 1}（共 {aggregate.count} 次）</h3><table>"
+            f"<tr><th>指紋</th><td>{aggregate.fingerprint}</td></tr>"
+            f"<tr><th>關鍵字</th><td>{aggregate.keyword_html}</td></tr>"
+            f"<tr><th>嚴重程度</th><td>{aggregate.severity}</td></tr>"
+            f"<tr><th>首次 / 最後出現</th><td>{format_time(aggregate.first_seen)}"
+            f" / {format_time(aggregate.last_seen)}</td></tr>"
+            f"<tr><th>使用者數 / 群組數</th><td>{len(aggregate.senders)}"
+            f" / {len(aggregate.groups)}</td></tr></table>"
+        )
+        parts.extend(_render_sample(sample) for sample in aggregate.samples)
+        if i < len(shown) - 1:
+            parts.append("<hr>")
+
+    return subject, _render(_BATCH_PAGE, parts)
+
+
+def build_report_attachment(
+    aggregates: List[ErrorAggregate], fmt: str = "html", dropped: int = 0
+) -> Tuple[str, bytes]:
+    """將完整的批次報告壓縮為 gzip 附件，返回 (檔名, 內容)；fmt 為 html 或 jsonl"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if fmt == "jsonl":
+        data = "".join(
+            json.dumps(aggregate.to_dict(), ensure_ascii=False, default=str) + "\n"
+            for aggregate in aggregates
+        )
+        return f"error_report_{stamp}.jsonl.gz", gzip.compress(data.encode("utf-8"))
+    _, body = generate_batch_message_exception_email(aggregates, dropped=dropped)
+    return f"error_report_{stamp}.html.gz", gzip.compress(body.encode("utf-8"))
+
+
+def generate_storm_alert_email(insights: Dict[str, Any]) -> (str, str):
+    """產生錯誤風暴警報的郵件主旨和內容 (HTML)；不經過批處理窗口，偵測到突增時立即發送"""
+    subject = f"【AstrBot 錯誤風暴警報】每分鐘 {insights['current_per_minute']} 則異常"
+    parts = [
+        f"<p>異常數量突然增加：本分鐘已收到 <strong>{insights['current_per_minute']}</strong> 則，"
+        f"平常約為 {insights['baseline_per_minute']:.1f} 則/分鐘"
+        f"（z = {insights['z_score']:.1f}）。相關異常仍會照常匯總到批次郵件中。</p>",
+        *_render_insights(insights),
+    ]
+    return subject, _render(_STORM_PAGE, parts)
+
+
+def _trend(current: int, previous) -> str:
+    if previous is None:
+        return "無資料"
+    if not previous:
+        return "新增" if current else "持平"
+    change = (current - previous) / previous * 100
+    return f"{change:+.0f}%"
+
 
-    return subject, body
+def generate_digest_email(summary: Dict[str, Any]) -> (str, str):
+    """產生定期摘要報告的郵件主旨和內容 (HTML)，summary 為 PeriodCounters.summary()"""
+    start = datetime.fromtimestamp(summary["start"]).strftime("%Y-%m-%d %H:%M")
+    end = datetime.fromtimestamp(summary["end"]).strftime("%Y-%m-%d %H:%M")
+    subject = f"【AstrBot {summary['label']}異常摘要】{start} 共 {summary['total']} 則"
+
+    previous_total = summary["previous_total"]
+    parts = [
+        f"<p>{start} ～ {end} 期間共收到 <strong>{summary['total']}</strong> 則異常"
+        + (
+            f"，上一週期為 {previous_total} 則（{_trend(summary['total'], previous_total)}）。</p>"
+            if previous_total is not None
+            else "。</p>"
+        )
+    ]
+    if summary["catch_up"]:
+        parts.append("<p>此摘要於插件重新啟動後補發。</p>")
+    parts.append(
+        "<table>"
+        f"<tr><th>新錯誤</th><td>{summary['new_kinds']} 種（{summary['new_reports']} 則）</td></tr>"
+        f"<tr><th>既有錯誤</th><td>{summary['recurring_kinds']} 種"
+        f"（{summary['recurring_reports']} 則）</td></tr>"
+        + (
+            f"<tr><th>未分類</th><td>{summary['untracked']} 則</td></tr>"
+            if summary["untracked"]
+            else ""
+        )
+        + "</table>"
+    )
+
+    if summary["keywords"]:
+        parts.append(
+            "<h3>最常見的關鍵字</h3><table><tr><th>關鍵字</th><th>次數</th><th>趨勢</th></tr>"
+        )
+        for keyword, count, previous in summary["keywords"]:
+            parts.append(
+                f"<tr><td>{html.escape(keyword)}</td><td>{count}</td>"
+                f"<td>{_trend(count, previous)}</td></tr>"
+            )
+        parts.append("</table>")
+    for title, entries in (("平台", summary["platforms"]), ("群組", summary["groups"])):
+        if entries:
+            parts.append(
+                f"<h3>{title}</h3><table><tr><th>{title}</th><th>次數</th></tr>"
+            )
+            parts.extend(
+                f"<tr><td>{html.escape(key)}</td><td>{count}</td></tr>"
+                for key, count in entries
+            )
+            parts.append("</table>")
+    if summary["new_errors"]:
+        parts.append(
+            "<h3>本週期首次出現的錯誤</h3><table><tr><th>關鍵字</th><th>次數</th></tr>"
+        )
+        parts.extend(
+            f"<tr><td>{html.escape(keyword)}</td><td>{count}</td></tr>"
+            for keyword, count, _ in summary["new_errors"]
+        )
+        parts.append("</table>")
+    return subject, _render(_DIGEST_PAGE, parts)
 
 
 def generate_test_email(event_info: Dict[str, Any]) -> (str, str):
     """產生測試郵件的主旨和內容 (HTML)"""
     subject = "【AstrBot 異常監控】測試郵件"
 
-    body = f"""\
-    <html>
-        <head>{HTML_EMAIL_STYLE}</head>
-        <body>
-            <div class="email-wrapper">
-                <div class="container">
-                    <div class="header">
-                        <h2 class="test-h2">AstrBot 異常監控測試郵件</h2>
-                    </div>
-                    <div class="content">
-                        <p>如果您收到此郵件，表示您的郵件設定正確無誤。</p>
-                        <hr>
-                        <table>
-                            <tr><th>測試時間</th><td>{html.escape(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))}</td></tr>
-                            <tr><th>測試平台</th><td>{html.escape(str(event_info.get("platform")))}</td></tr>
-                            <tr><th>測試使用者</th><td>{html.escape(str(event_info.get("sender_name")))} (ID: {html.escape(str(event_info.get("sender_id")))})</td></tr>
-                        </table>
-                    </div>
-                    <div class="footer">Generated by AstrBot Error Monitor Plugin</div>
-                </div>
-            </div>
-        </body>
-    </html>
-    """
-    return subject, body
+    parts = [
+        "<p>如果您收到此郵件，表示您的郵件設定正確無誤。</p><hr><table>",
+        f"<tr><th>測試時間</th><td>{html.escape(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}</td></tr>",
+        f"<tr><th>測試平台</th><td>{html.escape(str(event_info.get('platform')))}</td></tr>",
+        f"<tr><th>測試使用者</th><td>{html.escape(str(event_info.get('sender_name')))}"
+        f" (ID: {html.escape(str(event_info.get('sender_id')))})</td></tr>",
+        "</table>",
+    ]
+    return subject, _render(_TEST_PAGE, parts)
+
+
+def generate_plain_text_summary(
+    aggregates: List[ErrorAggregate], dropped: int = 0, max_entries: int = 0
+) -> (str, str):
+    """產生批次異常的純文字摘要，供聊天訊息、Webhook 與日誌等非郵件通道使用"""
+    subject = "【AstrBot 批次異常回報】"
+    total, shown, hidden_kinds, hidden_count = _select_shown(aggregates, max_entries)
+
+    lines = [f"{subject}共 {total} 則異常，歸納為 {len(aggregates)} 種。"]
+    if dropped:
+        lines.append(f"緩衝區已滿，另有 {dropped} 則異常被捨棄。")
+    for i, aggregate in enumerate(shown):
+        lines.append(
+            f"#{i + 1} ×{aggregate.count} [{aggregate.keyword}] "
+            f"{', '.join(sorted(aggregate.platforms))} · "
+            f"{format_time(aggregate.first_seen)} ~ {format_time(aggregate.last_seen)}"
+        )
+        if aggregate.samples:
+            sample = aggregate.samples[0]
+            lines.append(f"    {str(sample.message or '')[:200]}")
+            lines.extend(f"    {line[:200]}" for line in sample.summary_lines())
+    if hidden_kinds:
+        lines.append(f"+{hidden_kinds} 種（共 {hidden_count} 則）未列出")
+    return subject, "\n".join(lines)
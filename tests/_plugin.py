@@ -0,0 +1,28 @@
+"""讓測試能以套件方式匯入插件模組（插件內部使用相對匯入），與 benchmarks/_plugin.py 相同"""
+
+import importlib
+import sys
+from pathlib import Path
+
+PLUGIN_ROOT = Path(__file__).resolve().parents[1]
+
+if str(PLUGIN_ROOT.parent) not in sys.path:
+    sys.path.insert(0, str(PLUGIN_ROOT.parent))
+
+
+def load(module: str):
+    """匯入插件中的子模組，例如 load("limiter")"""
+    return importlib.import_module(f"{PLUGIN_ROOT.name}.{module}")
+
+
+class FakeClock:
+    """可手動推進的時鐘，注入限流器等元件以模擬時間"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
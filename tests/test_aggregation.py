@@ -0,0 +1,144 @@
+from _plugin import load
+
+aggregation = load("aggregation")
+records = load("records")
+
+
+def make_record(keyword="KW", message="boom", seq=None, route=()):
+    record = records.ExceptionRecord(
+        platform="test",
+        sender="user",
+        sender_id="1",
+        group_id="N/A",
+        message=message,
+        keyword=keyword,
+        timestamp=1000.0,
+    )
+    record.spool_seq = seq
+    record.route = route
+    return record
+
+
+def test_same_fingerprint_is_aggregated():
+    buffer = aggregation.BatchBuffer()
+    buffer.add(make_record(message="user 123 failed", seq=1))
+    buffer.add(make_record(message="user 456 failed", seq=2))
+    assert len(buffer) == 1
+    assert buffer.total == 2
+    assert buffer.seqs().ranges() == [(1, 2)]
+
+
+def test_overflow_aggregate_keeps_counts():
+    buffer = aggregation.BatchBuffer(max_entries=2, overflow_policy="aggregate")
+    for i in range(5):
+        buffer.add(make_record(keyword=f"K{i}", seq=i + 1))
+    assert len(buffer) == 2
+    assert buffer.total == 5
+    assert buffer.dropped == 0
+    assert aggregation.OVERFLOW_FINGERPRINT in buffer.aggregates
+    assert buffer.seqs().ranges() == [(1, 5)]
+
+
+def test_overflow_drop_oldest_discards_first_fingerprint():
+    buffer = aggregation.BatchBuffer(max_entries=2, overflow_policy="drop_oldest")
+    for i in range(3):
+        buffer.add(make_record(keyword=f"K{i}", seq=i + 1))
+    assert buffer.keywords == {"K1", "K2"}
+    assert buffer.dropped == 1
+    # 被捨棄的報告仍隨批次確認
+    assert buffer.dropped_seqs.ranges() == [(1, 1)]
+    assert buffer.seqs().ranges() == [(1, 3)]
+
+
+def test_overflow_sample_is_bounded():
+    values = iter([0.99, 0.0] * 100)
+    buffer = aggregation.BatchBuffer(
+        max_entries=3, overflow_policy="sample", rng=lambda: next(values)
+    )
+    for i in range(10):
+        buffer.add(make_record(keyword=f"K{i}", seq=i + 1))
+    assert len(buffer) == 3
+    assert buffer.total + buffer.dropped == 10
+    assert len(buffer.seqs()) == 10
+
+
+def test_overflow_sample_slots_follow_split():
+    buffer = aggregation.BatchBuffer(max_entries=4, overflow_policy="sample")
+    for i in range(50):
+        buffer.add(make_record(keyword=f"K{i % 7}", message=f"m{i}", seq=i + 1))
+    held = buffer.split({"K0", "K1", "K2"})
+    for i in range(50, 100):
+        buffer.add(make_record(keyword=f"K{i % 7}", message=f"m{i}", seq=i + 1))
+    assert len(buffer) <= 4
+    assert sorted(buffer._sample_slots()) == sorted(buffer.aggregates)
+    assert len(buffer.seqs()) + len(held.seqs()) == 100
+
+
+def test_overflow_sample_slots_follow_policy_switch():
+    buffer = aggregation.BatchBuffer(max_entries=3, overflow_policy="sample")
+    for i in range(20):
+        buffer.add(make_record(keyword=f"K{i}", seq=i + 1))
+    buffer.reconfigure(3, "drop_oldest")
+    for i in range(20, 25):
+        buffer.add(make_record(keyword=f"K{i}", seq=i + 1))
+    buffer.reconfigure(3, "sample")
+    assert sorted(buffer._sample_slots()) == sorted(buffer.aggregates)
+
+
+def test_unknown_policy_falls_back_to_aggregate():
+    assert aggregation.BatchBuffer(1, "bogus").overflow_policy == "aggregate"
+
+
+def test_split_moves_sequences_with_held_aggregates():
+    buffer = aggregation.BatchBuffer()
+    buffer.add(make_record(keyword="A", seq=1))
+    buffer.add(make_record(keyword="B", seq=2))
+    buffer.add(make_record(keyword="A", seq=3))
+    held = buffer.split({"A"})
+    assert held.keywords == {"B"}
+    assert buffer.seqs().ranges() == [(1, 1), (3, 3)]
+    assert held.seqs().ranges() == [(2, 2)]
+
+
+def test_partition_by_route_carries_own_sequences():
+    buffer = aggregation.BatchBuffer(by_route=True)
+    buffer.add(make_record(seq=1))
+    buffer.add(make_record(seq=2, route=("ops@x",)))
+    buffer.add(make_record(seq=3))
+    partitions = buffer.partition()
+    assert set(partitions) == {(), ("ops@x",)}
+    assert partitions[()].seqs().ranges() == [(1, 1), (3, 3)]
+    assert partitions[("ops@x",)].seqs().ranges() == [(2, 2)]
+
+
+def test_merge_state_round_trip_excludes_sequences():
+    source = aggregation.BatchBuffer()
+    source.add(make_record(seq=7))
+    target = aggregation.BatchBuffer()
+    target.merge_state(source.to_state())
+    assert target.total == 1
+    assert not target.seqs()
+
+
+def test_merge_state_assigns_one_seq_per_forwarded_aggregate():
+    source = aggregation.BatchBuffer(max_entries=1, overflow_policy="drop_oldest")
+    source.add(make_record(keyword="K0", seq=1))
+    source.add(make_record(keyword="K1", seq=2))
+    source.add(make_record(keyword="K1", seq=3))
+    assert source.dropped == 1
+    issued = iter(range(-1, -10, -1))
+    target = aggregation.BatchBuffer()
+    assert target.merge_state(source.to_state(), lambda: next(issued)) == 2
+    assert target.total == 2 and target.dropped == 1
+    assert target.seqs().ranges() == [(-2, -1)]
+
+
+def test_seq_ranges_merge_adjacent_runs():
+    seqs = aggregation.SeqRanges()
+    for seq in (5, 6, 1, 2, 3, 9):
+        seqs.add(seq)
+    other = aggregation.SeqRanges()
+    other.add(4)
+    seqs.update(other)
+    assert len(seqs) == 7
+    assert seqs.ranges() == [(1, 6), (9, 9)]
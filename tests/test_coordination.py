@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("astrbot")
+
+from _plugin import FakeClock, load  # noqa: E402
+
+coordination = load("coordination")
+
+
+def make_pair(clock, lease_seconds=30):
+    backend = coordination.LocalBackend(clock=clock)
+    return (
+        coordination.Coordinator(backend, "a", lease_seconds),
+        coordination.Coordinator(backend, "b", lease_seconds),
+    )
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        coordination.CoordinationBackend()
+
+
+def test_follower_takes_over_an_expired_lease():
+    clock = FakeClock()
+    a, b = make_pair(clock)
+
+    async def scenario():
+        assert await a.elect()
+        assert not await b.elect()
+        clock.advance(20)
+        assert await a.elect()  # 續約
+        clock.advance(20)
+        assert not await b.elect()
+        clock.advance(11)
+        assert await b.elect()
+        assert not await a.elect()
+
+    asyncio.run(scenario())
+    assert b.is_leader and not a.is_leader
+
+
+def test_released_lease_is_taken_immediately():
+    clock = FakeClock()
+    a, b = make_pair(clock)
+
+    async def scenario():
+        assert await a.elect()
+        await a.close()
+        assert await b.elect()
+
+    asyncio.run(scenario())
+
+
+def test_forward_collect_and_confirm():
+    clock = FakeClock()
+    a, b = make_pair(clock)
+
+    async def scenario():
+        forward_id = await b.forward({"aggregates": [], "dropped": 3})
+        assert forward_id
+        assert await b.confirmations() == []
+        states = await a.collect()
+        assert states == [
+            {"aggregates": [], "dropped": 3, "id": forward_id, "origin": "b"}
+        ]
+        assert await a.collect() == []
+        await a.confirm(states[0]["origin"], states[0]["id"])
+        assert await a.confirmations() == []
+        assert await b.confirmations() == [forward_id]
+        assert await b.confirmations() == []
+
+    asyncio.run(scenario())
+    assert (b.forwarded, a.collected, b.confirmed) == (1, 1, 1)
+
+
+def test_claim_expires_after_ttl():
+    clock = FakeClock()
+    a, b = make_pair(clock)
+
+    async def scenario():
+        assert await a.claim("fp", 60)
+        assert not await b.claim("fp", 60)
+        assert not await a.claim("fp", 60)
+        clock.advance(60)
+        assert await b.claim("fp", 60)
+
+    asyncio.run(scenario())
+    assert a.duplicates == 1 and b.duplicates == 1
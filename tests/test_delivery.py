@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("astrbot")
+
+from _plugin import FakeClock, load  # noqa: E402
+
+delivery = load("delivery")
+
+
+def open_breaker(clock):
+    breaker = delivery.CircuitBreaker(
+        failure_threshold=1, reset_timeout=60, clock=clock
+    )
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    clock.advance(60)
+    return breaker
+
+
+def test_half_open_allows_a_single_probe():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    assert breaker.allow()
+    assert breaker.state == breaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED and breaker.time_until_closed() == 0
+
+
+def test_failed_probe_doubles_reset_timeout():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert breaker.time_until_closed() == 120
+
+
+def test_cancelled_probe_releases_breaker():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    started = asyncio.Event()
+
+    async def hang(message):
+        started.set()
+        await asyncio.sleep(3600)
+
+    async def scenario():
+        manager = delivery.DeliveryManager(hang, breaker=breaker)
+        task = asyncio.ensure_future(manager.submit("m"))
+        await started.wait()
+        assert breaker.time_until_closed() == 1.0
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.time_until_closed() == 0
+    assert breaker.allow()
+
+
+def test_configuration_error_does_not_trip_breaker():
+    async def unconfigured(message):
+        raise delivery.ConfigurationError("郵件服務未配置")
+
+    failures = []
+
+    async def scenario():
+        manager = delivery.DeliveryManager(
+            unconfigured,
+            breaker=delivery.CircuitBreaker(failure_threshold=1),
+        )
+        assert not await manager.submit("m", on_failure=failures.append)
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert failures == [True]
+    assert manager.breaker.state == manager.breaker.CLOSED
+    assert manager.breaker.consecutive_failures == 0
+
+
+def test_transient_failure_is_retried_then_delivered():
+    attempts = []
+
+    async def flaky(message):
+        attempts.append(message)
+        if len(attempts) == 1:
+            raise delivery.DeliveryError("451 try again")
+
+    delivered = []
+
+    async def scenario():
+        manager = delivery.DeliveryManager(flaky, base_delay=0, rng=lambda a, b: 0)
+        assert not await manager.submit("m", on_success=lambda: delivered.append(1))
+        await asyncio.sleep(0.01)
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert delivered == [1]
+    assert manager.retried == 1 and manager.delivered == 1
+
+
+def test_cancelled_send_refunds_without_failing():
+    started = asyncio.Event()
+
+    async def hang(message):
+        started.set()
+        await asyncio.sleep(3600)
+
+    failures, cancelled = [], []
+
+    async def scenario():
+        manager = delivery.DeliveryManager(hang)
+        task = asyncio.ensure_future(
+            manager.submit(
+                "m",
+                on_failure=failures.append,
+                on_cancel=lambda: cancelled.append(1),
+            )
+        )
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert cancelled == [1] and failures == []
+    assert manager.given_up == 0
+
+
+@pytest.mark.parametrize("started", [False, True])
+def test_cancelled_retry_refunds_once(started):
+    async def flaky(message):
+        raise delivery.DeliveryError("451 try again")
+
+    failures, cancelled = [], []
+
+    async def scenario():
+        manager = delivery.DeliveryManager(flaky, base_delay=60, rng=lambda a, b: b)
+        await manager.submit(
+            "m", on_failure=failures.append, on_cancel=lambda: cancelled.append(1)
+        )
+        assert manager.pending_retries == 1
+        if started:
+            # 讓重試任務進入退避等待
+            await asyncio.sleep(0)
+        await manager.close()
+
+    asyncio.run(scenario())
+    assert cancelled == [1] and failures == []
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("astrbot")
+
+from _plugin import FakeClock, load  # noqa: E402
+
+digest = load("digest")
+
+
+def make_scheduler(tmp_path, send):
+    clock = FakeClock(digest.period_start("hourly", 1_700_000_000))
+    scheduler = digest.DigestScheduler(
+        tmp_path / "digest.json", ["hourly"], send, skip_empty=False, clock=clock
+    )
+    scheduler.pending.append({"period": "hourly", "start": clock.now})
+    return scheduler
+
+
+def test_failed_send_releases_in_flight_key(tmp_path):
+    calls = []
+
+    async def send(summary, on_success, on_failure):
+        calls.append(summary)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        on_success()
+
+    scheduler = make_scheduler(tmp_path, send)
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler._send_pending())
+    assert not scheduler._in_flight and len(scheduler.pending) == 1
+
+    asyncio.run(scheduler._send_pending())
+    assert len(calls) == 2 and not scheduler.pending and scheduler.sent == 1
+
+
+def test_save_round_trips_state(tmp_path):
+    async def send(summary, on_success, on_failure):
+        pass
+
+    scheduler = make_scheduler(tmp_path, send)
+    scheduler.known = {f"{i:016x}": float(i) for i in range(100)}
+    asyncio.run(scheduler.save())
+    state = scheduler._load()
+    assert state["known"] == scheduler.known
+    assert state["pending"] == scheduler.pending
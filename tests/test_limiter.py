@@ -0,0 +1,102 @@
+from _plugin import FakeClock, load
+
+limiter = load("limiter")
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = limiter.TokenBucket(capacity=2, rate=1 / 60, clock=clock)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.time_until_available() == 60
+    clock.advance(30)
+    assert bucket.time_until_available() == 30
+    clock.advance(30)
+    assert bucket.try_acquire()
+
+
+def test_sliding_window_allows_limit_per_window():
+    clock = FakeClock()
+    window = limiter.SlidingWindowLog(limit=3, window=3600, clock=clock)
+    for _ in range(3):
+        assert window.try_acquire()
+        clock.advance(10)
+    assert not window.try_acquire()
+    # 最早的一次在 3600 秒後離開窗口
+    assert window.time_until_available() == 3600 - 30
+    clock.advance(3600 - 30)
+    assert window.try_acquire()
+    assert len(window) == 3
+
+
+def test_rate_limiter_caps_hourly_total_despite_burst():
+    clock = FakeClock()
+    rate = limiter.RateLimiter(max_per_hour=4, burst=4, clock=clock)
+    granted = 0
+    # 每 10 分鐘嘗試一次，一小時內令牌桶會補充，但滑動窗口仍限制總數
+    for _ in range(6):
+        if rate.acquire() is not None:
+            granted += 1
+        clock.advance(600)
+    assert granted == 4
+    assert rate.denied == 2
+
+
+def test_rate_limiter_refund_restores_quota():
+    clock = FakeClock()
+    rate = limiter.RateLimiter(max_per_hour=1, clock=clock)
+    assert rate.acquire(["a@x"]) == set()
+    assert rate.acquire(["a@x"]) is None
+    rate.refund(["a@x"])
+    assert rate.acquire(["a@x"]) == set()
+
+
+def test_per_keyword_limit_returns_allowed_keywords():
+    clock = FakeClock()
+    rate = limiter.RateLimiter(max_per_hour=100, per_keyword_per_hour=1, clock=clock)
+    assert rate.acquire(keywords=["A"]) == {"A"}
+    assert rate.acquire(keywords=["A", "B"]) == {"B"}
+    # 所有關鍵字都已超限時不扣除全域額度
+    granted = rate.granted
+    assert rate.acquire(keywords=["A", "B"]) is None
+    assert rate.granted == granted
+
+
+def test_per_recipient_limit_is_independent():
+    clock = FakeClock()
+    rate = limiter.RateLimiter(max_per_hour=100, per_recipient_per_hour=1, clock=clock)
+    assert rate.acquire(["a@x"]) is not None
+    assert rate.acquire(["a@x"]) is None
+    assert rate.acquire(["b@x"]) is not None
+    assert rate.time_until_available(["a@x"]) == 3600
+
+
+def test_idle_buckets_are_evicted():
+    clock = FakeClock()
+    rate = limiter.RateLimiter(max_per_hour=10**6, per_keyword_per_hour=10, clock=clock)
+    for i in range(10_000):
+        rate.acquire(keywords=[f"k{i}"])
+        # 每個令牌桶一小時補充 10 個令牌，6 分鐘後即補滿
+        clock.advance(360)
+    assert len(rate._keyword_buckets) <= 2 * limiter.MIN_SWEEP_SIZE
+
+
+def test_active_buckets_survive_sweep():
+    clock = FakeClock()
+    rate = limiter.RateLimiter(max_per_hour=10**6, per_keyword_per_hour=1, clock=clock)
+    assert rate.acquire(keywords=["hot"]) == {"hot"}
+    for i in range(limiter.MIN_SWEEP_SIZE * 4):
+        rate.acquire(keywords=[f"k{i}"])
+    # 仍在冷卻中的令牌桶不會被清理，已用掉的額度不會因此重置
+    assert rate.acquire(keywords=["hot"]) is None
+
+
+def test_reconfigure_keeps_used_quota():
+    clock = FakeClock()
+    rate = limiter.RateLimiter(max_per_hour=2, clock=clock)
+    assert rate.acquire() is not None and rate.acquire() is not None
+    rate.reconfigure(max_per_hour=3)
+    assert rate.sent_last_hour == 2
+    clock.advance(1200)  # 新的補充速率下 20 分鐘補充一個令牌
+    assert rate.acquire() is not None
+    assert rate.acquire() is None
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("astrbot")
+
+from _plugin import load  # noqa: E402
+
+metrics = load("metrics")
+
+
+def sample_lines(text):
+    return [line for line in text.splitlines() if not line.startswith("#")]
+
+
+def test_special_values_use_prometheus_spelling():
+    registry = metrics.MetricsRegistry()
+    for name, value in (("nan", float("nan")), ("pos", float("inf"))):
+        registry.gauge(name, "test", lambda value=value: value)
+    registry.gauge("neg", "test", lambda: float("-inf"))
+    lines = sample_lines(registry.render_prometheus())
+    prefix = metrics.MetricsRegistry.PREFIX
+    assert f"{prefix}nan NaN" in lines
+    assert f"{prefix}pos +Inf" in lines
+    assert f"{prefix}neg -Inf" in lines
+
+
+def test_large_counters_keep_full_precision():
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("reports_total", "test", ("platform",))
+    counter.inc("qq", amount=1234567)
+    counter.inc("tg", amount=0.25)
+    lines = sample_lines(registry.render_prometheus())
+    prefix = metrics.MetricsRegistry.PREFIX
+    assert f'{prefix}reports_total{{platform="qq"}} 1234567' in lines
+    assert f'{prefix}reports_total{{platform="tg"}} 0.25' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.MetricsRegistry()
+    histogram = registry.histogram("latency", "test", [0.5, 1])
+    for value in (0.1, 0.7, 3):
+        histogram.observe(value)
+    lines = sample_lines(registry.render_prometheus())
+    prefix = metrics.MetricsRegistry.PREFIX
+    assert f'{prefix}latency_bucket{{le="0.5"}} 1' in lines
+    assert f'{prefix}latency_bucket{{le="1"}} 2' in lines
+    assert f'{prefix}latency_bucket{{le="+Inf"}} 3' in lines
+    assert f"{prefix}latency_count 3" in lines
@@ -0,0 +1,59 @@
+from _plugin import load
+
+reload = load("reload")
+
+
+def test_diff_config_reports_changed_fields_only():
+    old = {"rate_limit_batching": {"max_emails_per_hour": 10, "enable_batching": True}}
+    new = {"rate_limit_batching": {"max_emails_per_hour": 20, "enable_batching": True}}
+    assert reload.diff_config(old, new) == {
+        "rate_limit_batching": {"max_emails_per_hour": (10, 20)}
+    }
+
+
+def test_diff_config_treats_missing_section_as_empty():
+    changes = reload.diff_config({}, {"general": {"enable_monitoring": True}})
+    assert changes == {"general": {"enable_monitoring": (None, True)}}
+
+
+def test_diff_config_non_mapping_section():
+    assert reload.diff_config({"x": 1}, {"x": 2}) == {"x": {"": (1, 2)}}
+
+
+def test_split_changes_separates_hot_and_restart_fields():
+    changes = {
+        "rate_limit_batching": {"batch_window_seconds": (60, 5)},
+        "smtp_settings": {"smtp_port": (465, 587)},
+        "history": {"retention_days": (30, 7)},
+        "x": {"": (1, 2)},
+    }
+    hot, restart = reload.split_changes(changes)
+    assert hot == [
+        "rate_limit_batching.batch_window_seconds",
+        "smtp_settings.smtp_port",
+    ]
+    assert restart == ["history.retention_days", "x"]
+
+
+def test_merge_applied_writes_back_only_applied_fields():
+    config = {"rate_limit_batching": {"max_emails_per_hour": 10}, "history": {}}
+    changes = {
+        "rate_limit_batching": {
+            "max_emails_per_hour": (10, 20),
+            "burst_size": (5, None),
+        },
+        "history": {"retention_days": (30, 7)},
+    }
+    config["rate_limit_batching"]["burst_size"] = 5
+    reload.merge_applied(
+        config,
+        changes,
+        ["rate_limit_batching.max_emails_per_hour", "rate_limit_batching.burst_size"],
+    )
+    assert config == {"rate_limit_batching": {"max_emails_per_hour": 20}, "history": {}}
+
+
+def test_commit_runs_steps_in_order():
+    calls = []
+    reload.commit([lambda: calls.append(1), lambda: calls.append(2)])
+    assert calls == [1, 2]
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("astrbot")
+
+from _plugin import load  # noqa: E402
+
+records = load("records")
+routing = load("routing")
+
+
+def make_record(platform="qq", group_id="N/A", keyword="KW", severity="error"):
+    return records.ExceptionRecord(
+        platform=platform,
+        sender="user",
+        sender_id="1",
+        group_id=group_id,
+        message="boom",
+        keyword=keyword,
+        timestamp=1000.0,
+        severity=severity,
+    )
+
+
+def test_parse_route_expands_severity_threshold():
+    conditions, recipients = routing.parse_route(
+        "platform=qq|tg; severity=warning+ => b@x, a@x"
+    )
+    assert conditions["platform"] == {"qq", "tg"}
+    assert conditions["severity"] == {"warning", "error", "critical"}
+    assert recipients == ("a@x", "b@x")
+
+
+@pytest.mark.parametrize(
+    "rule",
+    ["platform=qq", "nope=1 => a@x", "severity=loud => a@x", "platform=qq => "],
+)
+def test_parse_route_rejects_malformed_rules(rule):
+    assert routing.parse_route(rule) is None
+
+
+def test_unmatched_record_uses_default_route():
+    table = routing.RoutingTable(["platform=tg => tg@x"])
+    assert table.route(make_record()) == routing.DEFAULT_ROUTE
+    assert routing.RoutingTable.recipients((), ["d@x"]) == ["d@x"]
+
+
+def test_matching_rules_union_recipients():
+    table = routing.RoutingTable(
+        [
+            "platform=qq => qq@x",
+            "severity=critical => oncall@x",
+            "platform=qq; keyword=DB => dba@x, qq@x",
+            "* => all@x",
+        ]
+    )
+    assert table.route(make_record(keyword="DB", severity="critical")) == (
+        "all@x",
+        "dba@x",
+        "oncall@x",
+        "qq@x",
+    )
+    assert table.route(make_record(platform="tg")) == ("all@x",)
+
+
+def test_group_condition_ignores_private_messages():
+    table = routing.RoutingTable(["group_id=42 => g@x"])
+    assert table.route(make_record(group_id="42")) == ("g@x",)
+    assert table.route(make_record(group_id="N/A")) == ()
+
+
+def test_malformed_rules_are_skipped():
+    table = routing.RoutingTable(["platform=qq", "platform=qq => qq@x"])
+    assert len(table) == 1
@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("astrbot")
+
+from _plugin import load  # noqa: E402
+
+spool_module = load("spool")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def recover(path):
+    spool = spool_module.ReportSpool(path)
+    pending = await spool.open()
+    await spool.close()
+    return pending
+
+
+async def write_reports(path, count, acks=()):
+    spool = spool_module.ReportSpool(path, commit_interval=0)
+    await spool.open()
+    seqs = [spool.append({"keyword": "KW", "message": f"m{i}"}) for i in range(count)]
+    for ranges in acks:
+        spool.ack(ranges)
+    await spool.close()
+    return seqs
+
+
+def test_unacked_reports_are_recovered_in_order(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    assert run(write_reports(path, 5, acks=[[(1, 2)], [(4, 4)]])) == [1, 2, 3, 4, 5]
+
+    pending = run(recover(path))
+    assert [(r["spool_seq"], r["message"]) for r in pending] == [(3, "m2"), (5, "m4")]
+
+
+def test_ack_of_disjoint_ranges_leaves_gaps_pending(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    run(write_reports(path, 6, acks=[[(1, 1), (3, 4), (6, 6)]]))
+    pending = run(recover(path))
+    assert [r["spool_seq"] for r in pending] == [2, 5]
+
+
+def test_open_compacts_log_and_continues_sequence(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    run(write_reports(path, 4, acks=[[(1, 3)]]))
+
+    async def reopen():
+        spool = spool_module.ReportSpool(path, commit_interval=0)
+        pending = await spool.open()
+        # 重寫後只剩未確認的報告，新的序號接續最大序號
+        lines = path.read_text(encoding="utf-8").splitlines()
+        seq = spool.append({"message": "new"})
+        await spool.close()
+        return pending, lines, seq
+
+    pending, lines, seq = run(reopen())
+    assert [r["spool_seq"] for r in pending] == [4]
+    assert [json.loads(line)["seq"] for line in lines] == [4]
+    assert seq == 5
+
+
+def test_legacy_single_range_ack_is_understood(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps(entry)
+            for entry in (
+                {"op": "add", "seq": 1, "report": {"message": "a"}},
+                {"op": "add", "seq": 2, "report": {"message": "b"}},
+                {"op": "ack", "range": [1, 1]},
+            )
+        )
+        + '\n{"op": "ack", "ran',  # 程序中斷時不完整的最後一行
+        encoding="utf-8",
+    )
+    pending = run(recover(path))
+    assert [r["spool_seq"] for r in pending] == [2]
+
+
+def test_idle_log_is_truncated_once_everything_is_acked(tmp_path):
+    path = tmp_path / "spool.jsonl"
+
+    async def scenario():
+        spool = spool_module.ReportSpool(
+            path, commit_interval=0, compact_threshold_bytes=1
+        )
+        await spool.open()
+        seq = spool.append({"message": "x" * 100})
+        await asyncio.sleep(0.05)
+        spool.ack([(seq, seq)])
+        await asyncio.sleep(0.05)
+        await spool.close()
+
+    run(scenario())
+    assert path.stat().st_size == 0
+
+
+def test_large_log_is_compacted_to_live_reports(tmp_path):
+    path = tmp_path / "spool.jsonl"
+
+    async def scenario():
+        spool = spool_module.ReportSpool(
+            path, commit_interval=0, compact_threshold_bytes=1000
+        )
+        await spool.open()
+        seqs = [spool.append({"message": "x" * 100}) for _ in range(20)]
+        # 只有一筆永遠不會送出，日誌仍須壓縮
+        spool.ack([(seqs[1], seqs[-1])])
+        await asyncio.sleep(0.05)
+        lines = path.read_text(encoding="utf-8").splitlines()
+        await spool.close()
+        return seqs[0], spool.outstanding, lines
+
+    live, outstanding, lines = run(scenario())
+    assert outstanding == 1
+    assert [json.loads(line)["seq"] for line in lines] == [live]
+
+
+def test_dead_acks_move_reports_to_dead_letter_file(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    run(write_reports(path, 3, acks=[[(1, 1)]]))
+
+    async def fail_second():
+        spool = spool_module.ReportSpool(path, commit_interval=0)
+        await spool.open()
+        spool.ack([(2, 2)], dead=True)
+        await spool.close()
+
+    run(fail_second())
+    pending = run(recover(path))
+    assert [r["spool_seq"] for r in pending] == [3]
+    dead = [json.loads(line) for line in path.with_suffix(".dead.jsonl").open()]
+    assert [(entry["seq"], entry["report"]["message"]) for entry in dead] == [(2, "m1")]
@@ -0,0 +1,179 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from astrbot.api import logger
+
+from .metrics import MetricsRegistry
+from .records import ExceptionRecord
+
+if TYPE_CHECKING:
+    from astrbot.api.event import AstrMessageEvent
+
+# 取樣間隔的下限，確保取樣執行緒與計時協程的開銷有固定上限
+MIN_INTERVAL = 0.05
+# 擷取阻塞堆疊時保留的最多幀數（最靠近阻塞點的幀）
+MAX_STACK_FRAMES = 20
+
+LOOP_LAG_KEYWORD = "EventLoopLag"
+SLOW_PASS_KEYWORD = "SlowDecoratingPass"
+
+
+class LoopWatchdog:
+    """事件迴圈延遲監控。
+
+    計時協程每 ``interval`` 秒醒來一次，以 perf_counter 測量實際醒來時間與預期的差距
+    （即迴圈延遲）並記入直方圖；另一個取樣執行緒以相同間隔檢查計時協程的心跳，
+    迴圈停滯超過 ``threshold`` 時以 sys._current_frames() 擷取迴圈執行緒正在執行的堆疊。
+    迴圈恢復後，計時協程把延遲與阻塞堆疊作為一筆合成的異常報告交給 ``submit``。
+
+    兩者的 CPU 耗時都有累計，overhead 為其佔經過時間的比例。
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[ExceptionRecord], Any],
+        metrics: MetricsRegistry,
+        interval: float = 0.1,
+        threshold: float = 1.0,
+        capture_stack: bool = True,
+        slow_pass_threshold: float = 2.0,
+    ):
+        self.submit = submit
+        self.interval = max(MIN_INTERVAL, float(interval))
+        self.threshold = max(self.interval, float(threshold))
+        self.capture_stack = capture_stack
+        self.slow_pass_threshold = float(slow_pass_threshold)
+
+        self.lag_histogram = metrics.histogram(
+            "event_loop_lag_seconds", "事件迴圈的延遲（計時協程實際醒來與預期的差距）"
+        )
+        self.pass_histogram = metrics.histogram(
+            "decorating_pass_seconds", "一次 on_decorating_result 處理的總耗時"
+        )
+
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        # 計時協程最近一次醒來的時間；取樣執行緒只讀取，不寫入
+        self._beat = time.perf_counter()
+        # 取樣執行緒在停滯期間擷取的堆疊，以及它所屬的心跳
+        self._stall_stack: Optional[traceback.StackSummary] = None
+        self._stall_beat: Optional[float] = None
+        self._started = 0.0
+
+        # 統計資訊
+        self.stalls = 0
+        self.slow_passes = 0
+        self.max_lag = 0.0
+        self.tick_seconds = 0.0  # 計時協程在迴圈上的耗時
+        self.sampler_seconds = 0.0  # 取樣執行緒的 CPU 時間
+
+    @property
+    def overhead(self) -> float:
+        """監控本身的耗時佔經過時間的比例"""
+        elapsed = time.perf_counter() - self._started
+        if elapsed <= 0:
+            return 0.0
+        return (self.tick_seconds + self.sampler_seconds) / elapsed
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """在 loop 上啟動計時協程，並啟動取樣執行緒；必須在 loop 的執行緒中呼叫"""
+        self._loop_thread_id = threading.get_ident()
+        self._started = self._beat = time.perf_counter()
+        self._task = loop.create_task(self._tick_loop())
+        if self.capture_stack:
+            self._thread = threading.Thread(
+                target=self._sample_loop, name="error-monitor-watchdog", daemon=True
+            )
+            self._thread.start()
+
+    async def _tick_loop(self):
+        try:
+            expected = time.perf_counter() + self.interval
+            while True:
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                lag = max(0.0, now - expected)
+                previous_beat, self._beat = self._beat, now
+                self.lag_histogram.observe(lag)
+                if lag >= self.threshold:
+                    stack = (
+                        self._stall_stack if self._stall_beat == previous_beat else None
+                    )
+                    self._stall_stack = self._stall_beat = None
+                    self._report_stall(lag, stack)
+                expected = now + self.interval
+                self.tick_seconds += time.perf_counter() - now
+        except asyncio.CancelledError:
+            pass
+
+    def _sample_loop(self):
+        """(取樣執行緒) 心跳停止超過門檻時擷取迴圈執行緒的堆疊，每次停滯只擷取一次"""
+        while not self._stop.wait(self.interval):
+            started = time.thread_time()
+            beat = self._beat
+            if (
+                time.perf_counter() - beat >= self.threshold
+                and self._stall_beat != beat
+            ):
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._stall_stack = traceback.extract_stack(
+                        frame, limit=MAX_STACK_FRAMES
+                    )
+                    self._stall_beat = beat
+                del frame
+            self.sampler_seconds += time.thread_time() - started
+
+    def _report_stall(self, lag: float, stack: Optional[traceback.StackSummary]):
+        self.stalls += 1
+        self.max_lag = max(self.max_lag, lag)
+        where = ""
+        if stack:
+            frame = stack[-1]
+            where = f"（阻塞於 {frame.filename}:{frame.lineno} {frame.name}）"
+        logger.warning(f"[ErrorMonitor] 事件迴圈阻塞了 {lag:.2f} 秒{where}。")
+        record = ExceptionRecord(
+            platform="astrbot",
+            sender="watchdog",
+            sender_id="watchdog",
+            group_id="",
+            message=f"事件迴圈阻塞 {lag:.2f} 秒{where}",
+            keyword=LOOP_LAG_KEYWORD,
+            timestamp=time.time(),
+            type="loop_lag",
+            error=f"EventLoopStall: 事件迴圈 {lag:.2f} 秒未能執行其他任務",
+            stack=stack,
+            extra={"lag_seconds": round(lag, 3), "threshold_seconds": self.threshold},
+        )
+        self.submit(record)
+
+    def observe_pass(self, event: "AstrMessageEvent", elapsed: float):
+        """記錄一次 on_decorating_result 處理的耗時，超過門檻時產生一筆報告"""
+        self.pass_histogram.observe(elapsed)
+        if not self.slow_pass_threshold or elapsed < self.slow_pass_threshold:
+            return
+        self.slow_passes += 1
+        record = ExceptionRecord.from_event(
+            event,
+            SLOW_PASS_KEYWORD,
+            severity="warning",
+            extra={"elapsed_seconds": round(elapsed, 3)},
+        )
+        record.type = "slow_pass"
+        record.error = f"SlowDecoratingPass: 結果裝飾階段耗時 {elapsed * 1000:.0f} ms"
+        self.submit(record)
+
+    async def stop(self):
+        self._stop.set()
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._thread:
+            await asyncio.to_thread(self._thread.join, self.interval * 2)
+            self._thread = None